@@ -17,7 +17,7 @@
 
       pythonTools = with pythonPkgs;
         (pkgs.python3.withPackages
-          (python-pkgs: with python-pkgs; [ argcomplete ]));
+          (python-pkgs: with python-pkgs; [ argcomplete numpy ]));
 
       nativeBuildAndShellInputs = with pkgs; [
         arduino-cli
@@ -0,0 +1,70 @@
+""" Run the benchmarks: python -m bench [-k PATTERN] [--threshold 0.25]
+
+    Results are appended to .bench/results.jsonl. The exit status is 1 if
+    any case is slower than its baseline by more than the threshold.
+"""
+
+import argparse
+import fnmatch
+import sys
+import tempfile
+
+from mk_build import Path
+
+from . import cases, harness
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog='bench')
+    parser.add_argument('-k', '--filter', default='*',
+                        help='run the cases matching this pattern')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown against the baseline')
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='seconds the stand-in arduino-cli compiles')
+    parser.add_argument('--results', default='.bench/results.jsonl')
+    parser.add_argument('--no-save', action='store_true',
+                        help='do not add this run to the results')
+
+    args = parser.parse_args(argv)
+
+    results_path = Path(args.results)
+
+    # Only runs with the same parameters are compared.
+    parameters = {'latency': args.latency}
+
+    base = harness.baseline(harness.load(results_path), parameters)
+
+    selected = [it for it in harness.cases
+                if fnmatch.fnmatch(it.name, args.filter)]
+
+    if not cases.build_available:
+        print('build cases skipped: gup or jq is not installed',
+              file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix='scon-bench-') as work:
+        cases.init(Path(work), args.latency)
+
+        results = []
+
+        for it in selected:
+            print(f'{it.name} ...', file=sys.stderr)
+            results.append(harness.measure(it))
+
+    print(harness.table(results, base))
+
+    regressed = harness.regressions(results, base, args.threshold)
+
+    if not args.no_save:
+        harness.save(results_path, results, parameters)
+
+    if regressed:
+        print(f'regressed by more than {args.threshold:.0%}:'
+              f' {", ".join(regressed)}', file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
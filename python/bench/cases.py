@@ -0,0 +1,189 @@
+""" The benchmark cases.
+
+    Everything runs below a scratch directory given to init(). The build
+    cases run scon itself, with a stand-in arduino-cli whose compile takes
+    SCON_BENCH_LATENCY seconds, on a small project written there. They are
+    skipped when gup or jq, which the build needs, are not installed.
+"""
+
+import itertools
+import os
+import shutil
+import subprocess
+import sys
+from typing import Any, Optional
+
+from mk_build import Path
+
+from planer_build import outputs, scripts
+from planer_build.configure import Config
+
+from .harness import case
+
+_bench_dir = Path(__file__).parent
+_config = Path(_bench_dir.parent, 'test', 'data', 'config.toml')
+_stub = Path(_bench_dir, 'stub', 'arduino-cli')
+
+# Size of the synthetic build tree removed by scon clean.
+clean_dirs = 50
+clean_files = 100
+
+_work = Path('.')
+_counter = itertools.count()
+
+
+def init(work: Path, latency: float) -> None:
+    global _work
+
+    _work = work
+
+    os.environ['XDG_CACHE_HOME'] = str(Path(work, 'cache'))
+    os.environ['SCON_BENCH_LATENCY'] = str(latency)
+
+
+def _fresh(name: str) -> Path:
+    """ Return a new, empty directory. """
+
+    result = Path(_work, f'{name}-{next(_counter)}')
+    result.mkdir(parents=True)
+
+    return result
+
+
+def _scon(args: list[str], env: Optional[dict[str, str]] = None) -> None:
+    subprocess.run([sys.executable, '-m', 'planer_build.planer_cli'] + args,
+                   env=os.environ | (env or {}), stdout=subprocess.DEVNULL,
+                   check=True)
+
+
+# Wall time allowed for scon to answer --help or a completion request,
+# including interpreter startup.
+cli_budget = 0.1
+
+
+@case('cli.help', repeat=10, budget=cli_budget)
+def cli_help(_: Any) -> None:
+    _scon(['--help'])
+
+
+@case('cli.complete', repeat=10, setup=lambda: _fresh('complete'),
+      budget=cli_budget)
+def cli_complete(directory: Path) -> None:
+    line = 'scon bu'
+
+    _scon([], {
+        '_ARGCOMPLETE': '1',
+        '_ARGCOMPLETE_STDOUT_FILENAME': str(Path(directory, 'completions')),
+        'COMP_LINE': line,
+        'COMP_POINT': str(len(line))
+    })
+
+
+def _cold_cache() -> None:
+    os.environ['XDG_CACHE_HOME'] = str(_fresh('cache'))
+
+
+@case('config.from_file.cold', setup=_cold_cache)
+def config_cold(_: Any) -> None:
+    Config.from_file(str(_config))
+
+
+@case('config.from_file.cached', repeat=50)
+def config_cached(_: Any) -> None:
+    Config.from_file(str(_config))
+
+
+@case('config.write_config_h', setup=lambda: _fresh('config-h'))
+def write_config_h(directory: Path) -> None:
+    Config.from_file(str(_config)).write_config_h(f'{directory}/config.h')
+
+
+@case('configure.scripts.install', setup=lambda: _fresh('scripts'))
+def scripts_install(directory: Path) -> None:
+    scripts.sync(directory)
+
+
+def _installed() -> Path:
+    result = _fresh('scripts')
+    scripts.sync(result)
+
+    return result
+
+
+@case('configure.scripts.unchanged', setup=_installed)
+def scripts_unchanged(directory: Path) -> None:
+    scripts.sync(directory)
+
+
+def _build_tree() -> Path:
+    """ Write a build tree of clean_dirs sketch build paths with
+        clean_files files each and record them as outputs. """
+
+    top = _fresh('clean')
+
+    for index in range(clean_dirs):
+        target = f'sketch{index}/sketch{index}.ino.elf'
+        build_path = Path(top, f'sketch{index}', '.arduino')
+
+        for sub in range(clean_files):
+            path = Path(build_path, f'{sub % 10}', f'{sub}.o')
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'\0' * 64)
+
+        elf = Path(top, target)
+        elf.write_bytes(b'\0' * 64)
+
+        outputs.record(top, target, [elf], [build_path])
+
+    return top
+
+
+@case('clean', repeat=5, setup=_build_tree)
+def clean(top: Path) -> None:
+    outputs.clean(top)
+
+
+def _can_build() -> bool:
+    return shutil.which('gup') is not None and shutil.which('jq') is not None
+
+
+def _project() -> dict[str, Any]:
+    """ Write a project with the sketches the all target builds and
+        configure a build directory for it. """
+
+    source = _fresh('source')
+
+    for it in ('Planer/Planer.ino', 'test/motor/motor.ino'):
+        Path(source, it).parent.mkdir(parents=True)
+        Path(source, it).write_text('void setup() {}\nvoid loop() {}\n')
+
+    Path(source, 'libraries').mkdir()
+    shutil.copy(_config, Path(source, 'config.toml.default'))
+
+    build = _fresh('build')
+
+    env = {'ARDUINO_CLI': str(_stub), 'ARDUINO_IDE': str(_stub)}
+
+    _scon(['--source', str(source), '--build', str(build), 'configure'],
+          env)
+
+    return {'source': source, 'build': build, 'env': env}
+
+
+def _build(project: dict[str, Any]) -> None:
+    _scon(['--source', str(project['source']), '--build',
+           str(project['build']), 'build'], project['env'])
+
+
+def _built() -> dict[str, Any]:
+    result = _project()
+    _build(result)
+
+    return result
+
+
+build_available = _can_build()
+
+if build_available:
+    case('build.full', repeat=3, setup=_project)(_build)
+    case('build.noop', repeat=5, setup=_built)(_build)
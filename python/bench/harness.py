@@ -0,0 +1,154 @@
+""" Running benchmark cases and comparing them with earlier runs.
+
+    Each case is timed several times after an untimed warm-up run and its
+    median is kept. Results are appended to a JSON lines file, one line per
+    run of the suite, with the parameters it ran with. A case regresses
+    when its median exceeds the best median of the recent runs with the
+    same parameters on the same machine by more than the
+    threshold, or when its fastest run exceeds the case's own budget.
+"""
+
+from dataclasses import dataclass, field
+import json
+import platform
+import statistics
+import time
+from typing import Any, Callable, Optional
+
+from mk_build import Path
+
+# Runs of the suite whose results form the baseline.
+baseline_runs = 5
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[Any], None]
+    setup: Optional[Callable[[], Any]] = None
+    repeat: int = 10
+    # Seconds that the fastest run may take at most.
+    budget: Optional[float] = None
+
+
+@dataclass
+class Result:
+    name: str
+    median: float
+    minimum: float
+    times: list[float] = field(default_factory=list)
+    budget: Optional[float] = None
+
+
+cases: list[Case] = []
+
+
+def case(
+    name: str,
+    repeat: int = 10,
+    setup: Optional[Callable[[], Any]] = None,
+    budget: Optional[float] = None
+) -> Callable[[Callable[[Any], None]], Callable[[Any], None]]:
+    """ Register a benchmark. If setup is given, it is called before every
+        run, untimed, and its result passed to the benchmark. """
+
+    def register(run: Callable[[Any], None]) -> Callable[[Any], None]:
+        cases.append(Case(name, run, setup, repeat, budget))
+        return run
+
+    return register
+
+
+def measure(it: Case) -> Result:
+    times = []
+
+    for index in range(it.repeat + 1):
+        state = it.setup() if it.setup is not None else None
+
+        start = time.perf_counter()
+        it.run(state)
+        elapsed = time.perf_counter() - start
+
+        # The first run warms caches and imports.
+        if index > 0:
+            times.append(elapsed)
+
+    return Result(it.name, statistics.median(times), min(times), times,
+                  it.budget)
+
+
+def machine() -> str:
+    return '-'.join((platform.node(), platform.machine(),
+                     platform.python_version()))
+
+
+def load(path: Path) -> list[dict[str, Any]]:
+    try:
+        with open(path, 'r') as fi:
+            return [json.loads(it) for it in fi if it.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def baseline(
+    history: list[dict[str, Any]],
+    parameters: dict[str, Any]
+) -> dict[str, float]:
+    """ Return the best median of each case in the recent runs on this
+        machine with the same parameters, such as the latency of the
+        stand-in arduino-cli, which the times depend on. """
+
+    runs = [it for it in history if it.get('machine') == machine()
+            and it.get('parameters') == parameters]
+    result: dict[str, float] = {}
+
+    for run in runs[-baseline_runs:]:
+        for (name, median) in run['results'].items():
+            result[name] = min(median, result.get(name, median))
+
+    return result
+
+
+def save(
+    path: Path,
+    results: list[Result],
+    parameters: dict[str, Any]
+) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'a') as fo:
+        fo.write(json.dumps({
+            'time': time.time(),
+            'machine': machine(),
+            'parameters': parameters,
+            'results': {it.name: it.median for it in results}
+        }) + '\n')
+
+
+def regressions(
+    results: list[Result],
+    base: dict[str, float],
+    threshold: float
+) -> list[str]:
+    return [it.name for it in results
+            if (it.name in base
+                and it.median > base[it.name] * (1 + threshold))
+            or (it.budget is not None and it.minimum > it.budget)]
+
+
+def table(results: list[Result], base: dict[str, float]) -> str:
+    lines = [f'{"case":<28} {"median ms":>10} {"min ms":>10}'
+             f' {"baseline ms":>12} {"change":>8}']
+
+    for it in results:
+        if it.name in base:
+            reference = f'{base[it.name] * 1000:>12.2f}'
+            change = f'{(it.median / base[it.name] - 1) * 100:>+7.1f}%'
+        else:
+            reference = f'{"-":>12}'
+            change = f'{"-":>8}'
+
+        lines.append(f'{it.name:<28} {it.median * 1000:>10.2f}'
+                     f' {it.minimum * 1000:>10.2f} {reference} {change}')
+
+    return '\n'.join(lines)
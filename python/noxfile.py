@@ -3,7 +3,7 @@ import nox
 
 @nox.session()
 def lint(session):
-    session.run('flake8', 'planer_build', 'test', external=True)
+    session.run('flake8', 'planer_build', 'test', 'bench', external=True)
 
 
 @nox.session()
@@ -15,3 +15,8 @@ def typing(session):
 def tests(session):
     session.run('coverage', 'run', '-m', 'pytest', external=True)
     session.run('coverage', 'report', external=True)
+
+
+@nox.session()
+def bench(session):
+    session.run('python', '-m', 'bench', *session.posargs, external=True)
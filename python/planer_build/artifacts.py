@@ -0,0 +1,185 @@
+""" Content-addressed store of compiled firmware.
+
+    The key of a build is a hash of the contents of everything that goes
+    into it: sketch sources, libraries, the generated config headers, the
+    FQBN, core version and compile flags. A build whose key is in the store
+    is restored from it instead of being compiled. After a compile, its
+    artifacts are added under its key.
+
+    The store is a local directory or an HTTP server that answers GET and
+    PUT of <url>/<key>.tar, so CI runners can share one. Store failures
+    are logged and treated as misses; they never fail a build.
+"""
+
+import hashlib
+import io
+import json
+import os
+from os import makedirs
+from os.path import expanduser
+import tarfile
+import tempfile
+from typing import Any, Optional, Protocol
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from mk_build import log, Path, PathInput
+
+from .deps import digest
+from .util import file_mode
+
+# Overrides the store configured with [artifacts] store, e.g. in CI.
+store_variable = 'SCON_ARTIFACTS'
+
+timeout = 10.0
+
+
+class Store(Protocol):
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    def put(self, key: str, data: bytes) -> None:
+        ...
+
+
+class LocalStore:
+    """ A directory of artifacts, fanned out by the first byte of the
+        key. """
+
+    def __init__(self, path: PathInput) -> None:
+        self.path = Path(path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), 'rb') as fi:
+                return fi.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        dest = self._path(key)
+
+        try:
+            makedirs(dest.parent, exist_ok=True)
+
+            (fd, tmp) = tempfile.mkstemp(dir=dest.parent, prefix='.tmp')
+            os.fchmod(fd, file_mode())
+
+            with os.fdopen(fd, 'wb') as fo:
+                fo.write(data)
+
+            os.replace(tmp, dest)
+        except OSError as e:
+            log.warning(f'artifact store {self.path}: {e}')
+
+    def _path(self, key: str) -> Path:
+        return Path(self.path, key[:2], f'{key}.tar')
+
+
+class HttpStore:
+    """ An HTTP server storing artifacts with GET and PUT. """
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip('/')
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with urlopen(self._url(key), timeout=timeout) as response:
+                data: bytes = response.read()
+
+                return data
+        except HTTPError as e:
+            if e.code != 404:
+                log.warning(f'artifact store {self.url}: {e}')
+        except (URLError, OSError) as e:
+            log.warning(f'artifact store {self.url}: {e}')
+
+        return None
+
+    def put(self, key: str, data: bytes) -> None:
+        request = Request(self._url(key), data=data, method='PUT',
+                          headers={'Content-Type': 'application/x-tar'})
+
+        try:
+            with urlopen(request, timeout=timeout):
+                pass
+        except (URLError, OSError) as e:
+            log.warning(f'artifact store {self.url}: {e}')
+
+    def _url(self, key: str) -> str:
+        return f'{self.url}/{key}.tar'
+
+
+def open_store(spec: Optional[str]) -> Optional[Store]:
+    """ Return the store named by spec: an http(s) URL or a directory. """
+
+    if not spec:
+        return None
+
+    if spec.startswith(('http://', 'https://')):
+        return HttpStore(spec)
+
+    return LocalStore(expanduser(spec))
+
+
+def key(inputs: dict[str, Path], parameters: dict[str, Any]) -> str:
+    """ Hash the contents of the input files, keyed by names that are the
+        same on every machine, and the other build parameters. """
+
+    result = hashlib.sha256()
+
+    for name in sorted(inputs):
+        result.update(f'{name}\0{digest(inputs[name])}\0'.encode())
+
+    result.update(json.dumps(parameters, sort_keys=True).encode())
+
+    return result.hexdigest()
+
+
+def pack(files: list[Path]) -> bytes:
+    """ Archive artifacts by their file names. """
+
+    buffer = io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for it in sorted(files, key=lambda x: x.name):
+            tar.add(it, arcname=it.name, recursive=False)
+
+    return buffer.getvalue()
+
+
+def unpack(data: bytes, output: PathInput) -> Optional[list[Path]]:
+    """ Restore archived artifacts into output. Returns the restored files,
+        or None if the archive is unusable. """
+
+    try:
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r') as tar:
+            members = tar.getmembers()
+
+            # Only plain files directly in output are restored.
+
+            for it in members:
+                if (not it.isfile() or it.name != Path(it.name).name
+                        or it.name.startswith('.')):
+                    log.warning(f'artifact: unexpected member {it.name}')
+                    return None
+
+            result = []
+
+            for it in members:
+                fi = tar.extractfile(it)
+                assert fi is not None
+
+                dest = Path(output, it.name)
+                tmp = Path(output, f'.{it.name}.tmp')
+
+                with open(tmp, 'wb') as fo:
+                    fo.write(fi.read())
+
+                os.replace(tmp, dest)
+                result.append(dest)
+
+            return result
+    except tarfile.TarError as e:
+        log.warning(f'artifact: {e}')
+        return None
@@ -0,0 +1,82 @@
+""" Building the sketches for several boards at once.
+
+    Each board configured with [[arduino.boards]] is built into its own
+    directory below the top build directory, named after the board, by a
+    gup invocation of its own. The builds run concurrently. Boards share
+    the build cache entries that match their FQBN and core.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import time
+from typing import Callable, Optional
+
+from mk_build import CompletedProcess, Path, PathInput
+
+from .configure import Config
+
+# Sketches built by the all target, relative to the top build directory.
+sketch_targets = ['Planer/Planer.ino.elf', 'test/motor/motor.ino.elf']
+
+
+@dataclass
+class Result:
+    board: str
+    fqbn: str
+    targets: list[str]
+    returncode: int
+    seconds: float
+
+
+def split(target: PathInput, config: Config) -> tuple[Optional[str], Path]:
+    """ Split a target path relative to the top build directory into the
+        board it is built for, if any, and the sketch target. """
+
+    parts = Path(target).parts
+
+    if len(parts) > 1 and parts[0] in config.boards:
+        return (parts[0], Path(*parts[1:]))
+
+    return (None, Path(target))
+
+
+def build(
+    config: Config,
+    boards: list[str],
+    targets: list[str],
+    jobs: int,
+    run: Callable[[list[str], int, str], CompletedProcess[bytes]]
+) -> list[Result]:
+    """ Build the targets for each board concurrently. run is called with
+        the board's targets, its share of the jobs and the board name. """
+
+    if not targets or targets == ['all']:
+        targets = sketch_targets
+
+    board_jobs = max(1, jobs // len(boards))
+
+    def build_board(board: str) -> Result:
+        arduino = config.boards[board]
+        board_targets = [f'{board}/{it}' for it in targets]
+
+        start = time.monotonic()
+        result = run(board_targets, board_jobs, board)
+
+        return Result(board, f'{arduino.core}:{arduino.board}',
+                      board_targets, result.returncode,
+                      time.monotonic() - start)
+
+    with ThreadPoolExecutor(len(boards)) as executor:
+        return list(executor.map(build_board, boards))
+
+
+def table(results: list[Result]) -> str:
+    lines = [f'{"board":<16} {"fqbn":<36} {"result":<8} {"seconds":>8}']
+
+    for it in results:
+        status = 'ok' if it.returncode == 0 else 'FAILED'
+
+        lines.append(f'{it.board:<16} {it.fqbn:<36} {status:<8}'
+                     f' {it.seconds:>8.1f}')
+
+    return '\n'.join(lines)
@@ -0,0 +1,236 @@
+""" Build cache shared by all sketches and build directories.
+
+    arduino-cli stores the compiled core in the directory passed with
+    --build-cache-path and reuses it for later compiles with the same core
+    and options. scon gives every combination of FQBN, core version and
+    compile flags its own entry in a per-user cache directory, so sketches
+    in different build directories share compiled cores while incompatible
+    builds never see each other's objects.
+
+    Lookups append to an event log, which maintain() folds into counters
+    after a build. The cache grows by an entry on a miss, so the entries
+    are only walked to prune them every prune_interval misses.
+"""
+
+from dataclasses import dataclass
+import hashlib
+import json
+import os
+from os import makedirs, walk
+from os.path import getsize
+import shutil
+import time
+from typing import Any, Optional
+
+from mk_build import log, Path, PathInput
+
+from .util import json_load, json_write, user_cache_dir
+
+# Misses between prunes.
+prune_interval = 8
+
+_events_name = 'events.log'
+_counts_name = 'counts.json'
+_used_name = '.last_used'
+
+
+def default_path() -> Path:
+    return Path(user_cache_dir(), 'build-cache')
+
+
+@dataclass
+class Entry:
+    key: str
+    path: Path
+    size: int
+    last_used: float
+
+
+class BuildCache:
+    """ A directory of cache entries with least recently used eviction. """
+
+    def __init__(
+        self,
+        path: Optional[PathInput] = None,
+        max_size_mb: int = 2048
+    ) -> None:
+        self.path = Path(path) if path is not None else default_path()
+        self.max_size = max_size_mb * 1024 * 1024
+
+    def entry(self, fqbn: str, version: str, flags: list[str]) -> Path:
+        """ Return the cache directory for builds with the given board,
+            core version and flags, recording whether it already held a
+            build. """
+
+        key = _key(fqbn, version, flags)
+        result = Path(self.path, key)
+
+        hit = result.is_dir() and any(
+            it.name != _used_name for it in result.iterdir())
+
+        makedirs(result, exist_ok=True)
+        Path(result, _used_name).touch()
+
+        self._record('hit' if hit else 'miss')
+
+        log.debug(f'build cache {"hit" if hit else "miss"} {result}')
+
+        return result
+
+    def entries(self) -> list[Entry]:
+        result: list[Entry] = []
+
+        if not self.path.is_dir():
+            return result
+
+        for it in self.path.iterdir():
+            if not it.is_dir():
+                continue
+
+            try:
+                last_used = Path(it, _used_name).stat().st_mtime
+            except FileNotFoundError:
+                last_used = it.stat().st_mtime
+
+            result.append(Entry(it.name, it, _tree_size(it), last_used))
+
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        counts = self._counts()
+        (hits, misses) = _count_events(Path(self.path, _events_name))
+
+        hits += counts['hits']
+        misses += counts['misses']
+
+        entries = self.entries()
+        lookups = hits + misses
+
+        return {
+            'path': str(self.path),
+            'entries': len(entries),
+            'size': sum(it.size for it in entries),
+            'max_size': self.max_size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0
+        }
+
+    def prune(self, max_size: Optional[int] = None) -> list[Entry]:
+        """ Remove the least recently used entries until the cache fits in
+            max_size bytes. Returns the removed entries. """
+
+        if max_size is None:
+            max_size = self.max_size
+
+        entries = sorted(self.entries(), key=lambda x: x.last_used)
+        size = sum(it.size for it in entries)
+
+        removed = []
+
+        for it in entries:
+            if size <= max_size:
+                break
+
+            shutil.rmtree(it.path, ignore_errors=True)
+            size -= it.size
+            removed.append(it)
+
+            log.info(f'build cache: evicted {it.key}')
+
+        if self.path.is_dir():
+            json_write(Path(self.path, _counts_name),
+                       self._counts() | {'unpruned': 0})
+
+        return removed
+
+    def compact(self) -> dict[str, int]:
+        """ Fold the event log into the counters and return them. """
+
+        events = Path(self.path, _events_name)
+        folding = Path(self.path, f'{_events_name}.{os.getpid()}')
+
+        # Lookups of concurrent builds append to a new log meanwhile.
+
+        try:
+            events.replace(folding)
+        except FileNotFoundError:
+            return self._counts()
+
+        (hits, misses) = _count_events(folding)
+
+        counts = self._counts()
+        counts['hits'] += hits
+        counts['misses'] += misses
+        counts['unpruned'] += misses
+
+        json_write(Path(self.path, _counts_name), counts)
+        folding.unlink()
+
+        return counts
+
+    def maintain(self) -> list[Entry]:
+        """ Compact the event log, and prune once prune_interval misses
+            added entries since the last prune. Returns the removed
+            entries. """
+
+        if self.compact()['unpruned'] < prune_interval:
+            return []
+
+        return self.prune()
+
+    def _counts(self) -> dict[str, int]:
+        result = {'hits': 0, 'misses': 0, 'unpruned': 0}
+        data = json_load(Path(self.path, _counts_name))
+
+        if isinstance(data, dict):
+            result |= {name: data[name] for name in result
+                       if isinstance(data.get(name), int)}
+
+        return result
+
+    def _record(self, event: str) -> None:
+        # Builds run concurrently, so each event is a single appended line
+        # instead of a read-modify-write of a counter file.
+
+        makedirs(self.path, exist_ok=True)
+
+        with open(Path(self.path, _events_name), 'a') as fi:
+            fi.write(f'{event} {int(time.time())}\n')
+
+
+def _count_events(path: Path) -> tuple[int, int]:
+    """ Return the hits and misses in an event log. """
+
+    hits = misses = 0
+
+    try:
+        with open(path, 'r') as fi:
+            for line in fi:
+                if line.startswith('hit'):
+                    hits += 1
+                elif line.startswith('miss'):
+                    misses += 1
+    except FileNotFoundError:
+        pass
+
+    return (hits, misses)
+
+
+def _key(fqbn: str, version: str, flags: list[str]) -> str:
+    data = json.dumps([fqbn, version, flags])
+
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def _tree_size(path: Path) -> int:
+    result = 0
+
+    for (dir_path, _, file_names) in walk(path):
+        for name in file_names:
+            try:
+                result += getsize(Path(dir_path, name))
+            except OSError:
+                pass
+
+    return result
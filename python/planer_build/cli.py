@@ -0,0 +1,839 @@
+""" Implementation of the scon subcommands. """
+
+import argparse
+from contextlib import ExitStack
+import copy
+from dataclasses import dataclass, field
+import json
+import os
+import shutil
+from os import makedirs, walk
+from os.path import isdir, isfile
+from typing import Any, BinaryIO, Optional, Tuple
+
+from mk_build.config import Config as BuildConfig
+from mk_build import build_dir, environ, eprint, gup, Path
+
+from mk_build import CompletedProcess, log
+from mk_build.validate import ensure_type
+
+import planer_build.configure as configure_
+import planer_build.environment as environment_
+from planer_build.configure import Config as PlanerConfig
+from . import boards as boards_
+from .cache import BuildCache
+from . import diagnostics as diagnostics_
+from . import flash as flash_
+from . import monitor as monitor_
+from .error import FatalError
+from . import outputs as outputs_
+from . import profile as profile_
+from . import scripts
+from .message import (
+    board_not_configured, build_dir_bad_location, build_dir_not_found,
+    clean_nothing_recorded, serve_listening, serve_watch, size_not_built,
+    upload_failed, upload_no_ports, variants_not_configured, watch_failed,
+    watch_upload, watch_waiting
+)
+from .schedule import auto_jobs, History
+from . import serve as serve_
+from . import size as size_
+from . import stack as stack_
+from .tools import arduino_cli
+from .tools.arduino_daemon import Daemon, daemon_variable, DaemonError
+from .util import state_dir, state_dir_name
+from . import variants as variants_
+from . import watch as watch_
+
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _detect_top_source_dir() -> str:
+    source = os.getcwd()
+    log.info(f'Auto-detected source directory: {source}')
+
+    return source
+
+
+@dataclass
+class CLI:
+    config: PlanerConfig = field(default_factory=PlanerConfig)
+    config_file: BuildConfig = field(default_factory=BuildConfig)
+    environment: dict[str, str] = field(default_factory=dict)
+    wsl: bool = False
+
+    def init(self, load: bool, **kwargs: Any) -> None:
+        self._init_log(kwargs['log_level'])
+
+        log.debug(f'parsed args {kwargs}')
+
+        # The top build directory will have been set when we imported
+        # mk_build.config above. Override it if provided.
+
+        if 'build' in kwargs and kwargs['build'] is not None:
+            build = str(Path(kwargs['build']).absolute())
+            os.environ['top_build_dir'] = build
+        else:
+            build = ensure_type(environ('top_build_dir'), str)
+
+        path = f'{build}/config.toml'
+
+        if load and isfile(path):
+            self.config = PlanerConfig.from_file(path)
+            self.config_file = BuildConfig.from_file(path)
+
+        # If source argument is present, override config file top_source_dir.
+
+        # If source argument and config file are absent, auto-detect
+        # top_source_dir.
+
+        if kwargs['source'] is None:
+            source = _detect_top_source_dir()
+
+            override_source = self.config_file.top_source_dir is None
+        else:
+            source = kwargs['source']
+            override_source = True
+
+        if override_source:
+            self.config_file.top_source_dir = Path(source)
+
+        # Override config file top_build_dir with build argument or from
+        # environment.
+
+        self.config_file.top_build_dir = Path(build)
+
+        if kwargs['verbose'] != 0:
+            self.config_file.verbose = kwargs['verbose']
+
+        self._validate_dirs()
+
+        self.wsl = bool(kwargs.get('wsl'))
+
+    def configure(self, args: argparse.Namespace) -> None:
+        top_build_dir = self.config_file.top_build_dir
+        top_build_dir = ensure_type(top_build_dir, Path)
+
+        top_source_dir = self.config_file.top_source_dir
+        top_source_dir = ensure_type(top_source_dir, Path)
+
+        if args.config is None:
+            scon_config = f'{top_source_dir}/config.toml.default'
+        else:
+            scon_config = f'{args.config}'
+
+        cfg = PlanerConfig.from_file(scon_config)
+
+        def _planer() -> None:
+            """ Write project configuration to config.toml. """
+
+            if not isdir(top_build_dir):
+                eprint(str.format(build_dir_not_found, top_build_dir))
+
+                raise FatalError()
+
+            path = f'{self.config_file.top_build_dir}/config.toml'
+
+            cfg.write_toml(path, 'w')
+
+        def _build() -> None:
+            """ Write build configuration to config.toml. """
+
+            path = f'{self.config_file.top_build_dir}/config.toml'
+
+            log.debug(f'configuration: {self.config_file}')
+            log.debug(f'write configuration: {path}')
+
+            self.config_file.write(path, 'a')
+
+        def _config_h() -> None:
+            """ Write project configuration to config.h. """
+            path = f'{self.config_file.top_build_dir}/config.h'
+
+            for it in cfg.write_config_h(path):
+                log.info(f'wrote {it}')
+
+        def _gup() -> None:
+            """ Install gup files. """
+
+            report = scripts.sync(top_build_dir, args.install)
+
+            for (action, names) in (('added', report.added),
+                                    ('updated', report.updated),
+                                    ('removed', report.removed)):
+                for it in names:
+                    log.info(f'gup script {action}: {it}')
+
+            eprint(f'gup scripts: {report}')
+
+        _planer()
+        _build()
+        _config_h()
+
+        configure_.envrc_write(top_build_dir)
+
+        _gup()
+
+        if args.matrix is not None:
+            self._configure_variants(cfg, args.matrix)
+
+    def _configure_variants(self, cfg: PlanerConfig, matrix: str) -> None:
+        """ Write a build directory for each variant of the matrix. The
+            base configuration is parsed once and the variants link to the
+            gup scripts installed with the package. """
+
+        top_build_dir = ensure_type(self.config_file.top_build_dir, Path)
+
+        configured = {}
+
+        for (name, overrides) in variants_.load(matrix).items():
+            build = variants_.directory(top_build_dir, name)
+            makedirs(build, exist_ok=True)
+
+            variant = cfg.with_variant(name, overrides)
+            path = f'{build}/config.toml'
+
+            variant.write_toml(path, 'w')
+
+            build_config = copy.copy(self.config_file)
+            build_config.top_build_dir = build
+            build_config.write(path, 'a')
+
+            for it in variant.write_config_h(f'{build}/config.h'):
+                log.info(f'wrote {it}')
+
+            scripts.sync(build, 'symlink')
+
+            configured[name] = build
+
+        removed = variants_.remove_stale(top_build_dir, configured)
+
+        variants_.record(top_build_dir, configured)
+
+        eprint(f'configured {len(configured)} variants:'
+               f' {", ".join(configured)}')
+
+        if removed:
+            eprint(f'removed {len(removed)} variants: {", ".join(removed)}')
+
+    def init_env(self, args: argparse.Namespace) -> None:
+        self._environment_import()
+
+        if args.shell:
+            configure_.shell_configure()
+
+        if args.arduino_core:
+            # install core for board
+
+            arduino = self.config.arduino
+            core = ensure_type(arduino.core, str)
+            version = ensure_type(arduino.version, str)
+
+            log.info(f'Install core {core}')
+
+            if arduino_cli.core_install(f'{core}@{version}').returncode != 0:
+                raise Exception()
+
+        if args.arduino_ide:
+            # TODO modify settings.json
+
+            # modify platform settings for builds
+            # modify arduino-cli.yaml (sketchbook)
+
+            top_source_dir = self.config_file.top_source_dir
+            top_build_dir = self.config_file.top_build_dir
+
+            top_source_dir = ensure_type(top_source_dir, Path)
+            top_build_dir = ensure_type(top_build_dir, Path)
+
+            configure_.arduino_ide_configure(
+                self.config,
+                self.config_file,
+                top_source_dir,
+                top_build_dir
+            )
+
+    def build(self, args: argparse.Namespace) -> CompletedProcess[bytes]:
+        if args.watch:
+            return self._watch(args)
+
+        if args.upload is not None:
+            raise FatalError(watch_upload)
+
+        return self._build(args)
+
+    def _watch(self, args: argparse.Namespace) -> CompletedProcess[bytes]:
+        """ Build, then build again whenever the sources, libraries or
+            config.toml change, keeping the probed environment and parsed
+            configuration between builds. Only the sketches whose
+            directories changed are rebuilt. """
+
+        self._environment_import()
+
+        (top_source_dir, top_build_dir) = self._ensure_dirs()
+
+        config_path = Path(top_build_dir, 'config.toml')
+        targets = args.targets or boards_.sketch_targets
+
+        watcher = watch_.watcher([top_build_dir])
+
+        try:
+            watcher.add(top_source_dir)
+            watcher.add(top_build_dir, recursive=False)
+
+            self._watch_build(args, targets)
+
+            for changed in watch_.changes(watcher):
+                if config_path in changed:
+                    self._reload_config(config_path)
+
+                    rebuild = targets
+                else:
+                    sources = {it for it in changed
+                               if it.is_relative_to(top_source_dir)
+                               and not it.is_relative_to(top_build_dir)}
+
+                    if not sources:
+                        continue
+
+                    rebuild = watch_.affected(sources, top_source_dir,
+                                              targets)
+
+                log.info(f'changed: {sorted(str(it) for it in changed)}')
+
+                self._watch_build(args, rebuild)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+        return CompletedProcess([], 0)
+
+    def _watch_build(
+        self,
+        args: argparse.Namespace,
+        targets: list[str]
+    ) -> None:
+        build_args = copy.copy(args)
+        build_args.targets = targets
+
+        try:
+            result = self._build(build_args)
+        except FatalError as e:
+            eprint(str(e))
+            return
+
+        if result.returncode != 0:
+            eprint(str.format(watch_failed, len(targets)))
+            return
+
+        if args.upload is not None and args.upload in targets:
+            (_, top_build_dir) = self._ensure_dirs()
+
+            # The board and port of the configuration as last reloaded.
+
+            (board, _) = boards_.split(args.upload, self.config)
+            (fqbn, port) = self._upload_board(board)
+
+            upload = arduino_cli.upload(
+                str(Path(top_build_dir, args.upload)),
+                ensure_type(port, str),
+                fqbn
+            )
+
+            if upload.returncode != 0:
+                eprint(str.format(upload_failed, port))
+
+        eprint(str.format(watch_waiting, len(targets)))
+
+    def _reload_config(self, path: Path) -> None:
+        """ Parse config.toml again and regenerate config.h from it. """
+
+        try:
+            config = PlanerConfig.from_file(str(path))
+        except FatalError as e:
+            eprint(str(e))
+            return
+
+        config.environment = self.config.environment
+        self.config = config
+
+        for it in config.write_config_h(str(path.with_name('config.h'))):
+            log.info(f'wrote {it}')
+
+    def _build(self, args: argparse.Namespace) -> CompletedProcess[bytes]:
+        self._environment_import()
+
+        env = {
+            'ARDUINO_CLI': self.config.environment['arduino_cli'],
+            configure_.environment_variable: json.dumps(
+                self.config.environment)
+        }
+
+        (_, top_build_dir) = self._ensure_dirs()
+
+        history = History(top_build_dir)
+
+        if len(args.targets) == 0:
+            targets = [f'{build_dir()}/all']
+        else:
+            targets = [f'{build_dir()}/{it}'
+                       for it in history.order(args.targets)]
+
+        jobs = args.jobs if args.jobs is not None else auto_jobs()
+
+        log.info(f'build {targets} with {jobs} jobs')
+
+        backend = args.backend or self.config.arduino.backend
+
+        if args.profile:
+            trace_dir = Path(state_dir(top_build_dir), 'trace')
+
+            shutil.rmtree(trace_dir, ignore_errors=True)
+            makedirs(trace_dir)
+
+            env[profile_.profile_variable] = str(trace_dir)
+
+            recorder = profile_.Recorder(trace_dir, 'scon')
+            start = profile_.now()
+
+        if args.stack_usage:
+            env[stack_.variable] = '1'
+
+        with ExitStack() as stack:
+            if backend == 'daemon' and daemon_variable not in os.environ:
+                daemon = stack.enter_context(
+                    Daemon(self.config.environment['arduino_cli']))
+
+                try:
+                    env[daemon_variable] = daemon.start()
+                except (DaemonError, OSError) as e:
+                    log.warning(f'arduino-cli daemon: {e}')
+
+            if args.all_variants:
+                result = self._build_variants(args, top_build_dir, jobs, env)
+            elif self.config.boards:
+                result = self._build_boards(args, jobs, env)
+            else:
+                result = ensure_type(
+                    gup(targets, jobs=jobs, env=env),
+                    CompletedProcess
+                )
+
+        self._diagnostics(top_build_dir)
+
+        if args.profile:
+            recorder.span('build', 'build', start,
+                          args={'targets': targets, 'jobs': jobs})
+
+            trace_path = Path(top_build_dir, 'profile.json')
+            trace = profile_.merge(trace_dir, trace_path)
+
+            print(profile_.summary(trace))
+            eprint(f'trace written to {trace_path}')
+
+        history.compact()
+        size_.compact(top_build_dir)
+        self._build_cache().maintain()
+
+        return result
+
+    def _diagnostics(self, top_build_dir: Path) -> None:
+        """ Merge the diagnostics of all targets into diagnostics.json. """
+
+        paths = [Path(top_build_dir, x)
+                 for it in outputs_.load(top_build_dir)
+                 for x in it.files if x.endswith(diagnostics_.suffix)]
+
+        path = Path(top_build_dir, 'diagnostics.json')
+        merged = diagnostics_.merge(paths, path)
+
+        if merged:
+            eprint(f'{diagnostics_.summary(merged)}, see {path}')
+
+    def _build_boards(
+        self,
+        args: argparse.Namespace,
+        jobs: int,
+        env: dict[str, str]
+    ) -> CompletedProcess[bytes]:
+        """ Build for every configured board, or those selected with
+            --board, concurrently. """
+
+        selected = args.board or list(self.config.boards)
+
+        for it in selected:
+            if it not in self.config.boards:
+                raise FatalError(str.format(board_not_configured, it))
+
+        def run(
+            targets: list[str],
+            board_jobs: int,
+            board: str
+        ) -> CompletedProcess[bytes]:
+            makedirs(Path(build_dir(), board), exist_ok=True)
+
+            return ensure_type(
+                gup([f'{build_dir()}/{it}' for it in targets],
+                    jobs=board_jobs, env=env),
+                CompletedProcess
+            )
+
+        results = boards_.build(self.config, selected, args.targets, jobs,
+                                run)
+
+        print(boards_.table(results))
+
+        return CompletedProcess(
+            [], max(it.returncode for it in results))
+
+    def _build_variants(
+        self,
+        args: argparse.Namespace,
+        top_build_dir: Path,
+        jobs: int,
+        env: dict[str, str]
+    ) -> CompletedProcess[bytes]:
+        """ Build every variant configured with configure --matrix
+            concurrently. """
+
+        configured = variants_.configured(top_build_dir)
+
+        if not configured:
+            raise FatalError(variants_not_configured)
+
+        results = variants_.build(configured, args.targets, jobs, env)
+
+        print(variants_.table(results))
+
+        return CompletedProcess(
+            [], max(it.returncode for it in results))
+
+    def cache(self, args: argparse.Namespace) -> None:
+        """ Report on or prune the shared build cache. """
+
+        cache = self._build_cache()
+
+        if args.action == 'prune':
+            if args.max_size_mb is None:
+                max_size = None
+            else:
+                max_size = args.max_size_mb * 1024 * 1024
+
+            removed = cache.prune(max_size)
+
+            print(f'removed {len(removed)} entries, '
+                  f'{sum(it.size for it in removed) / 2**20:.1f} MiB')
+        else:
+            stats = cache.stats()
+
+            print(f"path:     {stats['path']}")
+            print(f"entries:  {stats['entries']}")
+            print(f"size:     {stats['size'] / 2**20:.1f} MiB"
+                  f" of {stats['max_size'] / 2**20:.0f} MiB")
+            print(f"hits:     {stats['hits']}")
+            print(f"misses:   {stats['misses']}")
+            print(f"hit rate: {stats['hit_rate']:.0%}")
+
+    def clean(self, args: argparse.Namespace) -> None:
+        """ Remove the outputs of the given targets, or of all targets. """
+
+        (_, build_dir) = self._ensure_dirs()
+
+        records = outputs_.load(build_dir)
+
+        if args.targets:
+            unrecorded = [
+                it for it in args.targets
+                if not any(outputs_.selected(x.target, [it]) for x in records)
+            ]
+
+            if unrecorded:
+                eprint(str.format(clean_nothing_recorded,
+                                  ' '.join(unrecorded)))
+
+        if not records:
+            if not args.targets:
+                self._clean_unrecorded(build_dir, args.dry_run)
+
+            return
+
+        report = outputs_.clean(
+            build_dir,
+            args.targets,
+            dry_run=args.dry_run,
+            jobs=args.jobs
+        )
+
+        if args.dry_run:
+            for it in report.dirs + report.files:
+                print(it)
+        else:
+            eprint(f'removed {len(report.files)} files and'
+                   f' {len(report.dirs)} directories')
+
+    def size(self, args: argparse.Namespace) -> None:
+        """ Print the flash and RAM usage of the built targets, by section
+            and largest symbol, with their recent history, and the stack
+            depth of those built with --stack-usage. """
+
+        (_, top_build_dir) = self._ensure_dirs()
+
+        files = [Path(top_build_dir, x)
+                 for it in outputs_.load(top_build_dir)
+                 if outputs_.selected(it.target, args.targets)
+                 for x in it.files]
+
+        reports = [size_.load(it) for it in files
+                   if it.name.endswith(size_.suffix)]
+
+        stacks = {it.target: it for it in (
+            stack_.load(x) for x in files if x.name.endswith(stack_.suffix))
+            if it is not None}
+
+        found = [it for it in reports if it is not None]
+
+        if not found:
+            eprint(size_not_built)
+            return
+
+        for it in found:
+            print(size_.details(it))
+
+            history = size_.history(top_build_dir, it.target)[-args.history:]
+
+            if len(history) > 1:
+                print('\n  history: ' + ', '.join(
+                    f'{x["flash"]}/{x["ram"]}' for x in history)
+                    + ' (flash/RAM bytes)')
+
+            if it.target in stacks:
+                print('\n' + stack_.details(stacks[it.target]))
+
+            print()
+
+    def _clean_unrecorded(self, build_dir: Path, dry_run: bool) -> None:
+        """ Clean a build directory whose builders predate output records,
+            removing every file that is not configuration or a build
+            script. """
+
+        def is_config_file(path: Path) -> bool:
+            parent = path.parent.name
+            name = path.name
+
+            return (parent == scripts.builders_dir
+                    or state_dir_name in path.parts
+                    or name.endswith('.gup')
+                    or name == 'Gupfile'
+                    or (name.startswith('config') and name.endswith('.h'))
+                    or name == 'config.toml')
+
+        for it in walk(build_dir):
+            path = Path(it[0])
+            paths = [Path(path, x) for x in it[2]]
+
+            to_delete = list(filter(lambda x: not is_config_file(x), paths))
+
+            for jj in to_delete:
+                if dry_run:
+                    print(jj)
+                else:
+                    os.remove(jj)
+
+    def upload(self, args: argparse.Namespace) -> None:
+        """ Upload a file to one board, or to many boards concurrently. """
+
+        self._environment_import()
+
+        (board, default_port) = self._upload_board(args.board)
+
+        ports = flash_.ports(args.port, args.port_glob)
+
+        if not ports and args.port_glob:
+            raise FatalError(str.format(upload_no_ports, args.port_glob))
+
+        if len(ports) <= 1 and args.log_dir is None:
+            port = ports[0] if ports else ensure_type(default_port, str)
+
+            result = arduino_cli.upload(args.filename, port, board)
+
+            if result.returncode != 0:
+                raise FatalError()
+
+            return
+
+        (_, top_build_dir) = self._ensure_dirs()
+
+        log_dir = args.log_dir or Path(top_build_dir, 'upload')
+
+        def upload(port: str, output: BinaryIO) -> int:
+            return arduino_cli.upload(args.filename, port, board,
+                                      output).returncode
+
+        results = flash_.flash(ports, upload, log_dir, jobs=args.jobs,
+                               retries=args.retries)
+
+        print(flash_.summary(results))
+
+        failed = [it.port for it in results if it.returncode != 0]
+
+        if failed:
+            raise FatalError(str.format(upload_failed, ', '.join(failed)))
+
+    def _upload_board(
+        self,
+        board: Optional[str]
+    ) -> tuple[str, Optional[str]]:
+        """ Return the FQBN and default port of a configured board, by
+            default of [arduino]. Other names are taken as an FQBN.
+
+            They are passed to arduino_cli explicitly, as the configuration
+            it would look up is not ours. Ours is not changed, so that a
+            build server does not keep the board for later requests. """
+
+        arduino = self.config.arduino
+
+        if board is None or board in self.config.boards:
+            if board is not None:
+                arduino = self.config.boards[board]
+
+            return (f'{arduino.core}:{arduino.board}', arduino.port)
+
+        return (board, arduino.port)
+
+    def monitor(self, args: argparse.Namespace) -> None:
+        """ Print and log the output of one or more serial ports. """
+
+        if args.arduino_cli:
+            self._environment_import()
+
+            arduino_cli.monitor(args.baud)
+            return
+
+        ports = args.port or [ensure_type(self.config.arduino.port, str)]
+
+        monitor_.run(ports, args.baud, args.log_dir, args.max_bytes,
+                     args.backups)
+
+    def serve(self, args: argparse.Namespace) -> None:
+        """ Run build and upload requests from other scon processes,
+            keeping the probed environment and parsed configuration between
+            them. config.toml is parsed again when it changes. """
+
+        self._environment_import()
+
+        (_, top_build_dir) = self._ensure_dirs()
+
+        config_path = Path(top_build_dir, 'config.toml')
+
+        mtime = _mtime(config_path)
+        loaded = self.config
+
+        def run(values: dict[str, Any]) -> int:
+            nonlocal mtime, loaded
+
+            request = argparse.Namespace(**values)
+            name = request.func
+            del request.func
+
+            if name == 'build' and request.watch:
+                eprint(serve_watch)
+                return 2
+
+            try:
+                if _mtime(config_path) != mtime:
+                    modified = _mtime(config_path)
+
+                    config = PlanerConfig.from_file(str(config_path))
+                    config.environment = loaded.environment
+
+                    (mtime, loaded) = (modified, config)
+
+                # Each request works on a copy, so that what it changes
+                # does not carry over to later requests.
+
+                self.config = copy.deepcopy(loaded)
+
+                result = getattr(self, name)(request)
+            except (FatalError, ValueError) as e:
+                eprint(str(e))
+                return 1
+
+            if isinstance(result, CompletedProcess):
+                return result.returncode
+
+            return 0
+
+        state_dir(top_build_dir)
+
+        path = serve_.socket_path(str(top_build_dir))
+        server = serve_.Server(path, run)
+
+        eprint(str.format(serve_listening, path))
+
+        server.serve()
+
+    def _init_log(self, log_level: int) -> None:
+        if log_level == 0:
+            log_level_str = 'WARNING'
+        if log_level == 1:
+            log_level_str = 'INFO'
+        elif log_level == 2:
+            log_level_str = 'DEBUG'
+
+        log.init(log_level_str)
+
+        if log_level >= 1:
+            log.set_detail(1)
+
+        os.environ['MK_LOG_LEVEL'] = log_level_str
+
+    def _build_cache(self) -> BuildCache:
+        return BuildCache(
+            self.config.cache.path,
+            self.config.cache.max_size_mb
+        )
+
+    def _validate_dirs(self) -> Tuple[Path, Path]:
+        (top_source_dir, top_build_dir) = self._ensure_dirs()
+
+        if top_build_dir == top_source_dir:
+            raise ValueError(build_dir_bad_location)
+
+        return (top_source_dir, top_build_dir)
+
+    def _ensure_dirs(self) -> Tuple[Path, Path]:
+        top_build_dir = self.config_file.top_build_dir
+        top_build_dir = ensure_type(top_build_dir, Path)
+
+        top_source_dir = self.config_file.top_source_dir
+        top_source_dir = ensure_type(top_source_dir, Path)
+
+        return (top_source_dir, top_build_dir)
+
+    def _environment_import(self) -> None:
+        """ Determine paths for the Arduino installation. Only subcommands
+            that run Arduino tools need them, so this is called lazily. """
+
+        if self.config.environment:
+            return
+
+        top_build_dir = ensure_type(self.config_file.top_build_dir, Path)
+
+        environment = environment_.probe(
+            top_build_dir,
+            self.wsl,
+            self.config_file.system.build.system
+        )
+
+        os.environ['ARDUINO_IDE'] = environment['arduino_ide']
+        os.environ['ARDUINO_CLI'] = environment['arduino_cli']
+
+        self.config.environment = environment
+
+        log.debug(f'environment {self.config.environment}')
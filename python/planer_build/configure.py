@@ -1,18 +1,32 @@
 #!/usr/bin/env python
 
 from dataclasses import dataclass, field
+import copy
+import hashlib
+import json
+from os import makedirs, stat
+from os.path import exists, expanduser, realpath
+import re
 import string
-from os.path import exists
+import sys
 from typing import Any, Optional, Sequence
 
 from mk_build import log, environ, eprint, path, Path, PathInput
 from mk_build.config import BaseConfig, Config as BuildConfig
 from mk_build.validate import ensure_type
-from tomlkit.items import Table
 
+from . import pins as pins_
+from . import ramp as ramp_
+from . import schema
 from .error import FatalError
-from .message import arduino_ide_error_not_found, platform_build_extra_flags
-from .util import win_from_wsl
+from .message import (
+    arduino_ide_error_not_found, board_not_configured, compiler_cache_wsl,
+    config_invalid, pins_unknown_board, platform_local_remove,
+    platform_local_replace
+)
+from .util import (
+    json_load, json_write, user_cache_dir, win_from_wsl, write_if_changed
+)
 
 
 def envrc_write(build: PathInput) -> None:
@@ -132,37 +146,149 @@ def _arduino_ide_platform_configure(
     source: Path,
     build: Path
 ) -> None:
-    platform_path = path(_arduino_core_path(config), 'platform.local.txt')
+    platform_path = platform_local_path(config)
 
-    if build_config.system.build.system == 'wsl':
-        build = Path(win_from_wsl(build))
+    wsl = build_config.system.build.system == 'wsl'
 
-    # flags for master branch
-    flags = f'-I{build} -DU8G2_USE_DYNAMIC_ALLOC'
-    out_line = f'build.extra_flags={flags}\n'
+    properties: dict[str, Optional[str]] = {
+        'build.extra_flags': build_extra_flags(build, wsl)
+    }
+
+    properties.update(_compiler_cache_recipes(config, wsl))
+
+    _platform_local_update(platform_path, properties)
+
+
+def _platform_local_update(
+    platform_path: Path,
+    properties: dict[str, Optional[str]]
+) -> None:
+    """ Set properties in platform.local.txt, keeping its other lines. A
+        value of None removes a compiler cache recipe written by scon. """
 
     try:
         with open(platform_path, 'r') as fi:
             lines = fi.readlines()
+    except FileNotFoundError:
+        # The file doesn't exist, so create it and add our content.
+        lines = []
 
-        with open(platform_path, 'w') as fi:
-            replaced = False
+    remaining = dict(properties)
 
-            for it in lines:
-                if not it.startswith('build.extra_flags='):
+    with open(platform_path, 'w') as fi:
+        for it in lines:
+            name = it.split('=', 1)[0]
+
+            if name not in properties:
+                fi.write(it)
+                continue
+
+            value = remaining.pop(name, None)
+
+            if value is None:
+                if compiler_cache_launcher not in it:
                     fi.write(it)
                 else:
-                    fi.write(out_line)
-                    eprint(str.format(platform_build_extra_flags, flags))
-                    replaced = True
+                    eprint(str.format(platform_local_remove, name))
+            elif it != f'{name}={value}\n':
+                fi.write(f'{name}={value}\n')
+                eprint(str.format(platform_local_replace, name, value))
+            else:
+                fi.write(it)
 
-            if not replaced:
-                fi.write(out_line)
-    except FileNotFoundError:
-        # The file doesn't exist, so create it and add our content.
+        for (name, value) in remaining.items():
+            if value is not None:
+                fi.write(f'{name}={value}\n')
 
-        with open(platform_path, 'w') as fi:
-            fi.write(out_line)
+
+def _compiler_cache_recipes(
+    config: 'Config',
+    wsl: bool
+) -> dict[str, Optional[str]]:
+    """ Return the compile recipes wrapped with the compiler cache launcher,
+        or None for each recipe if the cache is off. """
+
+    names = [f'recipe.{it}.o.pattern' for it in ('c', 'cpp', 'S')]
+    off: dict[str, Optional[str]] = dict.fromkeys(names)
+
+    if not config.compiler_cache.enabled:
+        return off
+
+    if wsl:
+        # The Windows toolchain cannot run a launcher inside WSL.
+        eprint(compiler_cache_wsl)
+        return off
+
+    recipes = _platform_properties(
+        Path(_arduino_core_path(config), 'platform.txt'))
+
+    cache_path = (config.compiler_cache.path
+                  or str(Path(user_cache_dir(), 'compiler-cache')))
+
+    launcher = (f'"{sys.executable}" -m {compiler_cache_launcher}'
+                f' --dir "{expanduser(cache_path)}"'
+                f' --max-size-mb {config.compiler_cache.max_size_mb} --')
+
+    return {it: f'{launcher} {recipes[it]}' if it in recipes else None
+            for it in names}
+
+
+def _platform_properties(path: Path) -> dict[str, str]:
+    result = {}
+
+    with open(path, 'r') as fi:
+        for it in fi:
+            it = it.strip()
+
+            if it and not it.startswith('#') and '=' in it:
+                (name, value) = it.split('=', 1)
+                result[name.strip()] = value.strip()
+
+    return result
+
+
+def build_extra_flags(build: PathInput, wsl: bool) -> str:
+    """ Return the build.extra_flags that put config.h of a build
+        directory on the include path. """
+
+    if wsl:
+        build = win_from_wsl(build)
+
+    # flags for master branch
+    return f'-I{build} -DU8G2_USE_DYNAMIC_ALLOC'
+
+
+def platform_local_path(config: 'Config') -> Path:
+    """ Return the path of the platform.local.txt that scon maintains for
+        the configured core. """
+
+    return path(_arduino_core_path(config), 'platform.local.txt')
+
+
+def platform_local_key(
+    config: 'Config',
+    build: PathInput,
+    wsl: bool
+) -> list[str]:
+    """ Return the lines of platform.local.txt without what depends on the
+        machine, for keying shared artifacts: the build directory on the
+        include path, and the compiler cache launcher, which holds the path
+        of the Python interpreter and does not change the output. """
+
+    if wsl:
+        build = win_from_wsl(build)
+
+    launcher = re.compile(
+        rf'"[^"]*" -m {re.escape(compiler_cache_launcher)} .*? -- ')
+
+    result = []
+
+    with open(platform_local_path(config), 'r') as fi:
+        for it in fi:
+            it = it.rstrip('\n').replace(str(build), '{top_build_dir}')
+            result.append(launcher.sub('', it))
+
+    return result
 
 
 def _arduino_core_path(config: 'Config') -> Path:
@@ -172,6 +298,21 @@ def _arduino_core_path(config: 'Config') -> Path:
     return Path(f"{config.environment['arduino']}/hardware/{arch}/{version}")
 
 
+def board_ram(config: 'Config') -> Optional[int]:
+    """ Return the RAM of the configured board in bytes, as the core's
+        boards.txt gives it, or None if it is not known. """
+
+    name = f'{config.arduino.board}.upload.maximum_data_size'
+
+    try:
+        properties = _platform_properties(
+            Path(_arduino_core_path(config), 'boards.txt'))
+
+        return int(properties[name])
+    except (KeyError, OSError, TypeError, ValueError):
+        return None
+
+
 def _arduino_arch(core: str) -> str:
     return core[core.find(':') + 1:]
 
@@ -184,43 +325,207 @@ class Config(BaseConfig):
         version: Optional[str] = None
         board: Optional[str] = None
         port: Optional[str] = None
+        backend: str = 'cli'
+
+    @dataclass
+    class Cache:
+        path: Optional[str] = None
+        max_size_mb: int = 2048
+
+    @dataclass
+    class Artifacts:
+        store: Optional[str] = None
+
+    @dataclass
+    class Budget:
+        flash: Optional[int] = None
+        ram: Optional[int] = None
+
+    @dataclass
+    class CompilerCache:
+        enabled: bool = False
+        path: Optional[str] = None
+        max_size_mb: int = 1024
 
     log_level: str = 'WARNING'
 
     arduino: Arduino = field(default_factory=Arduino)
+    boards: dict[str, Arduino] = field(default_factory=dict)
+    cache: Cache = field(default_factory=Cache)
+    artifacts: Artifacts = field(default_factory=Artifacts)
+    compiler_cache: CompilerCache = field(default_factory=CompilerCache)
+    budget: Budget = field(default_factory=Budget)
     environment: dict[str, str] = field(default_factory=dict)
+    variant: Optional[str] = None
+    path: Optional[str] = None
+    values: dict[str, Any] = field(default_factory=dict)
 
     @classmethod
     def from_file(cls, path: str) -> 'Config':
-        """ Parse the configuration from an existing file. """
+        """ Parse and validate the configuration from an existing file.
+
+            The validated values are cached per file, so loading an
+            unchanged file again neither parses the TOML nor validates it.
+            The TOML document itself is only parsed when it is needed to
+            write the configuration back out.
+        """
 
         ctx = cls()
-        ctx._init_from_file(path)
+        ctx.path = path
 
-        log.debug(f'config {ctx.config}')
+        values = _cache_load(path)
 
-        ctx.log_level = ensure_type(ctx.config.get('log_level'), str)
+        if values is None:
+            ctx._init_from_file(path)
+            values = ctx.config.unwrap()
 
-        arduino = ensure_type(ctx.config.get('arduino'), Table)
+            errors = schema.validate(values)
 
-        ctx.arduino = cls.Arduino(
-            ensure_type(arduino.get('core'), str),
-            ensure_type(arduino.get('version'), str),
-            ensure_type(arduino.get('board'), str),
-            ensure_type(arduino.get('port'), str)
-        )
+            if errors:
+                raise FatalError(
+                    str.format(config_invalid, path, '\n'.join(errors)))
+
+            _cache_store(path, values)
+
+        ctx._init_from_values(values)
+
+        return ctx
+
+    def with_variant(
+        self,
+        name: str,
+        overrides: dict[str, Any]
+    ) -> 'Config':
+        """ Return the configuration of a hardware variant: this one with
+            the keys of each overridden section replaced. """
+
+        doc = copy.deepcopy(self.toml())
+
+        doc['variant'] = name
+
+        for (section, keys) in overrides.items():
+            for (key, value) in keys.items():
+                doc[section][key] = value
+
+        values = doc.unwrap()
+        errors = schema.validate(values)
+
+        if errors:
+            raise FatalError(str.format(config_invalid, f'variant {name}',
+                                        '\n'.join(errors)))
+
+        ctx = type(self)()
+        ctx.config = doc
+        ctx.environment = self.environment
+        ctx._init_from_values(values)
 
         return ctx
 
-    def write_config_h(self, path: str) -> None:
-        toml = self.config
+    def _init_from_values(self, values: dict[str, Any]) -> None:
+        log.debug(f'config {values}')
+
+        self.values = values
+        self.log_level = values['log_level']
+        self.variant = values.get('variant')
+
+        arduino = values['arduino']
+
+        self.arduino = self.Arduino(
+            arduino['core'],
+            arduino['version'],
+            arduino['board'],
+            arduino['port'],
+            arduino.get('backend', 'cli')
+        )
+
+        # Each [[arduino.boards]] entry names a board to build for. Its
+        # core, version and port default to those of [arduino].
+
+        for board in arduino.get('boards', []):
+            self.boards[board['name']] = self.Arduino(
+                board.get('core', self.arduino.core),
+                board.get('version', self.arduino.version),
+                board['board'],
+                board.get('port', self.arduino.port),
+                self.arduino.backend
+            )
+
+        cache = values.get('cache', {})
+
+        self.cache = self.Cache(
+            cache.get('path'),
+            cache.get('max_size_mb', 2048)
+        )
+
+        self.artifacts = self.Artifacts(
+            values.get('artifacts', {}).get('store'))
+
+        budget = values.get('budget', {})
+
+        self.budget = self.Budget(budget.get('flash'), budget.get('ram'))
+
+        compiler_cache = values.get('compiler_cache', {})
+
+        self.compiler_cache = self.CompilerCache(
+            compiler_cache.get('enabled', False),
+            compiler_cache.get('path'),
+            compiler_cache.get('max_size_mb', 1024)
+        )
+
+    def select_board(self, name: str) -> None:
+        """ Make the named entry of boards the board to build for. """
+
+        try:
+            self.arduino = self.boards[name]
+        except KeyError:
+            raise FatalError(str.format(board_not_configured, name))
+
+    def write_config_h(self, path: str) -> list[str]:
+        """ Write config.h and the per-subsystem headers it includes next
+            to it. Files whose contents are unchanged are left untouched so
+            that their dependents are not rebuilt. Returns the paths that
+            were written. """
+
+        sections = self._config_h_sections()
+
+        directory = Path(path).parent
+        written = []
+
+        for (name, include, title) in _config_h_sections:
+            section_path = str(Path(directory, f'config_{name}.h'))
+
+            header = string.Template(_config['section']).substitute(
+                name=name,
+                include=include,
+                title=title,
+                body=sections[name]
+            )
+
+            if write_if_changed(section_path, header):
+                written.append(section_path)
+
+        includes = ''.join(f'#include "config_{it[0]}.h"\n'
+                           for it in _config_h_sections)
+
+        umbrella = string.Template(_config['full']).substitute(
+            includes=includes)
+
+        if write_if_changed(path, umbrella):
+            written.append(path)
+
+        log.debug(f'config.h: wrote {written}')
+
+        return written
+
+    def _config_h_sections(self) -> dict[str, str]:
+        toml = self.values
 
         log_level_item = f"LOG_{ensure_type(toml['log_level'], str)}"
 
         log = string.Template(_config['log']).substitute(
             {'log_level': log_level_item})
 
-        t = ensure_type(toml['keypad'], Table)
+        t = ensure_type(toml['keypad'], dict)
 
         subs: dict[str, str | int] = {
             'row_pins': Config._initializer(ensure_type(t['row_pins'], list)),
@@ -230,7 +535,7 @@ class Config(BaseConfig):
 
         keypad = string.Template(_config['keypad']).substitute(subs)
 
-        t = ensure_type(toml['motor'], Table)
+        t = ensure_type(toml['motor'], dict)
 
         driver = ensure_type(t['driver'], str)
 
@@ -250,7 +555,13 @@ class Config(BaseConfig):
 
         motor = string.Template(_config['motor']).substitute(subs)
 
-        t = ensure_type(toml['display'], Table)
+        if 'profile' in t:
+            motor += Config._motor_profile(
+                ensure_type(t['steps_per_revolution'], int),
+                ensure_type(t['profile'], dict)
+            )
+
+        t = ensure_type(toml['display'], dict)
 
         subs = {
             'controller': ensure_type(t['controller'], str),
@@ -267,19 +578,83 @@ class Config(BaseConfig):
 
         display = string.Template(_config['display']).substitute(subs)
 
-        template = string.Template(_config['full']).substitute(
-            log=log,
-            keypad=keypad,
-            motor=motor,
-            display=display
-        )
+        return {
+            'log': log,
+            'keypad': keypad,
+            'motor': motor,
+            'display': display,
+            'pins': self._pins()
+        }
+
+    def _pins(self) -> str:
+        """ Resolve the configured pins on the main board and every entry
+            of boards. """
 
-        with open(path, 'w') as fi:
-            fi.write(template)
+        toml = self.values
+
+        keypad = ensure_type(toml['keypad'], dict)
+        display = ensure_type(toml['display'], dict)
+
+        assignments: dict[str, pins_.Assignment] = {
+            'motorPins': ensure_type(toml['motor'], dict)['pins'],
+            'keypadRowPins': keypad['row_pins'],
+            'keypadColumnPins': keypad['column_pins']
+        }
+
+        for it in ('clock', 'data', 'cs', 'dc', 'reset', 'backlight'):
+            assignments[f'display{it.capitalize()}Pin'] = display[it]
+
+        fqbns = dict.fromkeys(f'{it.core}:{it.board}' for it in
+                              [self.arduino] + list(self.boards.values()))
+
+        definitions = []
+
+        for it in fqbns:
+            board = pins_.boards.get(it)
+
+            if board is None:
+                log.warning(str.format(pins_unknown_board, it))
+            else:
+                definitions.append(pins_.definitions(board, assignments))
+
+        return string.Template(_config['pins']).substitute(
+            definitions='\n'.join(definitions))
+
+    def toml(self) -> Any:
+        self._ensure_toml()
+
+        return super().toml()
 
     def write_toml(self, path: str, mode: str = 'w') -> None:
+        self._ensure_toml()
         self.write(path, mode)
 
+    def _ensure_toml(self) -> None:
+        # A configuration restored from the cache has not parsed its file.
+
+        if self.config is None and self.path is not None:
+            self._init_from_file(self.path)
+
+    @staticmethod
+    def _motor_profile(
+        steps_per_revolution: int,
+        profile: dict[str, Any]
+    ) -> str:
+        ramp = ramp_.compute(steps_per_revolution, profile)
+
+        log.info(f'motor profile: {len(ramp.intervals)} entries of'
+                 f' {ramp.stride} steps, ramp of {ramp.steps} steps in'
+                 f' {ramp.duration:.3f} s, off by {ramp.error:.2%}')
+
+        return string.Template(_config['motor_profile']).substitute(
+            type=f'uint{ramp.entry_bits}_t',
+            stride=ramp.stride,
+            tick_us=ramp.tick_us,
+            steps=ramp.steps,
+            length=len(ramp.intervals),
+            intervals=ramp_.initializer(ramp)
+        )
+
     @staticmethod
     def _initializer(list_: Sequence[int]) -> str:
         array = str(list_)
@@ -320,8 +695,28 @@ static struct MotorConfig motorConfig = {
     .stepsPerRevolution = ${steps_per_revolution},
     .pins = ${pins}
 };
+    """,
+    'motor_profile': """
+#include <avr/pgmspace.h>
+
+/// Acceleration ramp. Step n from rest waits
+/// motorRampIntervals[min(n / MOTOR_RAMP_STRIDE, MOTOR_RAMP_LENGTH - 1)]
+/// ticks of MOTOR_RAMP_TICK_US microseconds. Full speed, the last entry,
+/// is reached after MOTOR_RAMP_STEPS steps. Decelerate in reverse.
+#define MOTOR_RAMP_STRIDE ${stride}
+#define MOTOR_RAMP_TICK_US ${tick_us}
+#define MOTOR_RAMP_STEPS ${steps}
+#define MOTOR_RAMP_LENGTH ${length}
+
+__attribute__((unused))
+static const ${type} motorRampIntervals[] PROGMEM = ${intervals};
     """,
     'display': """
+/// Display controller
+/// Only one out of the following list may be defined.
+
+/// Display buffer type
+/// 1: 1 page buffer, 2: 2 page buffer, else full buffering
 __attribute__((unused))
 static struct DisplayConfig displayConfig = {
     .controller = ${controller},
@@ -334,29 +729,120 @@ static struct DisplayConfig displayConfig = {
     .backlight = ${backlight}
 };
     """,
+    'pins': """
+/// Port registers of the configured pins, for driving them directly
+/// instead of with digitalWrite. Registers are FastPinRegister wide. With
+/// FAST_PIN_SET_CLEAR, writing the mask to set or clear sets or clears the
+/// pin; without, both are the output register, which is read, modified and
+/// written.
+struct FastPin {
+    uintptr_t input;
+    uintptr_t output;
+    uintptr_t direction;
+    uintptr_t set;
+    uintptr_t clear;
+    uint16_t mask;
+};
+
+${definitions}
+#ifndef FAST_PINS
+#define FAST_PINS 0
+#endif
+    """,
+    'section': """#ifndef Planer__config_${name}_h_INCLUDED
+#define Planer__config_${name}_h_INCLUDED
+
+#include "${include}"
+
+/// ${title}
+${body}
+#endif // Planer__config_${name}_h_INCLUDED""",
     'full': """#ifndef Planer__config_h_INCLUDED
 #define Planer__config_h_INCLUDED
 
-#include "input.h"
-#include "motor.h"
-#include "display.h"
-#include "util.h"
+${includes}
+#endif // Planer__config_h_INCLUDED"""}
 
-/// Log
-${log}
-/// Input
-${keypad}
-/// Motor
-${motor}
-/// Display
+# (name, header declaring its struct, comment title) for each generated
+# config_<name>.h.
+_config_h_sections = (
+    ('log', 'util.h', 'Log'),
+    ('keypad', 'input.h', 'Input'),
+    ('motor', 'motor.h', 'Motor'),
+    ('display', 'display.h', 'Display'),
+    ('pins', 'stdint.h', 'Pins')
+)
 
-/// Display controller
-/// Only one out of the following list may be defined.
 
-/// Display buffer type
-/// 1: 1 page buffer, 2: 2 page buffer, else full buffering
-${display}
-#endif // Planer__config_h_INCLUDED"""}
+# Variable passing the probed Arduino environment to build scripts.
+environment_variable = 'SCON_ENVIRONMENT'
+
+compiler_cache_launcher = 'planer_build.tools.ccache'
+
+
+def _cache_path(path: str) -> Path:
+    name = hashlib.sha256(realpath(path).encode()).hexdigest()[:16]
+
+    return Path(user_cache_dir(), 'config', f'{name}.json')
+
+
+def _cache_load(path: str) -> Optional[dict[str, Any]]:
+    """ Return the cached values of a configuration file, or None if the
+        file changed since they were stored. """
+
+    entry = json_load(_cache_path(path))
+
+    if not isinstance(entry, dict) or entry.get('schema') != schema.version:
+        return None
+
+    try:
+        st = stat(path)
+    except FileNotFoundError:
+        return None
+
+    if st.st_size != entry.get('size'):
+        return None
+
+    if st.st_mtime_ns != entry.get('mtime_ns'):
+        # Touched, or rewritten with the same size: compare the contents.
+
+        if _file_hash(path) != entry.get('sha256'):
+            return None
+
+        entry['mtime_ns'] = st.st_mtime_ns
+        _cache_write(path, entry)
+
+    values: dict[str, Any] = entry['values']
+
+    return values
+
+
+def _cache_store(path: str, values: dict[str, Any]) -> None:
+    st = stat(path)
+
+    _cache_write(path, {
+        'schema': schema.version,
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'sha256': _file_hash(path),
+        'values': values
+    })
+
+
+def _cache_write(path: str, entry: dict[str, Any]) -> None:
+    cache_path = _cache_path(path)
+
+    try:
+        makedirs(cache_path.parent, exist_ok=True)
+        json_write(cache_path, entry)
+    except OSError as e:
+        # The cache only saves time; a read-only home must not stop a build.
+        log.debug(f'config cache: {e}')
+
+
+def _file_hash(path: str) -> str:
+    with open(path, 'rb') as fi:
+        return hashlib.sha256(fi.read()).hexdigest()
 
 
 def _create(*args: Any, **kwargs: Any) -> Config:
@@ -367,11 +853,26 @@ def _create(*args: Any, **kwargs: Any) -> Config:
     else:
         config = Config(*args, **kwargs)
 
+    # Build scripts run by gup inherit the environment probed by the CLI.
+
+    environment = environ(environment_variable)
+
+    if environment is not None:
+        config.environment = json.loads(environment)
+
     return config
 
 
-config = _create()
+_instance: Optional[Config] = None
 
 
 def get() -> Config:
-    return config
+    """ Return the project configuration of the top build directory,
+        parsing it on first use. """
+
+    global _instance
+
+    if _instance is None:
+        _instance = _create()
+
+    return _instance
@@ -0,0 +1,194 @@
+""" Dependency tracking for sketches built with arduino-cli.
+
+    arduino-cli leaves a make-style .d file next to each object it compiles
+    in its build path. These are harvested after each compile, declared to
+    gup and recorded with content checksums, so that a later build can tell
+    whether anything relevant changed without running arduino-cli.
+"""
+
+from dataclasses import dataclass, field
+import hashlib
+import os
+from os import walk
+from typing import Any, Iterable, Optional
+
+from mk_build import log, Path, PathInput, run
+
+from .util import json_load, json_write, wsl_from_win
+
+# Name of the directory below a target's build directory that holds
+# arduino-cli build paths.
+build_path_name = '.arduino'
+
+# Subdirectories of an arduino-cli build path whose dependencies are
+# tracked. The core is identified by its version instead.
+_tracked = ('sketch', 'libraries')
+
+_sketch_suffixes = ('.ino', '.pde', '.c', '.cpp', '.h', '.hpp', '.S')
+
+
+def parse_depfile(text: str) -> list[str]:
+    """ Return the prerequisites listed in a make-style dependency file. """
+
+    result = []
+
+    joined = text.replace('\\\n', ' ')
+
+    for line in joined.splitlines():
+        (_, sep, prerequisites) = line.partition(': ')
+
+        if not sep:
+            continue
+
+        # Escaped spaces are part of a file name.
+        words = prerequisites.replace('\\ ', '\0').split()
+
+        result += [it.replace('\0', ' ') for it in words]
+
+    return result
+
+
+def sketch_files(sketch: PathInput) -> list[Path]:
+    """ Return the source files of the sketch containing the given .ino
+        file, including those in its src directory. """
+
+    sketch_dir = Path(sketch).parent
+    result = []
+
+    for (dir_path, dir_names, file_names) in walk(sketch_dir):
+        relative = Path(dir_path).relative_to(sketch_dir)
+
+        if relative.parts and relative.parts[0] != 'src':
+            dir_names.clear()
+            continue
+
+        dir_names[:] = [it for it in dir_names if not it.startswith('.')]
+
+        result += [Path(dir_path, it) for it in file_names
+                   if it.endswith(_sketch_suffixes)]
+
+    return sorted(result)
+
+
+def harvest(build_path: PathInput, wsl: bool = False) -> list[Path]:
+    """ Return the files that the sketch and libraries compiled in an
+        arduino-cli build path depend on. With wsl, the dependency files
+        were written by a Windows arduino-cli and their paths are
+        converted. """
+
+    result: set[Path] = set()
+
+    for it in _tracked:
+        for (dir_path, _, file_names) in walk(Path(build_path, it)):
+            for name in file_names:
+                if not name.endswith('.d'):
+                    continue
+
+                with open(Path(dir_path, name), 'r') as fi:
+                    prerequisites = parse_depfile(fi.read())
+
+                if wsl:
+                    prerequisites = [wsl_from_win(x) for x in prerequisites]
+
+                result.update(Path(x) for x in prerequisites
+                              if not _is_generated(x, build_path))
+
+    return sorted(result)
+
+
+def declare(paths: Iterable[PathInput]) -> None:
+    """ Declare files as dependencies of the target gup is building. """
+
+    paths = [str(it) for it in paths]
+
+    if paths and 'GUP_TARGET' in os.environ:
+        run(['gup', '-u'] + paths)
+
+
+def digest(path: PathInput) -> Optional[str]:
+    result = hashlib.sha256()
+
+    try:
+        with open(path, 'rb') as fi:
+            for chunk in iter(lambda: fi.read(1 << 16), b''):
+                result.update(chunk)
+    except FileNotFoundError:
+        return None
+
+    return result.hexdigest()
+
+
+@dataclass
+class Stamp:
+    """ Record of the inputs a target was last built from.
+
+        Files are identified by content checksum. The recorded mtime and
+        size of each file let an unchanged file skip rehashing. """
+
+    path: Path
+    key: dict[str, Any] = field(default_factory=dict)
+    files: dict[str, list[Any]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: PathInput) -> 'Stamp':
+        data = json_load(path)
+
+        if not isinstance(data, dict):
+            return cls(Path(path))
+
+        return cls(Path(path), data.get('key', {}), data.get('files', {}))
+
+    def current(self, key: dict[str, Any]) -> bool:
+        """ Whether the key and every recorded file are unchanged. """
+
+        if key != self.key or not self.files:
+            return False
+
+        # A file that could not be read when it was recorded is never
+        # known to be unchanged.
+
+        for (name, (mtime, size, checksum)) in self.files.items():
+            if (checksum is None
+                    or _entry(name, mtime, size, checksum)[2] != checksum):
+                log.debug(f'dependency changed: {name}')
+                return False
+
+        return True
+
+    def write(self, key: dict[str, Any], paths: Iterable[PathInput]) -> None:
+        files = {}
+
+        for it in paths:
+            name = str(it)
+            previous = self.files.get(name, [None, None, None])
+
+            files[name] = list(_entry(name, *previous))
+
+        self.key = key
+        self.files = files
+
+        json_write(self.path, {'key': key, 'files': files})
+
+
+def _entry(
+    name: str,
+    mtime: Optional[int],
+    size: Optional[int],
+    checksum: Optional[str]
+) -> tuple[Optional[int], Optional[int], Optional[str]]:
+    try:
+        st = os.stat(name)
+    except OSError:
+        return (None, None, None)
+
+    if st.st_mtime_ns == mtime and st.st_size == size:
+        return (mtime, size, checksum)
+
+    return (st.st_mtime_ns, st.st_size, digest(name))
+
+
+def _is_generated(path: str, build_path: PathInput) -> bool:
+    """ Whether a prerequisite is a file arduino-cli generated in its build
+        path, such as the preprocessed sketch. """
+
+    return Path(path).is_relative_to(build_path) or path.endswith('.o')
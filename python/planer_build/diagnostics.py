@@ -0,0 +1,135 @@
+""" Structured compiler diagnostics from arduino-cli's output.
+
+    Builders pass each line of the compile output to a Collector as it
+    arrives, which extracts GCC warnings and errors. Nothing else is kept,
+    so memory use depends on the number of distinct diagnostics rather than
+    on the size of the output. Each target's diagnostics are written next
+    to its outputs, and the CLI merges those of all targets into one JSON
+    file, listing a diagnostic from a source shared by several sketches,
+    such as the core, only once.
+"""
+
+from dataclasses import asdict, dataclass, field
+import json
+from os.path import normpath
+import re
+from typing import Any, Iterable, Optional
+
+from mk_build import PathInput
+
+from .util import json_write
+
+suffix = '.diagnostics.json'
+
+_pattern = re.compile(
+    r'^(?P<file>(?:[A-Za-z]:)?[^:]+):(?P<line>\d+):(?:(?P<column>\d+):)?'
+    r' (?P<severity>fatal error|error|warning|note): (?P<message>.*)$'
+)
+
+
+@dataclass
+class Diagnostic:
+    file: str
+    line: int
+    column: Optional[int]
+    severity: str
+    message: str
+    notes: list[str] = field(default_factory=list)
+    targets: list[str] = field(default_factory=list)
+
+    def key(self) -> tuple[str, int, Optional[int], str, str]:
+        return (self.file, self.line, self.column, self.severity,
+                self.message)
+
+
+def parse(text: str) -> Optional[Diagnostic]:
+    """ Parse a line of GCC output, returning None if it is not a
+        diagnostic. """
+
+    match = _pattern.match(text.rstrip())
+
+    if match is None:
+        return None
+
+    column = match['column']
+
+    return Diagnostic(
+        normpath(match['file'].replace('\\', '/')),
+        int(match['line']),
+        int(column) if column is not None else None,
+        'error' if match['severity'] == 'fatal error' else match['severity'],
+        match['message']
+    )
+
+
+class Collector:
+    """ Collects the distinct diagnostics in a stream of output lines. """
+
+    def __init__(self, target: str) -> None:
+        self.target = target
+        self.diagnostics: dict[tuple[Any, ...], Diagnostic] = {}
+        self._last: Optional[Diagnostic] = None
+
+    def line(self, text: str) -> None:
+        diagnostic = parse(text)
+
+        if diagnostic is None:
+            return
+
+        if diagnostic.severity == 'note':
+            # Notes explain the diagnostic before them.
+            if self._last is not None:
+                note = (f'{diagnostic.file}:{diagnostic.line}:'
+                        f' {diagnostic.message}')
+
+                if note not in self._last.notes:
+                    self._last.notes.append(note)
+            return
+
+        diagnostic.targets = [self.target]
+
+        self._last = self.diagnostics.setdefault(diagnostic.key(),
+                                                 diagnostic)
+
+    def write(self, path: PathInput) -> None:
+        _write(path, self.diagnostics.values())
+
+
+def merge(paths: Iterable[PathInput], path: PathInput) -> list[Diagnostic]:
+    """ Merge per-target diagnostics files into one, combining diagnostics
+        reported by several targets. Returns the merged diagnostics. """
+
+    merged: dict[tuple[Any, ...], Diagnostic] = {}
+
+    for it in paths:
+        try:
+            with open(it, 'r') as fi:
+                items = json.load(fi)
+        except (FileNotFoundError, ValueError):
+            continue
+
+        for item in items:
+            diagnostic = Diagnostic(**item)
+            existing = merged.setdefault(diagnostic.key(), diagnostic)
+
+            if existing is not diagnostic:
+                existing.targets = sorted(set(existing.targets)
+                                          | set(diagnostic.targets))
+
+    _write(path, merged.values())
+
+    return list(merged.values())
+
+
+def summary(diagnostics: list[Diagnostic]) -> str:
+    errors = sum(1 for it in diagnostics if it.severity == 'error')
+    warnings = len(diagnostics) - errors
+
+    return f'{errors} errors, {warnings} warnings'
+
+
+def _write(path: PathInput, diagnostics: Iterable[Diagnostic]) -> None:
+    items = sorted(diagnostics, key=lambda x: (x.file, x.line,
+                                               x.column or 0))
+
+    json_write(path, [asdict(it) for it in items])
@@ -0,0 +1,153 @@
+""" Minimal reader for ELF files.
+
+    Reads the section headers and the symbol table of 32 and 64 bit ELF
+    files of either byte order, which is all the size reports need, so no
+    toolchain binutils are required.
+"""
+
+from dataclasses import dataclass
+import struct
+
+from mk_build import PathInput
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+
+STT_OBJECT = 1
+STT_FUNC = 2
+
+_formats = {
+    # class: (header, section header, symbol)
+    1: ('HHIIIIIHHHHHH', 'IIIIIIIIII', 'IIIBBH'),
+    2: ('HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'IBBHQQ')
+}
+
+
+class ElfError(Exception):
+    pass
+
+
+@dataclass
+class Section:
+    index: int
+    name: str
+    type: int
+    flags: int
+    address: int
+    size: int
+
+    @property
+    def allocated(self) -> bool:
+        return bool(self.flags & SHF_ALLOC)
+
+
+@dataclass
+class Symbol:
+    name: str
+    value: int
+    size: int
+    type: int
+    section: int
+
+
+@dataclass
+class Elf:
+    machine: int
+    sections: list[Section]
+    symbols: list[Symbol]
+
+
+def read(path: PathInput) -> Elf:
+    with open(path, 'rb') as fi:
+        return parse(fi.read())
+
+
+def parse(data: bytes) -> Elf:
+    if data[:4] != b'\x7fELF':
+        raise ElfError('not an ELF file')
+
+    if len(data) < 16:
+        raise ElfError('truncated ELF header')
+
+    elf_class = data[4]
+    byte_order = {1: '<', 2: '>'}.get(data[5])
+
+    if elf_class not in _formats or byte_order is None:
+        raise ElfError(f'unsupported ELF class {elf_class} or data '
+                       f'encoding {data[5]}')
+
+    (header_format, section_format, symbol_format) = (
+        byte_order + it for it in _formats[elf_class])
+
+    try:
+        header = struct.unpack_from(header_format, data, 16)
+    except struct.error as e:
+        raise ElfError(str(e))
+
+    (_, machine, _, _, _, shoff, _, _, _, _, shentsize, shnum,
+     shstrndx) = header
+
+    raw = []
+
+    try:
+        for index in range(shnum):
+            fields = struct.unpack_from(section_format, data,
+                                        shoff + index * shentsize)
+            raw.append(fields)
+    except struct.error as e:
+        raise ElfError(f'section headers: {e}')
+
+    def contents(fields: tuple[int, ...]) -> bytes:
+        (_, type_, _, _, offset, size) = fields[:6]
+
+        return b'' if type_ == SHT_NOBITS else data[offset:offset + size]
+
+    def linked(index: int) -> bytes:
+        """ Contents of a section that another refers to by index. """
+
+        if index >= len(raw):
+            raise ElfError(f'section index {index} out of range')
+
+        return contents(raw[index])
+
+    # SHN_UNDEF when there are no section names.
+    names = linked(shstrndx) if shstrndx != 0 else b''
+
+    sections = [
+        Section(index, _string(names, it[0]), it[1], it[2], it[3], it[5])
+        for (index, it) in enumerate(raw)
+    ]
+
+    symbols = []
+    symbol_size = struct.calcsize(symbol_format)
+
+    for it in raw:
+        if it[1] != SHT_SYMTAB:
+            continue
+
+        # sh_link of the symbol table is its string table.
+        strings = linked(it[6])
+        table = contents(it)
+
+        for offset in range(0, len(table) - symbol_size + 1, symbol_size):
+            fields = struct.unpack_from(symbol_format, table, offset)
+
+            if elf_class == 1:
+                (name, value, size, info, _, shndx) = fields
+            else:
+                (name, info, _, shndx, value, size) = fields
+
+            symbols.append(Symbol(_string(strings, name), value, size,
+                                  info & 0xf, shndx))
+
+    return Elf(machine, sections, symbols)
+
+
+def _string(table: bytes, offset: int) -> str:
+    end = table.find(b'\0', offset)
+
+    return table[offset:end if end >= 0 else None].decode(errors='replace')
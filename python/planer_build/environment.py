@@ -0,0 +1,108 @@
+""" Probe for the Arduino installation, caching the result in the build
+    directory.
+
+    Running planer_set_env is expensive under WSL, where it calls out to
+    powershell.exe, so the result is reused until one of its inputs changes.
+"""
+
+from importlib.resources import files
+import json
+import os
+from os.path import exists, isabs
+import shutil
+from typing import Any, Optional
+
+import mk_build
+from mk_build import log, Path, PathInput, run
+from mk_build.validate import ensure_type
+
+from .util import json_load, json_write, state_dir, wsl_from_win
+
+_cache_name = 'environment.json'
+
+# Variables read by planer_set_env.
+_probe_vars = (
+    'ARDUINO', 'ARDUINO_CLI', 'ARDUINO_IDE', 'ARDUINO_IDE_DATA', 'HOME',
+    'LOCALAPPDATA', 'PATH', 'POWERSHELL', 'USERNAME', 'USERPROFILE', 'WSL'
+)
+
+_wsl_interop = '/proc/sys/fs/binfmt_misc/WSLInterop'
+
+
+def probe(
+    build: PathInput,
+    wsl: bool,
+    system: Optional[str]
+) -> dict[str, str]:
+    """ Return the Arduino installation paths, running planer_set_env only
+        when the cached result in the build directory is stale. """
+
+    key = _key(wsl, system)
+    cache_path = Path(state_dir(build), _cache_name)
+
+    cached = json_load(cache_path)
+
+    if (isinstance(cached, dict) and cached.get('key') == key
+            and cached.get('mtimes') == _mtimes(cached['environment'])):
+        log.debug(f'environment cache hit {cache_path}')
+
+        return ensure_type(cached['environment'], dict)
+
+    environment = _run(wsl, system)
+
+    json_write(cache_path, {
+        'key': key,
+        'mtimes': _mtimes(environment),
+        'environment': environment
+    })
+
+    return environment
+
+
+def _run(wsl: bool, system: Optional[str]) -> dict[str, str]:
+    if wsl:
+        env = {'WSL': 'y'}
+    else:
+        env = {}
+
+    set_env = mk_build.path(
+        ensure_type(files('planer_build.tools'), Path),
+        'planer_set_env'
+    )
+
+    result = run([set_env], env=env, capture_output=True)
+
+    stdout = json.loads(result.stdout)
+
+    if system == 'wsl':
+        for it in ('arduino', 'arduino_ide', 'arduino_ide_data',
+                   'arduino_cli'):
+            stdout[it] = wsl_from_win(stdout[it])
+
+    return ensure_type(stdout, dict)
+
+
+def _key(wsl: bool, system: Optional[str]) -> dict[str, Any]:
+    return {
+        'environ': {it: os.environ.get(it) for it in _probe_vars},
+        'wsl': wsl or exists(_wsl_interop),
+        'system': system
+    }
+
+
+def _mtimes(environment: dict[str, str]) -> dict[str, Optional[int]]:
+    """ Modification times of the resolved binaries, so that reinstalling
+        or upgrading the IDE or arduino-cli invalidates the cache. """
+
+    result = {}
+
+    for it in ('arduino_ide', 'arduino_cli'):
+        value = environment.get(it, '')
+        binary = value if isabs(value) else shutil.which(value)
+
+        try:
+            result[it] = os.stat(binary).st_mtime_ns if binary else None
+        except OSError:
+            result[it] = None
+
+    return result
@@ -0,0 +1,99 @@
+""" Flashing many boards at once.
+
+    Each port is flashed by a worker of a bounded pool, with the uploader's
+    output captured in a log file per port. Ports that fail are retried.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from glob import glob
+from os import makedirs
+import time
+from typing import BinaryIO, Callable, Optional
+
+from mk_build import log, Path, PathInput
+
+from .util import port_file_name
+
+# Pause before retrying a port, to let a board that reset come back.
+retry_delay = 1.0
+
+
+@dataclass
+class PortResult:
+    port: str
+    returncode: int
+    attempts: int
+    seconds: float
+    log: Path
+
+
+def ports(
+    names: Optional[list[str]],
+    patterns: Optional[list[str]]
+) -> list[str]:
+    """ Return the ports named directly or matching the glob patterns, in
+        order and without duplicates. """
+
+    result = list(names or [])
+
+    for it in patterns or []:
+        result += sorted(glob(it))
+
+    return list(dict.fromkeys(result))
+
+
+def flash(
+    ports: list[str],
+    upload: Callable[[str, BinaryIO], int],
+    log_dir: PathInput,
+    jobs: Optional[int] = None,
+    retries: int = 0
+) -> list[PortResult]:
+    """ Run upload for every port concurrently. upload is called with the
+        port and the port's log file and returns an exit status. """
+
+    makedirs(log_dir, exist_ok=True)
+
+    def flash_port(port: str) -> PortResult:
+        log_path = Path(log_dir, f'{port_file_name(port)}.log')
+        start = time.monotonic()
+
+        with open(log_path, 'wb') as fo:
+            for attempt in range(1, retries + 2):
+                fo.write(f'=== {port}: attempt {attempt}\n'.encode())
+                fo.flush()
+
+                returncode = upload(port, fo)
+
+                if returncode == 0:
+                    break
+
+                log.info(f'{port}: attempt {attempt} failed with'
+                         f' {returncode}')
+
+                if attempt <= retries:
+                    time.sleep(retry_delay)
+
+        return PortResult(port, returncode, attempt,
+                          time.monotonic() - start, log_path)
+
+    with ThreadPoolExecutor(jobs or len(ports) or 1) as executor:
+        return list(executor.map(flash_port, ports))
+
+
+def summary(results: list[PortResult]) -> str:
+    lines = [f'{"port":<24} {"result":<6} {"attempts":>8} {"seconds":>8}'
+             '  log']
+
+    for it in results:
+        status = 'pass' if it.returncode == 0 else 'FAIL'
+
+        lines.append(f'{it.port:<24} {status:<6} {it.attempts:>8}'
+                     f' {it.seconds:>8.1f}  {it.log}')
+
+    failed = sum(1 for it in results if it.returncode != 0)
+
+    lines.append(f'{len(results) - failed} passed, {failed} failed')
+
+    return '\n'.join(lines)
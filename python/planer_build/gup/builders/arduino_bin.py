@@ -1,41 +1,403 @@
 #!/usr/bin/env python
 
 from dataclasses import dataclass, field
+import os
+from os.path import exists
+import sys
+import time
+from typing import Any, Optional
 
 from mk_build import *
 import mk_build.config as config_
 import planer_build.configure as planer_config_
+from planer_build import artifacts
+from planer_build import boards
+from planer_build import deps
+from planer_build import diagnostics
+from planer_build import elf
+from planer_build import outputs
+from planer_build import profile
+from planer_build import size
+from planer_build import stack
+from planer_build.cache import BuildCache
+from planer_build.schedule import History
 from planer_build.tools import arduino_cli
 
-config = config_.get()
-planer_config = planer_config_.get()
-
 
 @dataclass
 class ArduinoBin(Target):
-    """ Builds .elf and associated files using arduino-cli compile. """
+    """ Builds .elf and associated files using arduino-cli compile.
+
+        The files the last compile depended on are recorded next to the
+        output. When none of them changed, arduino-cli is not run. """
 
     libraries: Path = field(default_factory=Path)
 
     def update(self) -> CompletedProcess[bytes]:
         super().update()
 
-        Path(self.sources[0]).touch()
+        recorder = profile.recorder(str(config.target))
+        start = profile.now()
+
+        result = self._update(recorder)
+
+        if recorder is not None:
+            recorder.span(str(config.target), 'target', start,
+                          args={'returncode': result.returncode})
+
+        return result
+
+    def _update(
+        self,
+        recorder: Optional[profile.Recorder]
+    ) -> CompletedProcess[bytes]:
+        sketch = Path(self.sources[0])
+        output = build_dir()
+        build_path = path(output, deps.build_path_name, sketch.name)
+
+        stamp = deps.Stamp.load(path(output, f'{sketch.name}.deps.json'))
+        key = self._key(sketch)
 
-        return arduino_cli.compile(
-            self.sources[0],
-            build_dir(),
-            self.libraries
+        if (exists(path(output, f'{sketch.name}.elf'))
+                and stamp.current(key)):
+            log.info(f'{sketch.name}: up to date')
+
+            deps.declare(stamp.files)
+
+            return CompletedProcess([], 0)
+
+        properties = self._build_properties()
+
+        store = artifacts.open_store(
+            os.environ.get(artifacts.store_variable)
+            or planer_config.artifacts.store
         )
 
+        if store is not None:
+            artifact_inputs = self._artifact_inputs(sketch)
+            artifact_key = self._artifact_key(artifact_inputs)
+
+            data = store.get(artifact_key)
+
+            if data is not None and artifacts.unpack(data, output):
+                log.info(f'{sketch.name}: restored {artifact_key[:16]}')
+
+                within_budget = self._post_link(sketch, output)
+                self._record(sketch, output, build_path)
+
+                if self._stack_usage():
+                    self._stack_restored(sketch, output)
+
+                if not within_budget:
+                    return CompletedProcess([], 1)
+
+                stamp.write(key, artifact_inputs)
+                deps.declare(artifact_inputs)
+
+                return CompletedProcess([], 0)
+
+        cache = BuildCache(
+            planer_config.cache.path,
+            planer_config.cache.max_size_mb
+        )
+
+        build_cache_path = cache.entry(
+            arduino_cli.fqbn(),
+            ensure_type(planer_config.arduino.version, str),
+            arduino_cli.compile_flags + properties
+        )
+
+        start = time.monotonic()
+
+        collector = diagnostics.Collector(str(config.target))
+
+        # Phases are recognized in arduino-cli's verbose output.
+        tracker = profile.PhaseTracker(recorder) if recorder else None
+
+        def on_line(text: str) -> None:
+            collector.line(text)
+
+            if tracker is not None:
+                tracker.line(text)
+
+        result = arduino_cli.compile(
+            sketch,
+            output,
+            self.libraries,
+            build_path=build_path,
+            build_cache_path=build_cache_path,
+            verbose=True if tracker else None,
+            on_line=on_line,
+            build_properties=properties
+        )
+
+        if tracker is not None:
+            tracker.finish()
+
+        collector.write(path(output, f'{sketch.name}{diagnostics.suffix}'))
+
+        if result.returncode == 0:
+            History(environ('top_build_dir')).record(
+                str(config.target),
+                time.monotonic() - start
+            )
+
+            inputs = self._inputs(sketch) + deps.harvest(
+                build_path,
+                config.system.build.system == 'wsl'
+            )
+
+            within_budget = self._post_link(sketch, output)
+
+            if self._stack_usage():
+                self._stack_report(sketch, output, build_path)
+
+            if within_budget:
+                stamp.write(key, inputs)
+                deps.declare(inputs)
+
+                if store is not None:
+                    store.put(artifact_key, artifacts.pack(
+                        self._artifacts(sketch, output)))
+            else:
+                # Without a stamp, the next build checks the budget again.
+                result = CompletedProcess(result.args, 1)
+
+        # Outputs of a failed compile are recorded too, so that they are
+        # cleaned and their diagnostics are reported.
+
+        self._record(sketch, output, build_path)
+
+        return result
+
+    def _post_link(self, sketch: Path, output: Path) -> bool:
+        """ Report the flash and RAM used by the .elf and return whether
+            they are within the configured budget. """
+
+        target = str(config.target)
+
+        try:
+            report = size.analyse(path(output, f'{sketch.name}.elf'), target)
+        except (OSError, elf.ElfError) as e:
+            log.warning(f'{sketch.name}.elf: {e}')
+            return True
+
+        top = environ('top_build_dir')
+        previous = size.history(top, target)
+
+        eprint(size.summary(report, previous[-1] if previous else None))
+
+        # The link succeeded; failing to keep the report must not fail
+        # the build.
+
+        try:
+            size.write(report, path(output, f'{sketch.name}{size.suffix}'))
+            size.record(top, report)
+        except OSError as e:
+            log.warning(f'{sketch.name}: {e}')
+
+        errors = size.check(report, planer_config.budget.flash,
+                            planer_config.budget.ram)
+
+        for it in errors:
+            eprint(it)
+
+        return not errors
+
+    def _stack_usage(self) -> bool:
+        return bool(os.environ.get(stack.variable))
+
+    def _stack_report(
+        self,
+        sketch: Path,
+        output: Path,
+        build_path: Path
+    ) -> None:
+        """ Report the worst-case stack depth from the stack usage and
+            call graph files of the compile, with the headroom left by the
+            static RAM. """
+
+        functions = stack.collect(build_path)
+
+        if not functions:
+            log.warning(f'{sketch.name}: no stack usage files in'
+                        f' {build_path}')
+            return
+
+        try:
+            machine = elf.read(path(output, f'{sketch.name}.elf')).machine
+        except (OSError, elf.ElfError) as e:
+            log.warning(f'{sketch.name}.elf: {e}')
+            return
+
+        usage = size.load(path(output, f'{sketch.name}{size.suffix}'))
+
+        report = stack.analyse(
+            functions,
+            str(config.target),
+            machine,
+            None if usage is None else usage.ram,
+            planer_config_.board_ram(planer_config)
+        )
+
+        stack.write(report, path(output, f'{sketch.name}{stack.suffix}'))
+
+        eprint(stack.details(report))
+
+    def _stack_restored(self, sketch: Path, output: Path) -> None:
+        """ Repeat the stack report of a restored artifact. """
+
+        report = stack.load(path(output, f'{sketch.name}{stack.suffix}'))
+
+        if report is not None:
+            eprint(stack.details(report))
+
+    def _record(self, sketch: Path, output: Path, build_path: Path) -> None:
+        outputs.record(
+            environ('top_build_dir'),
+            str(config.target),
+            [it for it in Path(output).iterdir()
+             if it.name.startswith(f'{sketch.name}.')],
+            [build_path]
+        )
+
+    def _artifacts(self, sketch: Path, output: Path) -> list[Path]:
+        """ Files produced by the compile, without the dependency stamp. """
+
+        return [it for it in Path(output).iterdir()
+                if it.name.startswith(f'{sketch.name}.')
+                and it.name != f'{sketch.name}.deps.json'
+                and it.is_file()]
+
+    def _artifact_inputs(self, sketch: Path) -> list[Path]:
+        return self._inputs(sketch) + self._library_files()
+
+    def _artifact_key(self, inputs: list[Path]) -> str:
+        parameters = self._artifact_parameters()
+
+        if planer_config.environment:
+            # platform.local.txt holds paths of this machine, so its
+            # contents are keyed without them.
+
+            platform_local = planer_config_.platform_local_path(planer_config)
+            inputs = [it for it in inputs if it != platform_local]
+
+            parameters['platform_local'] = planer_config_.platform_local_key(
+                planer_config,
+                environ('top_build_dir'),
+                config.system.build.system == 'wsl'
+            )
+
+        return artifacts.key(self._named(inputs), parameters)
+
+    def _artifact_parameters(self) -> dict[str, Any]:
+        result = {
+            'fqbn': arduino_cli.fqbn(),
+            'version': planer_config.arduino.version,
+            'flags': arduino_cli.compile_flags,
+            'variant': planer_config.variant
+        }
+
+        # Only artifacts built with the flags carry a stack report.
+
+        if self._stack_usage():
+            result['stack_usage'] = stack.flags
+
+        return result
+
+    def _library_files(self) -> list[Path]:
+        result = []
+
+        for (dir_path, dir_names, file_names) in os.walk(self.libraries):
+            dir_names[:] = sorted(it for it in dir_names
+                                  if not it.startswith('.'))
+
+            result += [Path(dir_path, it) for it in file_names]
+
+        return result
+
+    def _named(self, paths: list[Path]) -> dict[str, Path]:
+        """ Key files by names that do not depend on where the source and
+            build directories are. """
+
+        result = {}
+
+        for it in paths:
+            for top in (top_source_dir(), environ('top_build_dir')):
+                if Path(it).is_relative_to(top):
+                    name = str(Path(it).relative_to(top))
+                    break
+            else:
+                name = Path(it).name
+
+            result[name] = Path(it)
+
+        return result
+
+    def _key(self, sketch: Path) -> dict[str, Any]:
+        """ Inputs that are not files: the board, core version and the set
+            of files making up the sketch. """
+
+        return {
+            'fqbn': arduino_cli.fqbn(),
+            'version': planer_config.arduino.version,
+            'verbose': config.verbose,
+            'properties': self._build_properties(),
+            'sketch': [str(it) for it in deps.sketch_files(sketch)]
+        }
+
+    def _build_properties(self) -> list[str]:
+        result = []
+
+        if self._stack_usage():
+            result += [f'compiler.{it}.extra_flags={stack.flags}'
+                       for it in ('c', 'cpp')]
+
+        if planer_config.variant is None:
+            return result
+
+        # platform.local.txt puts the config.h of the top build directory
+        # on the include path. A variant has its own.
+
+        flags = planer_config_.build_extra_flags(
+            environ('top_build_dir'),
+            config.system.build.system == 'wsl'
+        )
+
+        return result + [f'build.extra_flags={flags}']
+
+    def _inputs(self, sketch: Path) -> list[Path]:
+        result = deps.sketch_files(sketch)
+
+        # config.h only includes the headers of the subsystems, which hold
+        # the configuration.
+
+        result += sorted(Path(environ('top_build_dir')).glob('config*.h'))
+
+        if planer_config.environment:
+            result.append(planer_config_.platform_local_path(planer_config))
+
+        return result
+
 
 if __name__ == '__main__':
+    config = config_.get()
+    planer_config = planer_config_.get()
+
     libraries = path(top_source_dir(), 'libraries')
 
-    sources = top_source_dir_add(
-        [path(ensure_type(config.target, Path)).with_suffix('')]
+    # Targets below a board's directory are built for that board.
+
+    (board, sketch) = boards.split(
+        ensure_type(config.target, Path),
+        planer_config
     )
 
+    if board is not None:
+        planer_config.select_board(board)
+
+    sources = top_source_dir_add([sketch.with_suffix('')])
+
     builder = ArduinoBin(libraries=libraries, sources=sources)
 
-    builder.update()
+    sys.exit(builder.update().returncode)
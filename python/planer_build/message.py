@@ -4,6 +4,8 @@ arduino_ide_error_not_found = (
 'Arduino IDE installation was not detected. Tried "{}"'
 )
 
+board_not_configured = 'Board "{}" is not configured.'
+
 build_dir_not_found = 'Build directory "{}" does not exist.'
 
 build_dir_bad_location = (
@@ -11,4 +13,78 @@ build_dir_bad_location = (
 --build option to specify the build directory.'''
 )
 
-platform_build_extra_flags = 'platform.local.txt: replace build.extra_flags with {}'
+platform_local_replace = 'platform.local.txt: replace {} with {}'
+
+platform_local_remove = 'platform.local.txt: remove {}'
+
+compiler_cache_wsl = (
+'The compiler cache is not supported on WSL, where the Windows toolchain is used.'
+)
+
+clean_nothing_recorded = 'No outputs are recorded for {}'
+
+monitor_open_failed = 'Cannot open {}: {}'
+
+upload_failed = 'Upload failed on {}'
+
+upload_no_ports = 'No ports match {}'
+
+config_invalid = 'Invalid configuration in {}:\n{}'
+
+schema_missing = '  {}: missing'
+
+schema_invalid_type = '  {}: expected {}, got {}'
+
+schema_invalid_choice = '  {}: {} is not one of {}'
+
+motor_profile_numpy = (
+'NumPy is needed to compute the [motor.profile] tables: {}'
+)
+
+motor_profile_invalid = 'motor.profile.{} is {}, it must be greater than {}'
+
+motor_profile_overflow = (
+'''The motor ramp needs intervals of {} ticks, which do not fit {} bit
+entries with ticks of {} us. Increase motor.profile.tick_us or
+motor.profile.entry_bits.'''
+)
+
+motor_profile_inaccurate = (
+'''The motor ramp table is {:.2f}% off the analytic profile, more than
+the tolerance of {:.2f}%. Increase motor.profile.table_size or decrease
+motor.profile.tick_us.'''
+)
+
+pins_invalid = 'Pins that do not exist on {}:\n{}'
+
+pins_unknown_board = (
+'No pin map for {}. config_pins.h has no direct port access for it.'
+)
+
+serve_running = 'A build server is already listening on {}'
+
+serve_listening = 'Serving build and upload requests on {}, press Ctrl-C to stop.'
+
+serve_connection_lost = 'Lost the connection to the build server.'
+
+serve_watch = 'scon build --watch does not run in the build server.'
+
+variants_invalid = 'Invalid variants in {}:\n{}'
+
+variants_not_configured = (
+'No variants are configured. Use scon configure --matrix to configure them.'
+)
+
+watch_upload = (
+'scon build --upload is only used with --watch. Run scon upload after the build.'
+)
+
+watch_failed = (
+'Building {} targets failed. Waiting for changes, press Ctrl-C to stop.'
+)
+
+watch_waiting = 'Built {} targets. Waiting for changes, press Ctrl-C to stop.'
+
+size_budget_exceeded = '{}: {} usage of {} bytes exceeds the budget of {} bytes'
+
+size_not_built = 'No size reports found. Build the targets first.'
@@ -0,0 +1,276 @@
+""" Serial monitor reading any number of ports with asyncio.
+
+    Each port is read as soon as data arrives, so that the kernel's input
+    buffer does not overflow at high baud rates. Lines are stamped with the
+    monotonic time since the monitor started and written to the terminal
+    and to a size-rotated log file per port. Memory use is bounded: a line
+    longer than max_line bytes is emitted in pieces.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+import os
+import sys
+import termios
+import time
+from typing import Any, BinaryIO, Optional
+
+from mk_build import log, Path, PathInput
+
+from .error import FatalError
+from .message import monitor_open_failed
+from .util import port_file_name
+
+default_baud = 115200
+
+max_line = 4096
+
+_read_size = 65536
+
+
+def open_port(path: str, baud: int) -> int:
+    """ Open a serial port in raw mode at the given baud rate and return
+        its file descriptor. """
+
+    try:
+        speed = getattr(termios, f'B{baud}')
+    except AttributeError:
+        raise ValueError(f'unsupported baud rate {baud}')
+
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+
+    try:
+        attrs = termios.tcgetattr(fd)
+
+        # Raw 8N1 without flow control, equivalent to cfmakeraw.
+        attrs[0] = 0
+        attrs[1] = 0
+        attrs[2] = termios.CS8 | termios.CREAD | termios.CLOCAL
+        attrs[3] = 0
+        attrs[4] = speed
+        attrs[5] = speed
+        attrs[6][termios.VMIN] = 1
+        attrs[6][termios.VTIME] = 0
+
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except BaseException:
+        os.close(fd)
+        raise
+
+    return fd
+
+
+class RotatingLog:
+    """ A log file that is renamed to <path>.1, <path>.2 and so on when it
+        reaches max_bytes, keeping at most backups old files. """
+
+    def __init__(
+        self,
+        path: PathInput,
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 5
+    ) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file: BinaryIO = open(self.path, 'ab')
+        self.size = self.file.tell()
+
+    def write(self, data: bytes) -> None:
+        if self.size + len(data) > self.max_bytes and self.size > 0:
+            self._rotate()
+
+        self.file.write(data)
+        self.size += len(data)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def _rotate(self) -> None:
+        self.file.close()
+
+        for it in range(self.backups - 1, 0, -1):
+            source = Path(f'{self.path}.{it}')
+
+            if source.exists():
+                source.replace(f'{self.path}.{it + 1}')
+
+        if self.backups > 0:
+            self.path.replace(f'{self.path}.1')
+        else:
+            self.path.unlink()
+
+        self.file = open(self.path, 'ab')
+        self.size = 0
+
+
+@dataclass
+class _Port:
+    name: str
+    fd: int
+    log: Optional[RotatingLog]
+    pending: bytes = b''
+    lines: int = 0
+    closed: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class Monitor:
+    """ Reads lines from serial ports until stopped or until every port
+        is closed. """
+
+    def __init__(
+        self,
+        ports: list[str],
+        baud: int = default_baud,
+        log_dir: Optional[PathInput] = None,
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 5,
+        output: Optional[BinaryIO] = None
+    ) -> None:
+        self.names = ports
+        self.baud = baud
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.output = output
+        self.start = time.monotonic()
+        self.stopped = asyncio.Event()
+        self.ports: list[_Port] = []
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        if self.log_dir is not None:
+            os.makedirs(self.log_dir, exist_ok=True)
+
+        try:
+            for name in self.names:
+                self._open(loop, name)
+
+            closed: asyncio.Future[Any] = asyncio.gather(
+                *(it.closed.wait() for it in self.ports))
+            stopped: asyncio.Future[Any] = asyncio.ensure_future(
+                self.stopped.wait())
+
+            try:
+                await asyncio.wait([closed, stopped],
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                closed.cancel()
+                stopped.cancel()
+        finally:
+            # Including the ports opened before one failed to open.
+
+            for it in self.ports:
+                self._close(it)
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def _open(self, loop: asyncio.AbstractEventLoop, name: str) -> None:
+        try:
+            fd = open_port(name, self.baud)
+        except OSError as e:
+            raise FatalError(str.format(monitor_open_failed, name,
+                                        e.strerror or e))
+
+        port = _Port(name, fd, None)
+        self.ports.append(port)
+
+        if self.log_dir is not None:
+            port.log = RotatingLog(
+                Path(self.log_dir, f'{port_file_name(name)}.log'),
+                self.max_bytes,
+                self.backups
+            )
+
+        loop.add_reader(fd, self._read, port)
+
+        log.info(f'monitor {name} at {self.baud} baud')
+
+    def _read(self, port: _Port) -> None:
+        try:
+            data = os.read(port.fd, _read_size)
+        except BlockingIOError:
+            return
+        except OSError:
+            # EIO when the device goes away or a pseudo-terminal's other
+            # side is closed.
+            data = b''
+
+        if not data:
+            self._close(port)
+            return
+
+        *lines, pending = (port.pending + data).split(b'\n')
+
+        # Emit overlong lines in pieces to bound memory.
+        while len(pending) > max_line:
+            lines.append(pending[:max_line])
+            pending = pending[max_line:]
+
+        port.pending = pending
+
+        for it in lines:
+            self._emit(port, it)
+
+        if port.log is not None:
+            port.log.flush()
+
+        if self.output is not None:
+            self.output.flush()
+
+    def _emit(self, port: _Port, line: bytes) -> None:
+        elapsed = time.monotonic() - self.start
+        stamped = b'[%12.6f] %s\n' % (elapsed, line.rstrip(b'\r'))
+
+        port.lines += 1
+
+        if port.log is not None:
+            port.log.write(stamped)
+
+        if self.output is not None:
+            if len(self.ports) > 1:
+                self.output.write(port.name.encode() + b': ')
+
+            self.output.write(stamped)
+
+    def _close(self, port: _Port) -> None:
+        if port.closed.is_set():
+            return
+
+        asyncio.get_running_loop().remove_reader(port.fd)
+
+        if port.pending:
+            self._emit(port, port.pending)
+            port.pending = b''
+
+        os.close(port.fd)
+
+        if port.log is not None:
+            port.log.close()
+
+        port.closed.set()
+
+        log.info(f'monitor {port.name} closed after {port.lines} lines')
+
+
+def run(
+    ports: list[str],
+    baud: int = default_baud,
+    log_dir: Optional[PathInput] = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backups: int = 5
+) -> None:
+    """ Monitor ports, echoing to the terminal, until interrupted. """
+
+    monitor = Monitor(ports, baud, log_dir, max_bytes, backups,
+                      sys.stdout.buffer)
+
+    try:
+        asyncio.run(monitor.run())
+    except KeyboardInterrupt:
+        pass
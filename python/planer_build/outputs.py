@@ -0,0 +1,196 @@
+""" Records of the files each target's builder produced.
+
+    Builders record their outputs in the build directory, one file per
+    target so that concurrent builders never write the same file. scon
+    clean removes exactly the recorded outputs.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import os
+from os import makedirs
+import shutil
+from typing import Iterable, Optional
+
+from mk_build import log, Path, PathInput
+
+from .util import json_load, json_write, state_dir
+
+outputs_dir_name = 'outputs'
+
+
+@dataclass
+class Outputs:
+    """ Files and directories produced by a target, relative to the top
+        build directory. """
+
+    target: str
+    files: list[str] = field(default_factory=list)
+    dirs: list[str] = field(default_factory=list)
+
+
+@dataclass
+class CleanReport:
+    files: list[Path] = field(default_factory=list)
+    dirs: list[Path] = field(default_factory=list)
+
+
+def record(
+    top_build_dir: PathInput,
+    target: str,
+    files: Iterable[PathInput],
+    dirs: Iterable[PathInput] = ()
+) -> None:
+    """ Record the outputs of a target, replacing any earlier record. """
+
+    top = Path(top_build_dir)
+
+    def relative(it: PathInput) -> str:
+        return str(Path(it).absolute().relative_to(top.absolute()))
+
+    # gup keeps its own state for the target next to it.
+    gup_state = Path(top, target).parent / '.gup' / f'{Path(target).name}.deps'
+
+    json_write(_record_path(top, target), {
+        'target': target,
+        'files': sorted({relative(it) for it in files}
+                        | {relative(gup_state)}),
+        'dirs': sorted(relative(it) for it in dirs)
+    })
+
+
+def load(top_build_dir: PathInput) -> list[Outputs]:
+    result = []
+
+    directory = Path(state_dir(top_build_dir), outputs_dir_name)
+
+    if not directory.is_dir():
+        return result
+
+    for it in sorted(directory.iterdir()):
+        data = json_load(it)
+
+        if isinstance(data, dict) and 'target' in data:
+            result.append(Outputs(data['target'], data.get('files', []),
+                                  data.get('dirs', [])))
+
+    return result
+
+
+def selected(target: str, selectors: Optional[list[str]]) -> bool:
+    """ Whether a target is named by one of the selectors: the target
+        itself, a directory containing it or the directory's all target. """
+
+    if not selectors:
+        return True
+
+    for it in selectors:
+        it = it.rstrip('/')
+
+        if it == 'all':
+            return True
+
+        if it.endswith('/all'):
+            it = it[:-len('/all')]
+
+        if target == it or target.startswith(f'{it}/'):
+            return True
+
+    return False
+
+
+def clean(
+    top_build_dir: PathInput,
+    targets: Optional[list[str]] = None,
+    dry_run: bool = False,
+    jobs: Optional[int] = None
+) -> CleanReport:
+    """ Remove the recorded outputs of the selected targets, or of all
+        targets, and prune directories left empty. """
+
+    top = Path(top_build_dir)
+    report = CleanReport()
+    records = []
+
+    for it in load(top):
+        if not selected(it.target, targets):
+            continue
+
+        records.append(it)
+
+        report.files += [Path(top, x) for x in it.files
+                         if Path(top, x).exists()]
+        report.dirs += [Path(top, x) for x in it.dirs
+                        if Path(top, x).is_dir()]
+
+    if dry_run:
+        return report
+
+    with ThreadPoolExecutor(jobs) as executor:
+        # Split large directories so their contents are removed in
+        # parallel.
+
+        work = list(report.files)
+        trees = []
+
+        for it in report.dirs:
+            for child in it.iterdir():
+                if child.is_dir() and not child.is_symlink():
+                    trees.append(child)
+                else:
+                    work.append(child)
+
+        list(executor.map(_remove, work))
+        list(executor.map(_remove_tree, trees))
+
+    for it in report.dirs:
+        shutil.rmtree(it, ignore_errors=True)
+
+    _prune(top, [it.parent for it in report.files + report.dirs])
+
+    for it in records:
+        _remove(_record_path(top, it.target))
+
+    log.info(f'removed {len(report.files)} files, {len(report.dirs)}'
+             f' directories')
+
+    return report
+
+
+def _record_path(top: Path, target: str) -> Path:
+    name = target.replace('/', '%')
+    directory = Path(state_dir(top), outputs_dir_name)
+
+    makedirs(directory, exist_ok=True)
+
+    return Path(directory, f'{name}.json')
+
+
+def _remove(path: Path) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_tree(path: Path) -> None:
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _prune(top: Path, dirs: list[Path]) -> None:
+    """ Remove empty directories among dirs and their parents below top. """
+
+    candidates = set()
+
+    for it in dirs:
+        while it != top and it.is_relative_to(top):
+            candidates.add(it)
+            it = it.parent
+
+    # Deepest first, so that parents are empty by the time they are tried.
+
+    for it in sorted(candidates, key=lambda x: len(x.parts), reverse=True):
+        try:
+            it.rmdir()
+        except OSError:
+            pass
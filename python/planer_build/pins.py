@@ -0,0 +1,178 @@
+""" Pin maps of the boards scon knows, for direct port access.
+
+    configure resolves each configured pin to its port's registers and its
+    bit in them, so that the firmware can drive step pulses and scan the
+    keypad without digitalWrite's table lookups. The definitions of every
+    configured board are written to config_pins.h, each guarded by the
+    ARDUINO_<build.board> macro the core defines, because one config.h is
+    shared by the boards of a build directory.
+
+    Pins are numbered as in the Arduino variant: D0 is 0 and A0 follows the
+    last digital pin. Register addresses are in the data space, where AVR
+    maps its I/O registers at 0x20 and above.
+"""
+
+from dataclasses import dataclass
+from typing import Union
+
+from .error import FatalError
+from .message import pins_invalid
+
+Assignment = Union[int, list[int]]
+
+
+@dataclass(frozen=True)
+class Port:
+    name: str
+    input: int
+    output: int
+    direction: int
+    set: int
+    clear: int
+    # Digits of the bit in the pin's name, as in PB5 or P111.
+    digits: int = 1
+
+
+@dataclass(frozen=True)
+class Pin:
+    number: int
+    port: Port
+    bit: int
+
+    @property
+    def mask(self) -> int:
+        return 1 << self.bit
+
+    @property
+    def name(self) -> str:
+        return f'{self.port.name}{self.bit:0{self.port.digits}d}'
+
+
+@dataclass(frozen=True)
+class Board:
+    fqbn: str
+    macro: str
+    register_type: str
+    # Whether set and clear are registers that set or clear the pins
+    # written as 1, rather than the output register.
+    set_clear: bool
+    pins: dict[int, Pin]
+
+
+def _avr_port(letter: str, address: int) -> Port:
+    """ PINx, DDRx and PORTx follow each other. """
+
+    return Port(f'P{letter}', address, address + 2, address + 1,
+                address + 2, address + 2)
+
+
+def _ra_port(index: int) -> Port:
+    """ The 16 bit halves of PCNTR1 to PCNTR3 of a RA4M1 I/O port. """
+
+    base = 0x40040000 + index * 0x20
+
+    return Port(f'P{index}', base + 0x4, base + 0x2, base + 0x0,
+                base + 0x8, base + 0xa, 2)
+
+
+def _board(
+    fqbn: str,
+    macro: str,
+    register_type: str,
+    set_clear: bool,
+    pins: list[tuple[Port, int]]
+) -> Board:
+    return Board(fqbn, macro, register_type, set_clear, {
+        number: Pin(number, port, bit)
+        for (number, (port, bit)) in enumerate(pins)
+    })
+
+
+_pb = _avr_port('B', 0x23)
+_pc = _avr_port('C', 0x26)
+_pd = _avr_port('D', 0x29)
+
+_p0 = _ra_port(0)
+_p1 = _ra_port(1)
+_p3 = _ra_port(3)
+
+boards = {it.fqbn: it for it in (
+    # ATmega328P: D0-D7 on PORTD, D8-D13 on PORTB, A0-A5 on PORTC.
+    _board('arduino:avr:uno', 'ARDUINO_AVR_UNO', 'uint8_t', False,
+           [(_pd, it) for it in range(8)]
+           + [(_pb, it) for it in range(6)]
+           + [(_pc, it) for it in range(6)]),
+    # RA4M1, as in the MINIMA variant of ArduinoCore-renesas.
+    _board('arduino:renesas_uno:minima', 'ARDUINO_MINIMA', 'uint16_t',
+           True,
+           [(_p3, 1), (_p3, 2), (_p1, 5), (_p1, 4), (_p1, 3), (_p1, 2),
+            (_p1, 6), (_p1, 7), (_p3, 4), (_p3, 3), (_p1, 12), (_p1, 9),
+            (_p1, 10), (_p1, 11), (_p0, 14), (_p0, 0), (_p0, 1), (_p0, 2),
+            (_p1, 1), (_p1, 0)])
+)}
+
+
+def resolve(
+    board: Board,
+    assignments: dict[str, Assignment]
+) -> dict[str, list[Pin]]:
+    """ Look up the pins assigned to each name. Raises FatalError naming
+        every pin that the board does not have. """
+
+    result: dict[str, list[Pin]] = {}
+    errors = []
+
+    for (name, assigned) in assignments.items():
+        numbers = assigned if isinstance(assigned, list) else [assigned]
+        result[name] = []
+
+        for (index, number) in enumerate(numbers):
+            if number in board.pins:
+                result[name].append(board.pins[number])
+            else:
+                label = name if len(numbers) == 1 else f'{name}[{index}]'
+                errors.append(f'  {label}: pin {number}')
+
+    if errors:
+        raise FatalError(str.format(pins_invalid, board.fqbn,
+                                    '\n'.join(errors)))
+
+    return result
+
+
+def _initializer(pin: Pin) -> str:
+    port = pin.port
+    registers = ', '.join(f'{it:#x}' for it in (
+        port.input, port.output, port.direction, port.set, port.clear,
+        pin.mask))
+
+    return f'{{{registers}}}, // {pin.number}: {pin.name}'
+
+
+def definitions(board: Board, assignments: dict[str, Assignment]) -> str:
+    """ Return the definitions of the pins of a board, guarded by its
+        macro. Assignments of a list of pins become arrays. """
+
+    resolved = resolve(board, assignments)
+
+    lines = [
+        f'#if defined({board.macro})',
+        '#define FAST_PINS 1',
+        f'#define FAST_PIN_SET_CLEAR {int(board.set_clear)}',
+        f'typedef {board.register_type} FastPinRegister;',
+        ''
+    ]
+
+    for (name, assigned) in assignments.items():
+        pins = resolved[name]
+
+        if isinstance(assigned, list):
+            lines.append(f'constexpr FastPin {name}[] = {{')
+            lines += [f'    {_initializer(it)}' for it in pins]
+            lines.append('};')
+        else:
+            initializer = _initializer(pins[0])
+            lines.append(f'constexpr FastPin {name} = '
+                         + initializer.replace('},', '};', 1))
+
+    return '\n'.join(lines + ['#endif']) + '\n'
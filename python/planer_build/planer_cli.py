@@ -1,420 +1,31 @@
 #!/usr/bin/env python
 # PYTHON_ARGCOMPLETE_OK
 
+""" Entry point of the scon command.
+
+    Only the standard library and argcomplete are imported before the
+    command line is parsed, so that --help and shell completion stay fast.
+    The subcommand implementations, and with them mk_build and the project
+    configuration, are loaded once a subcommand runs. argcomplete itself is
+    only loaded when the shell asks for completions. When scon serve runs
+    for the build directory, build and upload are passed to it without
+    loading them at all.
+"""
+
 import argparse
-from dataclasses import dataclass, field
-from importlib.resources import files
-import json
 import os
-from os import chmod
-from os import makedirs, walk
-from os.path import isdir, isfile
-import shutil
-from stat import S_IRUSR, S_IWUSR, S_IRGRP, S_IROTH
+import subprocess
 import sys
-from typing import Any, Tuple
-
-import argcomplete
-import mk_build
-from mk_build.config import Config as BuildConfig
-from mk_build import build_dir, environ, eprint, gup, Path
+from typing import Any, Optional
 
-from mk_build import CompletedProcess, log, run
-from mk_build.validate import ensure_type
-
-import planer_build.configure as configure_
-from planer_build.configure import Config as PlanerConfig
 from .error import FatalError
-from .message import build_dir_bad_location, build_dir_not_found
-from .tools import arduino_cli
-from .util import wsl_from_win
-
-
-_builders_dir = 'builders'
-
-
-def _detect_top_source_dir() -> str:
-    source = os.getcwd()
-    log.info(f'Auto-detected source directory: {source}')
-
-    return source
-
-
-@dataclass
-class CLI:
-    config: PlanerConfig = field(default_factory=PlanerConfig)
-    config_file: BuildConfig = field(default_factory=BuildConfig)
-    environment: dict[str, str] = field(default_factory=dict)
-
-    def init(self, load: bool, **kwargs: Any) -> None:
-        self._init_log(kwargs['log_level'])
-
-        log.debug(f'parsed args {kwargs}')
-
-        # The top build directory will have been set when we imported
-        # mk_build.config above. Override it if provided.
-
-        if 'build' in kwargs and kwargs['build'] is not None:
-            build = str(Path(kwargs['build']).absolute())
-            os.environ['top_build_dir'] = build
-        else:
-            build = ensure_type(environ('top_build_dir'), str)
-
-        path = f'{build}/config.toml'
-
-        if load and isfile(path):
-            self.config = PlanerConfig.from_file(path)
-            self.config_file = BuildConfig.from_file(path)
-
-        # If source argument is present, override config file top_source_dir.
-
-        # If source argument and config file are absent, auto-detect
-        # top_source_dir.
-
-        if kwargs['source'] is None:
-            source = _detect_top_source_dir()
-
-            override_source = self.config_file.top_source_dir is None
-        else:
-            source = kwargs['source']
-            override_source = True
-
-        if override_source:
-            self.config_file.top_source_dir = Path(source)
-
-        # Override config file top_build_dir with build argument or from
-        # environment.
-
-        self.config_file.top_build_dir = Path(build)
-
-        if kwargs['verbose'] != 0:
-            self.config_file.verbose = kwargs['verbose']
-
-        self._validate_dirs()
-
-        # Determine paths for Arduino installation.
-
-        self._environment_import(**kwargs)
-
-    def configure(self, args: argparse.Namespace) -> None:
-        top_build_dir = self.config_file.top_build_dir
-        top_build_dir = ensure_type(top_build_dir, Path)
-
-        top_source_dir = self.config_file.top_source_dir
-        top_source_dir = ensure_type(top_source_dir, Path)
-
-        if args.config is None:
-            scon_config = f'{top_source_dir}/config.toml.default'
-        else:
-            scon_config = f'{args.config}'
-
-        cfg = PlanerConfig.from_file(scon_config)
-
-        def _planer() -> None:
-            """ Write project configuration to config.toml. """
-
-            if not isdir(top_build_dir):
-                eprint(str.format(build_dir_not_found, top_build_dir))
-
-                raise FatalError()
-
-            path = f'{self.config_file.top_build_dir}/config.toml'
-
-            cfg.write_toml(path, 'w')
-
-        def _build() -> None:
-            """ Write build configuration to config.toml. """
-
-            path = f'{self.config_file.top_build_dir}/config.toml'
-
-            log.debug(f'configuration: {self.config_file}')
-            log.debug(f'write configuration: {path}')
-
-            self.config_file.write(path, 'a')
-
-        def _config_h() -> None:
-            """ Write project configuration to config.h. """
-            path = f'{self.config_file.top_build_dir}/config.h'
-
-            cfg.write_config_h(path)
-
-        def _gup() -> None:
-            """ Copy gup files. """
-
-            log.debug(f"source {files('planer_build.gup._build')}")
-
-            fs = files('planer_build.gup')
-
-            log.debug(f'fs {fs}')
-
-            _build = ensure_type(fs.joinpath('_build'), Path)
-
-            attrs = S_IRUSR | S_IWUSR | S_IRGRP | S_IROTH
-
-            top_build_dir = ensure_type(self.config_file.top_build_dir, Path)
-
-            for it in walk(str(_build)):
-                dir_name = Path(it[0]).relative_to(_build)
-
-                dir_names = it[1]
-                file_names = it[2]
-
-                for d in dir_names:
-                    makedirs(
-                        Path(top_build_dir, d),
-                        exist_ok=True
-                    )
-
-                for name in file_names:
-                    source = Path(_build, dir_name, name)
-                    dest = Path(top_build_dir, dir_name)
-                    dest_file = Path(dest, name)
-
-                    # print(f'src {source} dest {dest}')
-
-                    shutil.copy(source, dest)
-                    chmod(dest_file, attrs)
-
-            builders = str(fs.joinpath(_builders_dir))
-
-            for it2 in walk(builders):
-                dir_name = Path(it2[0]).relative_to(builders)
-
-                dir_names = it2[1]
-                file_names = list(
-                    filter(
-                        lambda x: (x == 'Gupfile' or x.endswith('.gup')
-                                   or x.endswith('.py')),
-                        it2[2]
-                    )
-                )
-
-                for d in dir_names:
-                    makedirs(
-                        Path(top_build_dir, d),
-                        exist_ok=True
-                    )
-
-                dest_dir = Path(top_build_dir, _builders_dir)
-                makedirs(dest_dir, exist_ok=True)
-
-                for name in file_names:
-                    source = Path(builders, dir_name, name)
-                    dest = Path(top_build_dir, _builders_dir, dir_name)
-                    dest_file = Path(dest, name)
-
-                    # print(f'src {source} dest {dest}')
-
-                    shutil.copy(source, dest)
-
-                    chmod(dest_file, attrs)
-
-            '''
-            shutil.copytree(
-                _build,
-                self.config_file.top_build_dir,
-                dirs_exist_ok=True
-            )
-            '''
-
-            '''
-            breakpoint()
-
-            log.debug(f'fs {fs}')
 
-            if not fs.is_file():
-                for it in fs.iterdir():
-                    if isdir(it):
-                        shutil.copytree(
-                            it,
-                            self.config_file.top_build_dir,
-                            dirs_exist_ok=True
-                        )
-                    else:
-                        shutil.copy(it, self.config_file.top_build_dir)
-            else:
-                assert False
-                with as_file(fs) as fi:
-                    log.debug(f'fi {fi}')
-
-                    shutil.copytree(
-                        fi,
-                        self.config_file.top_build_dir,
-                        dirs_exist_ok=True
-                    )
-
-            builders_dest = f'{self.config_file.top_build_dir}/builders'
-
-            makedirs(builders_dest, exist_ok=True)
-
-            fs = files('planer_build.gup.builders')
-
-            with as_file(fs) as fi:
-                shutil.copytree(
-                    fi,
-                    builders_dest,
-                    dirs_exist_ok=True
-                )
-            '''
-
-        _planer()
-        _build()
-        _config_h()
-
-        configure_.envrc_write(top_build_dir)
-
-        _gup()
-
-    def init_env(self, args: argparse.Namespace) -> None:
-        if args.shell:
-            configure_.shell_configure()
-
-        if args.arduino_core:
-            # install core for board
-
-            arduino = self.config.arduino
-            core = ensure_type(arduino.core, str)
-            version = ensure_type(arduino.version, str)
-
-            log.info(f'Install core {core}')
-
-            if arduino_cli.core_install(f'{core}@{version}').returncode != 0:
-                raise Exception()
-
-        if args.arduino_ide:
-            # TODO modify settings.json
-
-            # modify platform settings for builds
-            # modify arduino-cli.yaml (sketchbook)
-
-            top_source_dir = self.config_file.top_source_dir
-            top_build_dir = self.config_file.top_build_dir
-
-            top_source_dir = ensure_type(top_source_dir, Path)
-            top_build_dir = ensure_type(top_build_dir, Path)
-
-            configure_.arduino_ide_configure(
-                self.config,
-                self.config_file,
-                top_source_dir,
-                top_build_dir
-            )
-
-    def build(self, args: argparse.Namespace) -> CompletedProcess[bytes]:
-        env = {
-            'ARDUINO_CLI': self.config.environment['arduino_cli']
-        }
-
-        if len(args.targets) == 0:
-            targets = [f'{build_dir()}/all']
-        else:
-            targets = [f'{build_dir()}/{it}' for it in args.targets]
-
-        return ensure_type(
-            gup(targets, jobs=4, env=env),
-            CompletedProcess
-        )
-
-    def clean(self, args: argparse.Namespace) -> None:
-        """ Clean the build directory. """
-
-        (_, build_dir) = self._ensure_dirs()
-
-        def is_config_file(path: Path) -> bool:
-            parent = path.parent.name
-            name = path.name
-
-            return (parent == _builders_dir or name.endswith('.gup')
-                    or name == 'Gupfile' or name == 'config.h'
-                    or name == 'config.toml')
-
-        for it in walk(build_dir):
-            path = Path(it[0])
-            paths = [Path(path, x) for x in it[2]]
-
-            to_delete = list(filter(lambda x: not is_config_file(x), paths))
-            to_delete = [Path(path, x) for x in to_delete]
-
-            for jj in to_delete:
-                os.remove(jj)
-
-    def upload(self, args: argparse.Namespace) -> None:
-        # arduino-cli upload $sketch -b $BOARD -p $port -v && \
-        # arduino-cli upload --input-file $sketch -b $BOARD -p $port -v && \
-        # arduino-cli monitor -q --raw -b $BOARD -p $port -c baudrate=115200
-
-        arduino_cli.upload(args.filename)
-
-    def monitor(self, args: argparse.Namespace) -> None:
-        arduino_cli.monitor()
-
-    def _init_log(self, log_level: int) -> None:
-        if log_level == 0:
-            log_level_str = 'WARNING'
-        if log_level == 1:
-            log_level_str = 'INFO'
-        elif log_level == 2:
-            log_level_str = 'DEBUG'
-
-        log.init(log_level_str)
-
-        if log_level >= 1:
-            log.set_detail(1)
-
-        os.environ['MK_LOG_LEVEL'] = log_level_str
-
-    def _validate_dirs(self) -> Tuple[Path, Path]:
-        (top_source_dir, top_build_dir) = self._ensure_dirs()
-
-        if top_build_dir == top_source_dir:
-            raise ValueError(build_dir_bad_location)
-
-        return (top_source_dir, top_build_dir)
-
-    def _ensure_dirs(self) -> Tuple[Path, Path]:
-        top_build_dir = self.config_file.top_build_dir
-        top_build_dir = ensure_type(top_build_dir, Path)
-
-        top_source_dir = self.config_file.top_source_dir
-        top_source_dir = ensure_type(top_source_dir, Path)
-
-        return (top_source_dir, top_build_dir)
-
-    def _environment_import(self, **kwargs: Any) -> None:
-        if 'wsl' in kwargs and kwargs['wsl']:
-            env = {'WSL': 'y'}
-        else:
-            env = {}
-
-        set_env = mk_build.path(
-            ensure_type(files('planer_build.tools'), Path),
-            'planer_set_env'
-        )
-
-        result = run([set_env], env=env, capture_output=True)
-
-        stdout = json.loads(result.stdout)
-
-        if self.config_file.system.build.system == 'wsl':
-            os.environ['ARDUINO_IDE'] = wsl_from_win(stdout['arduino_ide'])
-            os.environ['ARDUINO_CLI'] = wsl_from_win(stdout['arduino_cli'])
-
-            stdout['arduino'] = wsl_from_win(stdout['arduino'])
-            stdout['arduino_ide'] = wsl_from_win(stdout['arduino_ide'])
-            stdout['arduino_ide_data'] = wsl_from_win(
-                stdout['arduino_ide_data'])
-            stdout['arduino_cli'] = wsl_from_win(stdout['arduino_cli'])
-        else:
-            os.environ['ARDUINO_IDE'] = stdout['arduino_ide']
-            os.environ['ARDUINO_CLI'] = stdout['arduino_cli']
-
-        self.config.environment = stdout
-
-        log.debug(f'environment {self.config.environment}')
+# scripts.modes; scripts imports mk_build.
+install_modes = ('copy', 'symlink', 'hardlink')
 
 
 class Parser:
-    def __init__(self, cli: CLI) -> None:
+    def __init__(self) -> None:
         self.parser = argparse.ArgumentParser(
             prog='ProgramName',
             description='What the program does',
@@ -422,12 +33,15 @@ class Parser:
 
         self.subparsers = self.parser.add_subparsers(required=True)
 
-        self._init_configure(cli)
-        self._init_init_env(cli)
-        self._init_build(cli)
-        self._init_clean(cli)
-        self._init_monitor(cli)
-        self._init_upload(cli)
+        self._init_configure()
+        self._init_init_env()
+        self._init_build()
+        self._init_cache()
+        self._init_clean()
+        self._init_monitor()
+        self._init_serve()
+        self._init_size()
+        self._init_upload()
 
         self.parser.add_argument('-l', '--log-level', type=int, default=0)
         self.parser.add_argument('-v', '--verbose', action='count', default=0)
@@ -435,66 +49,146 @@ class Parser:
         self.parser.add_argument('--build')
         self.parser.add_argument('--wsl', action='store_true')
 
-        argcomplete.autocomplete(self.parser)
+    def parse(self, argv: list[str]) -> argparse.Namespace:
+        if '_ARGCOMPLETE' in os.environ:
+            import argcomplete
+
+            # Exits after printing the completions.
+            argcomplete.autocomplete(self.parser)
+
+        return self.parser.parse_args(argv)
 
-        parsed = self.parser.parse_args(sys.argv[1:])
+    @staticmethod
+    def run(args: argparse.Namespace) -> Any:
+        """ Run the subcommand selected by parsed arguments. """
 
-        func = parsed.func
-        args = parsed
+        from .cli import CLI
 
-        load = func != cli.configure
+        cli = CLI()
+
+        name = args.func
+        load = name != 'configure'
 
         cli.init(load, **vars(args))
 
         del args.func
 
-        func(args)
+        return getattr(cli, name)(args)
 
-    def _init_build(self, cli: CLI) -> None:
+    def _init_build(self) -> None:
         subparser = self.subparsers.add_parser('build')
         subparser.add_argument('targets', nargs='*')
-        subparser.set_defaults(func=cli.build)
-
-    def _init_clean(self, cli: CLI) -> None:
+        subparser.add_argument('-j', '--jobs', type=int)
+        subparser.add_argument('--backend', choices=['cli', 'daemon'])
+        subparser.add_argument('--profile', action='store_true')
+        subparser.add_argument('--stack-usage', action='store_true')
+        subparser.add_argument('-b', '--board', action='append')
+        subparser.add_argument('--all-variants', action='store_true')
+        subparser.add_argument('-w', '--watch', action='store_true')
+        subparser.add_argument('--upload', nargs='?',
+                               const='Planer/Planer.ino.elf')
+        subparser.set_defaults(func='build')
+
+    def _init_cache(self) -> None:
+        subparser = self.subparsers.add_parser('cache')
+        subparser.add_argument('action', choices=['stats', 'prune'])
+        subparser.add_argument('--max-size-mb', type=int)
+        subparser.set_defaults(func='cache')
+
+    def _init_clean(self) -> None:
         subparser = self.subparsers.add_parser('clean')
-        subparser.set_defaults(func=cli.clean)
+        subparser.add_argument('targets', nargs='*')
+        subparser.add_argument('-n', '--dry-run', action='store_true')
+        subparser.add_argument('-j', '--jobs', type=int)
+        subparser.set_defaults(func='clean')
 
-    def _init_configure(self, cli: CLI) -> None:
+    def _init_configure(self) -> None:
         subparser = self.subparsers.add_parser('configure')
         subparser.add_argument('--config', type=str)
-        subparser.set_defaults(func=cli.configure)
+        subparser.add_argument('--install', default='copy',
+                               choices=install_modes)
+        subparser.add_argument('--matrix', type=str)
+        subparser.set_defaults(func='configure')
 
-    def _init_init_env(self, cli: CLI) -> None:
+    def _init_init_env(self) -> None:
         subparser = self.subparsers.add_parser('init')
         subparser.add_argument('--shell', action='store_true')
         subparser.add_argument('--arduino-ide', action='store_true')
         subparser.add_argument('--arduino-core', action='store_true')
-        subparser.set_defaults(func=cli.init_env)
+        subparser.set_defaults(func='init_env')
 
-    def _init_monitor(self, cli: CLI) -> None:
+    def _init_monitor(self) -> None:
         subparser = self.subparsers.add_parser('monitor')
-        subparser.set_defaults(func=cli.monitor)
+        subparser.add_argument('-p', '--port', action='append')
+        subparser.add_argument('--baud', type=int, default=115200)
+        subparser.add_argument('--log-dir')
+        subparser.add_argument('--max-bytes', type=int,
+                               default=10 * 1024 * 1024)
+        subparser.add_argument('--backups', type=int, default=5)
+        subparser.add_argument('--arduino-cli', action='store_true')
+        subparser.set_defaults(func='monitor')
+
+    def _init_size(self) -> None:
+        subparser = self.subparsers.add_parser('size')
+        subparser.add_argument('targets', nargs='*')
+        subparser.add_argument('--history', type=int, default=5)
+        subparser.set_defaults(func='size')
 
-    def _init_upload(self, cli: CLI) -> None:
+    def _init_serve(self) -> None:
+        subparser = self.subparsers.add_parser('serve')
+        subparser.set_defaults(func='serve')
+
+    def _init_upload(self) -> None:
         subparser = self.subparsers.add_parser('upload')
         subparser.add_argument('filename')
         subparser.add_argument('-b', '--board')
-        subparser.add_argument('-p', '--port', type=int)
-        subparser.set_defaults(func=cli.upload)
+        subparser.add_argument('-p', '--port', action='append')
+        subparser.add_argument('-g', '--port-glob', action='append')
+        subparser.add_argument('-j', '--jobs', type=int)
+        subparser.add_argument('-r', '--retries', type=int, default=1)
+        subparser.add_argument('--log-dir')
+        subparser.set_defaults(func='upload')
+
+
+def _serve_request(args: argparse.Namespace) -> Optional[int]:
+    """ Run a command in the build server of its build directory, if one
+        is running and serves the command. """
+
+    from . import serve
+
+    build = args.build or os.environ.get('top_build_dir')
+
+    if (build is None or args.func not in serve.served
+            or getattr(args, 'watch', False)):
+        return None
+
+    return serve.request(os.path.abspath(build), vars(args))
 
 
 def main() -> None:
     try:
-        cli = CLI()
+        parser = Parser()
+        args = parser.parse(sys.argv[1:])
 
-        Parser(cli)
+        returncode = _serve_request(args)
+
+        if returncode is not None:
+            sys.exit(returncode)
+
+        result = Parser.run(args)
     except ValueError as e:
-        eprint(e)
+        print(e, file=sys.stderr)
         sys.exit(1)
     except FatalError as e:
-        eprint(e)
+        print(e, file=sys.stderr)
         sys.exit(1)
 
+    # Builds exceeding a size budget and failed boards or variants fail the
+    # command without raising.
+
+    if isinstance(result, subprocess.CompletedProcess):
+        sys.exit(result.returncode)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,194 @@
+""" Build profiling with Chrome trace event output.
+
+    When profiling, every builder appends complete ('X') trace events for
+    its target and for the phases of arduino-cli's verbose output to a file
+    of its own in a trace directory. The CLI merges these into a single
+    trace, which can be loaded in chrome://tracing or Perfetto, and prints
+    a summary.
+"""
+
+from dataclasses import dataclass
+import json
+import os
+import re
+import time
+from typing import Any, Iterator, Optional
+
+from mk_build import Path, PathInput
+
+# Variable naming the trace directory that builders write events to.
+profile_variable = 'SCON_PROFILE'
+
+# Markers in arduino-cli's verbose output that start each phase.
+phases = (
+    (re.compile(r'^Detecting libraries used'), 'library detection'),
+    (re.compile(r'^Generating function prototypes'), 'sketch preprocessing'),
+    (re.compile(r'^Compiling sketch'), 'sketch compile'),
+    (re.compile(r'^Compiling libraries'), 'library compile'),
+    (re.compile(r'^Compiling core'), 'core compile'),
+    (re.compile(r'^Linking everything together'), 'link'),
+    (re.compile(r'-size(\.exe)?"?\s+-A\s'), 'size')
+)
+
+_end = re.compile(r'^(Sketch uses|Global variables use)')
+
+
+def now() -> int:
+    """ Return the trace clock in microseconds. The monotonic clock is
+        shared by all processes, so events of different builders line
+        up. """
+
+    return time.monotonic_ns() // 1000
+
+
+class Recorder:
+    """ Writes the trace events of one process. """
+
+    def __init__(self, directory: PathInput, thread: str) -> None:
+        self.path = Path(directory, f'{os.getpid()}-{now()}.jsonl')
+        self.tid = os.getpid()
+
+        self._write({'name': 'thread_name', 'ph': 'M', 'pid': 1,
+                     'tid': self.tid, 'args': {'name': thread}})
+
+    def span(
+        self,
+        name: str,
+        category: str,
+        start: int,
+        end: Optional[int] = None,
+        args: Optional[dict[str, Any]] = None
+    ) -> None:
+        if end is None:
+            end = now()
+
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': 1,
+                 'tid': self.tid, 'ts': start, 'dur': end - start}
+
+        if args:
+            event['args'] = args
+
+        self._write(event)
+
+    def _write(self, event: dict[str, Any]) -> None:
+        with open(self.path, 'a') as fi:
+            fi.write(f'{json.dumps(event)}\n')
+
+
+class PhaseTracker:
+    """ Turns arduino-cli output lines into phase spans. """
+
+    def __init__(self, recorder: Recorder) -> None:
+        self.recorder = recorder
+        self.phase: Optional[str] = None
+        self.start = 0
+
+    def line(self, text: str) -> None:
+        for (pattern, name) in phases:
+            if pattern.search(text):
+                if name != self.phase:
+                    self._close()
+                    self.phase = name
+                    self.start = now()
+                return
+
+        if self.phase == 'size' and _end.match(text):
+            self._close()
+
+    def finish(self) -> None:
+        self._close()
+
+    def _close(self) -> None:
+        if self.phase is not None:
+            self.recorder.span(self.phase, 'phase', self.start)
+            self.phase = None
+
+
+def recorder(thread: str) -> Optional[Recorder]:
+    """ Return a recorder if the build is being profiled. """
+
+    directory = os.environ.get(profile_variable)
+
+    if directory is None:
+        return None
+
+    return Recorder(directory, thread)
+
+
+def events(directory: PathInput) -> Iterator[dict[str, Any]]:
+    for it in sorted(Path(directory).glob('*.jsonl')):
+        with open(it, 'r') as fi:
+            for line in fi:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    pass
+
+
+def merge(directory: PathInput, path: PathInput) -> list[dict[str, Any]]:
+    """ Merge the events in a trace directory into a Chrome trace file.
+        Returns the events. """
+
+    result = list(events(directory))
+
+    with open(path, 'w') as fi:
+        json.dump({'traceEvents': result, 'displayTimeUnit': 'ms'}, fi)
+
+    return result
+
+
+@dataclass
+class Total:
+    name: str
+    seconds: float
+    count: int
+
+
+def summary(trace: list[dict[str, Any]]) -> str:
+    """ Return a text summary of per-target and per-phase wall time. """
+
+    threads = {it['tid']: it['args']['name'] for it in trace
+               if it.get('ph') == 'M'}
+
+    targets: dict[str, Total] = {}
+    phase_totals: dict[str, Total] = {}
+    by_target: dict[tuple[str, str], float] = {}
+
+    for it in trace:
+        if it.get('ph') != 'X':
+            continue
+
+        seconds = it['dur'] / 1e6
+        thread = threads.get(it['tid'], str(it['tid']))
+
+        if it['cat'] == 'target':
+            total = targets.setdefault(it['name'], Total(it['name'], 0, 0))
+        elif it['cat'] == 'phase':
+            total = phase_totals.setdefault(it['name'],
+                                            Total(it['name'], 0, 0))
+
+            key = (thread, it['name'])
+            by_target[key] = by_target.get(key, 0) + seconds
+        else:
+            continue
+
+        total.seconds += seconds
+        total.count += 1
+
+    lines = ['target                                      seconds']
+
+    for total in sorted(targets.values(), key=lambda x: -x.seconds):
+        lines.append(f'{total.name:<40} {total.seconds:>10.2f}')
+
+    lines += ['', 'phase                                       seconds']
+
+    for total in sorted(phase_totals.values(), key=lambda x: -x.seconds):
+        lines.append(f'{total.name:<40} {total.seconds:>10.2f}')
+
+    if by_target:
+        ((thread, name), seconds) = max(by_target.items(),
+                                        key=lambda x: x[1])
+
+        lines += ['', f'slowest: {name} of {thread} ({seconds:.2f} s)']
+
+    return '\n'.join(lines)
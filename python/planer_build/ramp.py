@@ -0,0 +1,147 @@
+""" Acceleration ramps of the stepper motor, precomputed for config.h.
+
+    [motor.profile] describes a constant acceleration from rest to a
+    maximum speed. Instead of the firmware computing step intervals with
+    square roots at run time, configure tabulates them. Step n of a ramp
+    from rest starts at t(n) = sqrt(2 n / a), so the ramp to speed v takes
+    v^2 / (2 a) steps.
+
+    The table has at most table_size entries. A longer ramp is divided into
+    blocks of stride steps, and each entry is the mean interval of its
+    block, so that the motor is where the analytic profile puts it at the
+    start of every block. The last entry is the interval at full speed.
+    Intervals are rounded up to timer ticks of tick_us microseconds, so the
+    motor never runs ahead of the profile. Coarser ticks and 16 bit entries
+    save flash; a smaller stride follows the profile more closely.
+
+    The table is checked against the analytic profile before it is
+    written: the motor may reach each step at most tolerance times the
+    ramp's duration earlier or later than the profile does. Mean intervals
+    are furthest off in the first block, by about 0.2 / sqrt(table_size)
+    of the duration. NumPy is needed for [motor.profile] only.
+"""
+
+from dataclasses import dataclass
+import math
+from typing import Any
+
+from .error import FatalError
+from .message import (
+    motor_profile_inaccurate, motor_profile_invalid, motor_profile_numpy,
+    motor_profile_overflow
+)
+
+defaults = {
+    'microstepping': 1,
+    'table_size': 128,
+    'tick_us': 1,
+    'entry_bits': 16,
+    'tolerance': 0.05
+}
+
+
+@dataclass
+class Ramp:
+    intervals: list[int]
+    stride: int
+    tick_us: int
+    entry_bits: int
+    steps: int
+    duration: float
+    error: float
+
+
+def _numpy() -> Any:
+    try:
+        import numpy
+    except ImportError as e:
+        raise FatalError(str.format(motor_profile_numpy, e)) from e
+
+    return numpy
+
+
+def compute(steps_per_revolution: int, profile: dict[str, Any]) -> Ramp:
+    """ Tabulate the ramp described by a [motor.profile] table and check
+        it against the analytic profile. max_speed is in revolutions per
+        minute and acceleration in revolutions per second squared. """
+
+    np = _numpy()
+
+    options = defaults | profile
+
+    steps_per_revolution *= options['microstepping']
+
+    speed = options['max_speed'] / 60 * steps_per_revolution
+    acceleration = options['acceleration'] * steps_per_revolution
+
+    for (name, minimum) in (('max_speed', 0), ('acceleration', 0),
+                            ('table_size', 1), ('tick_us', 0),
+                            ('tolerance', 0)):
+        if not options[name] > minimum:
+            raise FatalError(str.format(motor_profile_invalid, name,
+                                        options[name], minimum))
+
+    tick = options['tick_us'] * 1e-6
+    steps = max(1, math.ceil(speed ** 2 / (2 * acceleration)))
+
+    # One entry is kept for full speed.
+    stride = math.ceil(steps / (options['table_size'] - 1))
+
+    start = np.arange(0, steps, stride)
+    end = np.minimum(start + stride, steps)
+
+    mean = ((np.sqrt(2 * end / acceleration)
+             - np.sqrt(2 * start / acceleration)) / (end - start))
+    mean = np.maximum(mean, 1 / speed)
+
+    ticks = np.ceil(np.append(mean, 1 / speed) / tick - 1e-9)
+
+    if ticks.max() >= 2 ** options['entry_bits']:
+        raise FatalError(str.format(
+            motor_profile_overflow, int(ticks.max()),
+            options['entry_bits'], options['tick_us']))
+
+    ramp = Ramp([int(it) for it in ticks], stride, options['tick_us'],
+                options['entry_bits'], steps,
+                math.sqrt(2 * steps / acceleration), 0.0)
+
+    ramp.error = check(ramp, acceleration)
+
+    if ramp.error > options['tolerance']:
+        raise FatalError(str.format(
+            motor_profile_inaccurate, ramp.error * 100,
+            options['tolerance'] * 100))
+
+    return ramp
+
+
+def check(ramp: Ramp, acceleration: float) -> float:
+    """ Return the largest difference between when the table and the
+        analytic profile reach a step of the ramp, relative to the ramp's
+        duration. Steps at the start and middle of every block are
+        compared. """
+
+    np = _numpy()
+
+    intervals = np.array(ramp.intervals[:-1]) * ramp.tick_us * 1e-6
+    start = np.arange(len(intervals)) * ramp.stride
+    block_start = np.concatenate(([0.0], np.cumsum(intervals * np.minimum(
+        ramp.stride, ramp.steps - start))))[:-1]
+
+    offset = np.array([0, ramp.stride // 2])
+    step = np.minimum((start[:, None] + offset).ravel(), ramp.steps)
+
+    time = (np.repeat(block_start, len(offset))
+            + (step - np.repeat(start, len(offset)))
+            * np.repeat(intervals, len(offset)))
+
+    analytic = np.sqrt(2 * step / acceleration)
+
+    return float(np.abs(time - analytic).max() / ramp.duration)
+
+
+def initializer(ramp: Ramp, per_line: int = 8) -> str:
+    lines = [', '.join(str(x) for x in ramp.intervals[index:index + per_line])
+             for index in range(0, len(ramp.intervals), per_line)]
+
+    return '{\n    ' + ',\n    '.join(lines) + '\n}'
@@ -0,0 +1,164 @@
+""" Job count selection and history based ordering of build targets.
+
+    Builders append the wall time of each target they build to a history
+    file in the build directory. Targets are started longest first, so that
+    the slowest sketch, which is usually the critical path, is not left to
+    run alone at the end of a parallel build.
+"""
+
+import json
+import os
+from typing import Optional
+
+from mk_build import environ, log, Path, PathInput
+
+from .util import state_dir
+
+history_name = 'durations.jsonl'
+
+# Memory assumed to be needed by one compiler job.
+job_memory = 512 * 1024 * 1024
+
+# Weight of the most recent duration in a target's estimate.
+_alpha = 0.5
+
+# Number of durations kept per target when the history is compacted.
+_keep = 10
+
+
+def auto_jobs() -> int:
+    """ Return a job count suited to the CPUs and memory available. """
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    memory = _available_memory()
+
+    if memory is None:
+        return cpus
+
+    return max(1, min(cpus, memory // job_memory))
+
+
+class History:
+    """ Durations of previously built targets, keyed by their path relative
+        to the top build directory. """
+
+    def __init__(self, build: PathInput) -> None:
+        self.path = Path(state_dir(build), history_name)
+
+    def record(self, target: str, seconds: float) -> None:
+        # Builders run concurrently. A single short append is atomic, so
+        # no locking is needed.
+
+        line = json.dumps({'target': target, 'seconds': round(seconds, 3)})
+
+        with open(self.path, 'a') as fi:
+            fi.write(f'{line}\n')
+
+    def durations(self) -> dict[str, list[float]]:
+        result: dict[str, list[float]] = {}
+
+        try:
+            with open(self.path, 'r') as fi:
+                for line in fi:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+
+                    result.setdefault(item['target'], []).append(
+                        item['seconds'])
+        except FileNotFoundError:
+            pass
+
+        return result
+
+    def estimates(self) -> dict[str, float]:
+        result = {}
+
+        for (target, seconds) in self.durations().items():
+            estimate = seconds[0]
+
+            for it in seconds[1:]:
+                estimate = _alpha * it + (1 - _alpha) * estimate
+
+            result[target] = estimate
+
+        return result
+
+    def estimate(
+        self,
+        target: str,
+        estimates: Optional[dict[str, float]] = None
+    ) -> Optional[float]:
+        """ Return the expected duration of a target. An 'all' target is
+            estimated as the sum of the targets below its directory. """
+
+        if estimates is None:
+            estimates = self.estimates()
+
+        if target in estimates:
+            return estimates[target]
+
+        if Path(target).name == 'all':
+            prefix = str(Path(target).parent)
+            prefix = '' if prefix == '.' else f'{prefix}/'
+
+            below = [v for (k, v) in estimates.items()
+                     if k.startswith(prefix)]
+
+            if below:
+                return sum(below)
+
+        return None
+
+    def order(self, targets: list[str]) -> list[str]:
+        """ Sort targets longest first. Targets without history come first,
+            since they may be the slowest. """
+
+        estimates = self.estimates()
+
+        def key(target: str) -> float:
+            estimate = self.estimate(target, estimates)
+
+            return -(estimate if estimate is not None else float('inf'))
+
+        return sorted(targets, key=key)
+
+    def compact(self) -> None:
+        durations = self.durations()
+
+        tmp = f'{self.path}.tmp'
+
+        with open(tmp, 'w') as fi:
+            for (target, seconds) in durations.items():
+                for it in seconds[-_keep:]:
+                    line = json.dumps({'target': target, 'seconds': it})
+                    fi.write(f'{line}\n')
+
+        Path(tmp).replace(self.path)
+
+
+def ordered(targets: list[str]) -> list[str]:
+    """ Order targets of a build script in the top build directory. """
+
+    result = History(str(environ('top_build_dir'))).order(targets)
+
+    log.debug(f'target order {result}')
+
+    return result
+
+
+def _available_memory() -> Optional[int]:
+    try:
+        with open('/proc/meminfo', 'r') as fi:
+            for line in fi:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (FileNotFoundError, ValueError):
+        pass
+
+    return None
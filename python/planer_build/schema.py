@@ -0,0 +1,212 @@
+""" Declarative schema of config.toml.
+
+    The schema describes every section scon reads as a tree of Table, List
+    and Value nodes. compile() turns it once into nested check functions, so
+    validating a configuration is a single pass over the data that collects
+    every problem instead of stopping at the first bad property.
+    Keys the schema does not describe are ignored; config.toml in the build
+    directory also carries the build system's own settings.
+"""
+
+from dataclasses import dataclass, field
+import hashlib
+from typing import Any, Callable, Optional, Union
+
+from .message import (
+    schema_invalid_choice, schema_invalid_type, schema_missing
+)
+
+
+@dataclass(frozen=True)
+class Value:
+    type: type
+    required: bool = True
+    choices: Optional[tuple[Any, ...]] = None
+
+
+@dataclass(frozen=True)
+class List:
+    item: Union['Value', 'Table']
+    required: bool = True
+
+
+@dataclass(frozen=True)
+class Table:
+    keys: dict[str, 'Node'] = field(default_factory=dict)
+    required: bool = True
+
+
+Node = Union[Value, List, Table]
+
+_pin = Value(int)
+
+schema = Table({
+    'log_level': Value(str),
+    'variant': Value(str, False),
+    'arduino': Table({
+        'core': Value(str),
+        'version': Value(str),
+        'board': Value(str),
+        'port': Value(str),
+        'backend': Value(str, False, ('cli', 'daemon')),
+        'boards': List(Table({
+            'name': Value(str),
+            'board': Value(str),
+            'core': Value(str, False),
+            'version': Value(str, False),
+            'port': Value(str, False)
+        }), False)
+    }),
+    'keypad': Table({
+        'row_pins': List(_pin),
+        'column_pins': List(_pin),
+        'driver': Value(str, False, ('digital', 'analog'))
+    }),
+    'motor': Table({
+        'driver': Value(str, True, ('driver', 'full4wire')),
+        'steps_per_revolution': Value(int),
+        'pins': List(_pin),
+        'profile': Table({
+            'max_speed': Value(float),
+            'acceleration': Value(float),
+            'microstepping': Value(int, False, (1, 2, 4, 8, 16, 32)),
+            'table_size': Value(int, False),
+            'tick_us': Value(int, False),
+            'entry_bits': Value(int, False, (16, 32)),
+            'tolerance': Value(float, False)
+        }, False)
+    }),
+    'display': Table({
+        'controller': Value(str, True, ('PCD8544', 'SSD1306')),
+        'buffer_mode': Value(str, True, ('1Page', '2Page', 'Full')),
+        'clock': _pin,
+        'data': _pin,
+        'cs': _pin,
+        'dc': _pin,
+        'reset': _pin,
+        'backlight': _pin
+    }),
+    'cache': Table({
+        'path': Value(str, False),
+        'max_size_mb': Value(int, False)
+    }, False),
+    'artifacts': Table({
+        'store': Value(str, False)
+    }, False),
+    'budget': Table({
+        'flash': Value(int, False),
+        'ram': Value(int, False)
+    }, False),
+    'compiler_cache': Table({
+        'enabled': Value(bool, False),
+        'path': Value(str, False),
+        'max_size_mb': Value(int, False)
+    }, False)
+})
+
+Check = Callable[[Any, str, list[str]], None]
+
+_type_names = {
+    bool: 'boolean', int: 'integer', float: 'float', str: 'string',
+    list: 'array', dict: 'table'
+}
+
+
+def _type_name(type_: type) -> str:
+    return _type_names.get(type_, type_.__name__)
+
+
+def _is(value: Any, type_: type) -> bool:
+    # TOML booleans are not integers, although bool subclasses int.
+
+    if isinstance(value, bool) and type_ is not bool:
+        return False
+
+    # Integers are accepted where a float is expected, as in TOML.
+
+    if type_ is float and isinstance(value, int):
+        return True
+
+    return isinstance(value, type_)
+
+
+def _check_type(
+    name: str,
+    value: Any,
+    type_: type,
+    errors: list[str]
+) -> bool:
+    if _is(value, type_):
+        return True
+
+    errors.append(str.format(schema_invalid_type, name, _type_name(type_),
+                             repr(value)))
+
+    return False
+
+
+def _compile(node: Node) -> Check:
+    if isinstance(node, Value):
+        def value(it: Any, name: str, errors: list[str]) -> None:
+            if (_check_type(name, it, node.type, errors)
+                    and node.choices is not None
+                    and it not in node.choices):
+                errors.append(str.format(
+                    schema_invalid_choice, name, repr(it),
+                    ', '.join(repr(c) for c in node.choices)))
+
+        return value
+
+    if isinstance(node, List):
+        item = _compile(node.item)
+
+        def list_(it: Any, name: str, errors: list[str]) -> None:
+            if _check_type(name, it, list, errors):
+                for index, element in enumerate(it):
+                    item(element, f'{name}[{index}]', errors)
+
+        return list_
+
+    keys = [(key, child.required, _compile(child))
+            for key, child in node.keys.items()]
+
+    def table(it: Any, name: str, errors: list[str]) -> None:
+        if not _check_type(name or 'configuration', it, dict, errors):
+            return
+
+        for key, required, check in keys:
+            if key in it:
+                check(it[key], _join(name, key), errors)
+            elif required:
+                errors.append(str.format(schema_missing, _join(name, key)))
+
+    return table
+
+
+def _join(name: str, key: str) -> str:
+    return f'{name}.{key}' if name else key
+
+
+def compile(node: Node) -> Check:
+    """ Build the validation function for a schema node. """
+
+    return _compile(node)
+
+
+_validate = compile(schema)
+
+version = hashlib.sha256(repr(schema).encode()).hexdigest()[:16]
+""" Identifies the schema, so that cached results of an older one are not
+    reused.
+"""
+
+
+def validate(data: dict[str, Any]) -> list[str]:
+    """ Check parsed configuration data against the schema and return a
+        description of every problem found.
+    """
+
+    errors: list[str] = []
+    _validate(data, '', errors)
+
+    return errors
@@ -0,0 +1,160 @@
+""" Installation of the gup build scripts into a build directory.
+
+    A manifest of the installed scripts and their content hashes is kept in
+    the build directory. Only scripts that changed are installed again, so
+    the others keep their mtimes and gup does not consider their targets
+    dirty, and scripts dropped from the package are removed.
+"""
+
+from dataclasses import dataclass, field
+from importlib.resources import files
+import os
+from os import chmod, makedirs, walk
+from stat import S_IRUSR, S_IWUSR, S_IRGRP, S_IROTH
+import shutil
+
+from mk_build import log, Path, PathInput
+from mk_build.validate import ensure_type
+
+from .deps import digest
+from .util import json_load, json_write, state_dir
+
+builders_dir = 'builders'
+
+modes = ('copy', 'symlink', 'hardlink')
+
+_manifest_name = 'scripts.json'
+
+_attrs = S_IRUSR | S_IWUSR | S_IRGRP | S_IROTH
+
+
+@dataclass
+class SyncReport:
+    added: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return (f'{len(self.added)} added, {len(self.updated)} updated,'
+                f' {len(self.removed)} removed,'
+                f' {len(self.unchanged)} unchanged')
+
+
+def sources() -> dict[str, Path]:
+    """ Return the package's build scripts, keyed by their path relative to
+        the top build directory. """
+
+    fs = files('planer_build.gup')
+
+    result = {}
+
+    _build = ensure_type(fs.joinpath('_build'), Path)
+
+    for (dir_path, _, file_names) in walk(_build):
+        for name in file_names:
+            source = Path(dir_path, name)
+            result[str(source.relative_to(_build))] = source
+
+    builders = ensure_type(fs.joinpath(builders_dir), Path)
+
+    for (dir_path, _, file_names) in walk(builders):
+        for name in file_names:
+            if not (name == 'Gupfile' or name.endswith('.gup')
+                    or name.endswith('.py')):
+                continue
+
+            source = Path(dir_path, name)
+            dest = Path(builders_dir, source.relative_to(builders))
+            result[str(dest)] = source
+
+    return result
+
+
+def sync(top_build_dir: PathInput, mode: str = 'copy') -> SyncReport:
+    """ Install the build scripts into top_build_dir by copying or linking
+        them, leaving unchanged scripts alone. """
+
+    if mode not in modes:
+        raise ValueError(f'invalid install mode "{mode}"')
+
+    manifest_path = Path(state_dir(top_build_dir), _manifest_name)
+    manifest = json_load(manifest_path)
+
+    if not isinstance(manifest, dict):
+        manifest = {'mode': mode, 'files': {}}
+
+    installed: dict[str, str] = manifest.get('files', {})
+    # Installing with a different mode replaces every script.
+    replace = manifest.get('mode') != mode
+    current: dict[str, str] = {}
+
+    report = SyncReport()
+
+    for (name, source) in sorted(sources().items()):
+        dest = Path(top_build_dir, name)
+        checksum = ensure_type(digest(source), str)
+
+        current[name] = checksum
+
+        if (not replace and installed.get(name) == checksum
+                and _installed(dest, source, mode)):
+            report.unchanged.append(name)
+            continue
+
+        (report.updated if name in installed else report.added).append(name)
+
+        log.info(f'install {dest}')
+
+        _install(source, dest, mode)
+
+    for name in sorted(set(installed) - set(current)):
+        dest = Path(top_build_dir, name)
+
+        log.info(f'remove stale {dest}')
+
+        try:
+            os.remove(dest)
+        except FileNotFoundError:
+            pass
+
+        report.removed.append(name)
+
+    json_write(manifest_path, {'mode': mode, 'files': current})
+
+    return report
+
+
+def _installed(dest: Path, source: Path, mode: str) -> bool:
+    if mode == 'symlink':
+        return dest.is_symlink() and dest.resolve() == source.resolve()
+
+    if not dest.exists() or dest.is_symlink():
+        return False
+
+    if mode == 'hardlink':
+        return dest.samefile(source)
+
+    return True
+
+
+def _install(source: Path, dest: Path, mode: str) -> None:
+    makedirs(dest.parent, exist_ok=True)
+
+    if dest.exists() or dest.is_symlink():
+        os.remove(dest)
+
+    if mode == 'symlink':
+        os.symlink(source.resolve(), dest)
+        return
+
+    if mode == 'hardlink':
+        try:
+            os.link(source, dest)
+            return
+        except OSError as e:
+            # Hard links cannot cross file systems.
+            log.debug(f'link {source}: {e}; copying')
+
+    shutil.copy(source, dest)
+    chmod(dest, _attrs)
@@ -0,0 +1,305 @@
+""" Build server and its client.
+
+    scon serve listens on a Unix socket in the state directory of a build
+    directory. It runs build and upload requests with one CLI, whose
+    configuration and probed Arduino environment stay loaded between
+    requests, instead of every editor, hook and terminal starting its own.
+
+    Requests run one at a time, in the order they arrive. A request that is
+    identical to one still waiting joins it, so a burst of identical
+    requests becomes one build whose output every client receives. A
+    request identical to the running one waits for the next run, which
+    sees the files as they are after it started.
+
+    The output of a request, including that of the processes it starts, is
+    streamed to its clients with its exit status. The stream is a sequence
+    of frames: a type byte, the length of the payload as 4 bytes and the
+    payload.
+
+    scon passes build and upload commands to the server of their build
+    directory when it is running; see request(). This module imports only
+    the standard library, so that the client part does not slow scon's
+    startup. Set SCON_NO_SERVE to run commands locally regardless.
+"""
+
+from dataclasses import dataclass, field
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import traceback
+from typing import Any, BinaryIO, Callable, Iterator, Optional
+
+from .error import FatalError
+from .message import serve_connection_lost, serve_running
+
+socket_name = 'serve.sock'
+
+disable_variable = 'SCON_NO_SERVE'
+
+# Subcommands that the server runs.
+served = ('build', 'upload')
+
+# Seconds to wait for the output of processes a request left running.
+drain_timeout = 1.0
+
+_stdout = b'1'
+_stderr = b'2'
+_exit = b'x'
+
+_header = struct.Struct('>cI')
+
+
+def socket_path(build: str) -> str:
+    # util.state_dir_name; util imports mk_build.
+    return os.path.join(build, '.scon', socket_name)
+
+
+def _frame(kind: bytes, payload: bytes) -> bytes:
+    return _header.pack(kind, len(payload)) + payload
+
+
+def _frames(stream: BinaryIO) -> Iterator[tuple[bytes, bytes]]:
+    while True:
+        header = stream.read(_header.size)
+
+        if len(header) < _header.size:
+            return
+
+        (kind, size) = _header.unpack(header)
+
+        yield (kind, stream.read(size))
+
+
+def request(build: str, values: dict[str, Any]) -> Optional[int]:
+    """ Run a parsed command in the server of a build directory, copying
+        its output to ours. Returns its exit status, or None if no server
+        is running. """
+
+    path = socket_path(build)
+
+    if os.environ.get(disable_variable) or not os.path.exists(path):
+        return None
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        return None
+
+    # Paths in the arguments are relative to our working directory.
+
+    message = {'cwd': os.getcwd(), 'args': values}
+
+    with connection, connection.makefile('rb') as stream:
+        connection.sendall(json.dumps(message).encode() + b'\n')
+
+        for (kind, payload) in _frames(stream):
+            if kind == _exit:
+                return int(payload)
+
+            output = sys.stdout if kind == _stdout else sys.stderr
+            output.buffer.write(payload)
+            output.buffer.flush()
+
+    print(serve_connection_lost, file=sys.stderr)
+
+    return 1
+
+
+@dataclass
+class Job:
+    cwd: str
+    args: dict[str, Any]
+    key: str
+    frames: list[bytes] = field(default_factory=list)
+    started: bool = False
+    returncode: Optional[int] = None
+
+
+class Server:
+    """ Serves requests on a Unix socket. run is called with the parsed
+        command line of each request and returns its exit status. """
+
+    def __init__(
+        self,
+        path: str,
+        run: Callable[[dict[str, Any]], int]
+    ) -> None:
+        self.path = path
+        self.run = run
+
+        self._queue: list[Job] = []
+        self._condition = threading.Condition()
+
+    def serve(self) -> None:
+        """ Serve until interrupted. """
+
+        listener = self._listen()
+
+        threading.Thread(target=self._work, daemon=True).start()
+
+        try:
+            while True:
+                (connection, _) = listener.accept()
+
+                threading.Thread(target=self._handle, args=(connection,),
+                                 daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            os.unlink(self.path)
+
+    def submit(self, cwd: str, args: dict[str, Any]) -> Job:
+        """ Queue a request, or join an identical one that has not
+            started. """
+
+        key = json.dumps([cwd, args], sort_keys=True)
+
+        with self._condition:
+            for it in self._queue:
+                if it.key == key and not it.started:
+                    return it
+
+            job = Job(cwd, args, key)
+
+            self._queue.append(job)
+            self._condition.notify_all()
+
+        return job
+
+    def _listen(self) -> socket.socket:
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            probe.connect(self.path)
+        except OSError:
+            # Left by a server that did not exit cleanly.
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        else:
+            raise FatalError(str.format(serve_running, self.path))
+        finally:
+            probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen()
+
+        return listener
+
+    def _handle(self, connection: socket.socket) -> None:
+        with connection, connection.makefile('rb') as stream:
+            try:
+                message = json.loads(stream.readline())
+                job = self.submit(message['cwd'], message['args'])
+            except (KeyError, TypeError, ValueError):
+                return
+
+            sent = 0
+
+            try:
+                while True:
+                    with self._condition:
+                        self._condition.wait_for(
+                            lambda: len(job.frames) > sent
+                            or job.returncode is not None)
+
+                        frames = job.frames[sent:]
+                        returncode = job.returncode
+
+                    if frames:
+                        connection.sendall(b''.join(frames))
+                        sent += len(frames)
+                    elif returncode is not None:
+                        connection.sendall(
+                            _frame(_exit, str(returncode).encode()))
+                        return
+            except OSError:
+                # The client went away; the request runs for the others.
+                pass
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: bool(self._queue))
+
+                job = self._queue[0]
+                job.started = True
+
+            returncode = self._capture(job)
+
+            with self._condition:
+                job.returncode = returncode
+                self._queue.pop(0)
+                self._condition.notify_all()
+
+    def _capture(self, job: Job) -> int:
+        """ Run a job with standard output and error, which the processes
+            it starts inherit, redirected to its frames. """
+
+        streams = (sys.stdout, sys.stderr)
+
+        for it in streams:
+            it.flush()
+
+        saved = [os.dup(1), os.dup(2)]
+        readers = []
+        cwd = os.getcwd()
+
+        for (fd, kind) in ((1, _stdout), (2, _stderr)):
+            (read, write) = os.pipe()
+
+            reader = threading.Thread(target=self._forward,
+                                      args=(job, kind, read), daemon=True)
+            reader.start()
+            readers.append(reader)
+
+            os.dup2(write, fd)
+            os.close(write)
+
+        # Our own output goes to the same descriptors, even if the streams
+        # were replaced.
+
+        sys.stdout = open(1, 'w', buffering=1, closefd=False)
+        sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+        try:
+            os.chdir(job.cwd)
+            returncode = self.run(job.args)
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.stdout.close()
+            sys.stderr.close()
+
+            (sys.stdout, sys.stderr) = streams
+
+            os.chdir(cwd)
+
+            for (fd, it) in zip((1, 2), saved):
+                os.dup2(it, fd)
+                os.close(it)
+
+        for it in readers:
+            it.join(drain_timeout)
+
+        return returncode
+
+    def _forward(self, job: Job, kind: bytes, fd: int) -> None:
+        with os.fdopen(fd, 'rb', buffering=0) as stream:
+            while True:
+                data = stream.read(65536)
+
+                if not data:
+                    return
+
+                with self._condition:
+                    job.frames.append(_frame(kind, data))
+                    self._condition.notify_all()
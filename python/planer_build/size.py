@@ -0,0 +1,222 @@
+""" Flash and RAM usage of the built firmware.
+
+    After linking, the sections of the .elf are classified: allocated
+    sections with contents occupy flash, writable ones occupy RAM, so
+    initialized data counts towards both, as in avr-size. The largest
+    functions and objects are listed as well. Each report is saved next to
+    the .elf, and a history of the totals is kept in the build directory
+    so that a build shows how much it grew. Budgets set in config.toml
+    fail the build when exceeded.
+"""
+
+from dataclasses import asdict, dataclass, field
+import json
+import time
+from typing import Any, Optional
+
+from mk_build import Path, PathInput
+
+from . import elf as elf_
+from .message import size_budget_exceeded
+from .util import json_load, json_write, state_dir
+
+suffix = '.size.json'
+
+largest = 20
+
+_history_name = 'sizes.jsonl'
+
+_history_max = 1000
+
+# Sections that are programmed separately from flash on AVR.
+_excluded = ('.eeprom', '.fuse', '.lock', '.signature', '.user_signatures')
+
+
+@dataclass
+class Usage:
+    name: str
+    size: int
+    flash: bool
+    ram: bool
+
+
+@dataclass
+class Report:
+    target: str
+    flash: int = 0
+    ram: int = 0
+    sections: list[Usage] = field(default_factory=list)
+    symbols: list[Usage] = field(default_factory=list)
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> 'Report':
+        return cls(
+            data['target'], data['flash'], data['ram'],
+            [Usage(**it) for it in data['sections']],
+            [Usage(**it) for it in data['symbols']]
+        )
+
+
+def analyse(path: PathInput, target: str) -> Report:
+    """ Measure the flash and RAM used by an .elf. """
+
+    elf = elf_.read(path)
+    report = Report(target)
+
+    counted: dict[int, Usage] = {}
+
+    for it in elf.sections:
+        if (not it.allocated or it.size == 0
+                or it.name.startswith(_excluded)):
+            continue
+
+        usage = Usage(it.name, it.size, it.type != elf_.SHT_NOBITS,
+                      bool(it.flags & elf_.SHF_WRITE))
+
+        report.sections.append(usage)
+        counted[it.index] = usage
+
+        report.flash += it.size if usage.flash else 0
+        report.ram += it.size if usage.ram else 0
+
+    symbols = {}
+
+    for symbol in elf.symbols:
+        section = counted.get(symbol.section)
+
+        if (section is None or symbol.size == 0
+                or symbol.type not in (elf_.STT_OBJECT, elf_.STT_FUNC)):
+            continue
+
+        symbols[(symbol.name, symbol.value)] = Usage(
+            symbol.name, symbol.size, not section.ram, section.ram)
+
+    report.symbols = sorted(symbols.values(),
+                            key=lambda x: (-x.size, x.name))[:largest]
+
+    return report
+
+
+def write(report: Report, path: PathInput) -> None:
+    json_write(path, asdict(report))
+
+
+def load(path: PathInput) -> Optional[Report]:
+    data = json_load(path)
+
+    return Report.from_json(data) if isinstance(data, dict) else None
+
+
+def record(top_build_dir: PathInput, report: Report) -> None:
+    """ Add the totals of a report to the history of the build
+        directory. """
+
+    # Builders run concurrently. A single short append is atomic, so no
+    # locking is needed. The history is trimmed by compact().
+
+    line = json.dumps({
+        'time': time.time(),
+        'target': report.target,
+        'flash': report.flash,
+        'ram': report.ram
+    })
+
+    with open(Path(state_dir(top_build_dir), _history_name), 'a') as fi:
+        fi.write(f'{line}\n')
+
+
+def compact(top_build_dir: PathInput) -> None:
+    """ Keep the most recent entries of the history. Called once a build
+        has finished, when no builder records sizes. """
+
+    path = Path(state_dir(top_build_dir), _history_name)
+    lines = _history_lines(path)
+
+    if len(lines) <= _history_max:
+        return
+
+    tmp = Path(f'{path}.tmp')
+    tmp.write_text(''.join(lines[-_history_max:]))
+    tmp.replace(path)
+
+
+def history(top_build_dir: PathInput, target: str) -> list[dict[str, Any]]:
+    path = Path(state_dir(top_build_dir), _history_name)
+    result = []
+
+    for it in _history_lines(path):
+        try:
+            entry = json.loads(it)
+        except ValueError:
+            continue
+
+        if entry.get('target') == target:
+            result.append(entry)
+
+    return result
+
+
+def _history_lines(path: Path) -> list[str]:
+    try:
+        with open(path, 'r') as fi:
+            return fi.readlines()
+    except FileNotFoundError:
+        return []
+
+
+def check(
+    report: Report,
+    flash: Optional[int],
+    ram: Optional[int]
+) -> list[str]:
+    """ Return a message for each budget the report exceeds. """
+
+    result = []
+
+    for (memory, used, budget) in (('flash', report.flash, flash),
+                                   ('RAM', report.ram, ram)):
+        if budget is not None and used > budget:
+            result.append(str.format(size_budget_exceeded, report.target,
+                                     memory, used, budget))
+
+    return result
+
+
+def _change(value: int, previous: Optional[int]) -> str:
+    if previous is None or previous == value:
+        return ''
+
+    return f' ({value - previous:+d})'
+
+
+def summary(report: Report, previous: Optional[dict[str, Any]]) -> str:
+    """ One line of totals, with the change since the previous build. """
+
+    (flash, ram) = (None, None) if previous is None else (previous['flash'],
+                                                          previous['ram'])
+
+    return (f'{report.target}: flash {report.flash}'
+            f'{_change(report.flash, flash)} bytes, RAM {report.ram}'
+            f'{_change(report.ram, ram)} bytes')
+
+
+def details(report: Report) -> str:
+    lines = [f'{report.target}', '',
+             f'  {"section":<28} {"bytes":>8}  memory']
+
+    for it in report.sections:
+        regions = (('flash', it.flash), ('RAM', it.ram))
+        memory = '+'.join(name for (name, used) in regions if used)
+
+        lines.append(f'  {it.name:<28} {it.size:>8}  {memory}')
+
+    lines += ['', f'  {"largest symbols":<28} {"bytes":>8}  memory']
+
+    for it in report.symbols:
+        lines.append(f'  {it.name[:28]:<28} {it.size:>8}'
+                     f'  {"RAM" if it.ram else "flash"}')
+
+    lines += ['', f'  total flash {report.flash} bytes, RAM {report.ram}'
+              ' bytes']
+
+    return '\n'.join(lines)
@@ -0,0 +1,380 @@
+""" Worst-case stack depth of the built firmware.
+
+    With --stack-usage, every translation unit is compiled with
+    -fstack-usage, which writes the frame size of each function to a .su
+    file, and -fdump-rtl-expand, whose dump names the functions each one
+    calls. GCC's -fcallgraph-info would give both at once, but it needs GCC
+    10 and the AVR core ships GCC 7.
+
+    The deepest call chain is found from each entry point: setup, loop and
+    the interrupt handlers. Interrupts are assumed not to nest, so the
+    worst case is the deepest of setup and loop plus the deepest handler.
+    Recursion, calls through pointers and frames of unbounded size make the
+    result a lower bound, which the report says.
+"""
+
+from dataclasses import asdict, dataclass, field
+import os
+import re
+from typing import Any, Optional
+
+from mk_build import Path, PathInput
+
+from .util import json_load, json_write
+
+# Variable that enables the analysis in the builders.
+variable = 'SCON_STACK_USAGE'
+
+flags = '-fstack-usage -fdump-rtl-expand'
+
+suffix = '.stack.json'
+
+# Bytes a call or an interrupt pushes besides the callee's frame, by ELF
+# machine. ARM saves the return address in a register, which the callee's
+# frame includes when it is pushed.
+call_cost = {83: 2}
+
+_su = re.compile(r'^(.*):(\d+):(\d+):(.*)\t(\d+)\t(\S+)$')
+
+_function = re.compile(r'^;; Function (.*) \((\S+), funcdef_no=')
+
+_direct = re.compile(r'\(call \(mem:\w+ \(symbol_ref:\w+ \("([^"]+)"')
+
+_indirect = re.compile(r'\(call \(mem:\w+ \(reg')
+
+_expand = re.compile(r'\.\d+r\.expand$')
+
+_thread_entries = ('setup', 'loop')
+
+_interrupt = re.compile(r'^(__vector_\d+|\w+_Handler)$')
+
+
+@dataclass
+class Function:
+    name: str
+    symbol: str
+    unit: str
+    frame: Optional[int] = None
+    dynamic: bool = False
+    calls: list[str] = field(default_factory=list)
+    indirect: bool = False
+
+
+@dataclass
+class Entry:
+    name: str
+    depth: int
+    path: list[str]
+    interrupt: bool
+    bounded: bool = True
+    notes: list[str] = field(default_factory=list)
+
+
+@dataclass
+class Report:
+    target: str
+    entries: list[Entry] = field(default_factory=list)
+    worst: int = 0
+    bounded: bool = True
+    static_ram: Optional[int] = None
+    ram: Optional[int] = None
+
+    @property
+    def headroom(self) -> Optional[int]:
+        if self.static_ram is None or self.ram is None:
+            return None
+
+        return self.ram - self.static_ram - self.worst
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> 'Report':
+        return cls(
+            data['target'],
+            [Entry(**it) for it in data['entries']],
+            data['worst'], data['bounded'], data['static_ram'], data['ram']
+        )
+
+
+def short_name(name: str) -> str:
+    """ Reduce a declaration as .su files print it, such as
+        'void Motor::step(int) const', to the name the RTL dump uses,
+        'Motor::step'. Template arguments are dropped from both. """
+
+    name = re.sub(r' \[with .*\]$', '', name)
+    name = re.sub(r'\)[\s\w&]*$', ')', name)
+
+    if name.endswith(')'):
+        level = 0
+
+        for index in range(len(name) - 1, -1, -1):
+            level += {')': 1, '(': -1}.get(name[index], 0)
+
+            if level == 0:
+                name = name[:index]
+                break
+
+    name = _strip_templates(name)
+
+    return name.split()[-1].lstrip('*&') if name.split() else name
+
+
+def _strip_templates(name: str) -> str:
+    result = []
+    level = 0
+
+    for it in name:
+        if it == '<':
+            level += 1
+        elif it == '>' and level > 0:
+            level -= 1
+        elif level == 0:
+            result.append(it)
+
+    return ''.join(result)
+
+
+def _read_su(path: PathInput) -> list[tuple[str, int, bool]]:
+    """ Return the name, frame size and whether the frame is unbounded for
+        each function of a .su file. """
+
+    result = []
+
+    with open(path, 'r', errors='replace') as fi:
+        for it in fi:
+            match = _su.match(it.rstrip('\n'))
+
+            if match is not None:
+                qualifiers = match[6].split(',')
+
+                result.append((
+                    match[4], int(match[5]),
+                    'dynamic' in qualifiers and 'bounded' not in qualifiers
+                ))
+
+    return result
+
+
+def _read_expand(path: PathInput, unit: str) -> list[Function]:
+    result: list[Function] = []
+
+    with open(path, 'r', errors='replace') as fi:
+        for it in fi:
+            match = _function.match(it)
+
+            if match is not None:
+                result.append(Function(_strip_templates(match[1]), match[2],
+                                       unit))
+                continue
+
+            if not result:
+                continue
+
+            match = _direct.search(it)
+
+            if match is not None:
+                if match[1] not in result[-1].calls:
+                    result[-1].calls.append(match[1])
+            elif _indirect.search(it):
+                result[-1].indirect = True
+
+    return result
+
+
+def collect(build_path: PathInput) -> list[Function]:
+    """ Read the .su files and RTL dumps below an arduino-cli build path.
+        Each .su file is paired with the dump of the same translation unit
+        in its directory. """
+
+    result = []
+
+    for (dir_path, _, file_names) in os.walk(str(build_path)):
+        dumps = {_expand.sub('', it): it for it in file_names
+                 if _expand.search(it)}
+
+        for it in sorted(file_names):
+            if not it.endswith('.su'):
+                continue
+
+            stem = it[:-len('.su')]
+            unit = str(Path(dir_path, stem).relative_to(build_path))
+
+            # Newer GCC names dumps after the object and the source suffix,
+            # older ones after the source.
+
+            dump = dumps.get(stem) or next(
+                (x for (name, x) in dumps.items()
+                 if name.startswith(f'{stem}.')
+                 and '.' not in name[len(stem) + 1:]), None)
+
+            functions = ([] if dump is None
+                         else _read_expand(Path(dir_path, dump), unit))
+
+            by_name: dict[str, list[Function]] = {}
+
+            for function in functions:
+                by_name.setdefault(function.name, []).append(function)
+
+            for (name, frame, dynamic) in _read_su(Path(dir_path, it)):
+                # Overloads in one unit cannot be told apart by name, so
+                # each gets the largest of their frames.
+
+                matches = by_name.get(short_name(name))
+
+                if not matches:
+                    matches = [Function(short_name(name), short_name(name),
+                                        unit)]
+                    functions += matches
+
+                for function in matches:
+                    function.frame = max(function.frame or 0, frame)
+                    function.dynamic |= dynamic
+
+            result += functions
+
+    return result
+
+
+class _Graph:
+    def __init__(self, functions: list[Function], cost: int) -> None:
+        self.cost = cost
+        self.units = {(it.unit, it.symbol): it for it in functions}
+        self.symbols: dict[str, list[Function]] = {}
+
+        for it in functions:
+            self.symbols.setdefault(it.symbol, []).append(it)
+
+        self._depths: dict[tuple[str, str], tuple[int, list[str]]] = {}
+        self._active: set[tuple[str, str]] = set()
+        self.notes: set[str] = set()
+
+    def callees(self, function: Function, symbol: str) -> list[Function]:
+        """ A call resolves to a function of the same unit, which may be
+            static, before one defined elsewhere. """
+
+        local = self.units.get((function.unit, symbol))
+
+        return [local] if local is not None else self.symbols.get(symbol, [])
+
+    def depth(self, function: Function) -> tuple[int, list[str]]:
+        """ Return the deepest stack use below a function and the call
+            chain that reaches it. """
+
+        key = (function.unit, function.symbol)
+
+        if key in self._depths:
+            return self._depths[key]
+
+        if key in self._active:
+            self.notes.add(f'recursion through {function.name}')
+            return (0, [])
+
+        self._active.add(key)
+
+        if function.frame is None:
+            self.notes.add(f'unknown frame of {function.name}')
+
+        if function.dynamic:
+            self.notes.add(f'unbounded frame of {function.name}')
+
+        if function.indirect:
+            self.notes.add(f'call through a pointer in {function.name}')
+
+        deepest: tuple[int, list[str]] = (0, [])
+
+        for symbol in function.calls:
+            callees = self.callees(function, symbol)
+
+            if not callees:
+                self.notes.add(f'unknown callee {symbol}')
+                continue
+
+            for callee in callees:
+                (depth, path) = self.depth(callee)
+
+                if depth + self.cost > deepest[0]:
+                    deepest = (depth + self.cost, path)
+
+        self._active.discard(key)
+
+        result = ((function.frame or 0) + deepest[0],
+                  [function.name] + deepest[1])
+
+        self._depths[key] = result
+
+        return result
+
+
+def analyse(
+    functions: list[Function],
+    target: str,
+    machine: int,
+    static_ram: Optional[int] = None,
+    ram: Optional[int] = None
+) -> Report:
+    """ Find the worst-case stack depth of each entry point. machine is
+        the ELF machine of the firmware, static_ram the RAM used by data
+        and ram the RAM of the board. """
+
+    cost = call_cost.get(machine, 0)
+    report = Report(target, static_ram=static_ram, ram=ram)
+
+    for it in functions:
+        interrupt = bool(_interrupt.match(it.name))
+
+        if it.name not in _thread_entries and not interrupt:
+            continue
+
+        # Notes are per entry, so each gets a fresh graph. Graphs are
+        # small; a sketch has a few hundred functions.
+
+        graph = _Graph(functions, cost)
+        (depth, path) = graph.depth(it)
+
+        # An interrupt pushes its return address like a call does.
+
+        entry = Entry(it.name, depth + (cost if interrupt else 0), path,
+                      interrupt, not graph.notes, sorted(graph.notes))
+
+        report.entries.append(entry)
+
+    report.entries.sort(key=lambda x: (x.interrupt, -x.depth, x.name))
+
+    threads = [it for it in report.entries if not it.interrupt]
+    interrupts = [it for it in report.entries if it.interrupt]
+
+    report.worst = (max((it.depth for it in threads), default=0)
+                    + max((it.depth for it in interrupts), default=0))
+    report.bounded = all(it.bounded for it in report.entries)
+
+    return report
+
+
+def write(report: Report, path: PathInput) -> None:
+    json_write(path, asdict(report))
+
+
+def load(path: PathInput) -> Optional[Report]:
+    data = json_load(path)
+
+    return Report.from_json(data) if isinstance(data, dict) else None
+
+
+def details(report: Report) -> str:
+    bound = '' if report.bounded else 'at least '
+
+    lines = [f'{report.target}: worst-case stack {bound}{report.worst}'
+             ' bytes', '', f'  {"entry":<28} {"bytes":>8}  deepest path']
+
+    for it in report.entries:
+        lines.append(f'  {it.name[:28]:<28} {it.depth:>8}'
+                     f'{"+" if not it.bounded else " "} '
+                     f'{" > ".join(it.path)}')
+
+        lines += [f'  {"":<28} {"":>8}   {x}' for x in it.notes]
+
+    if report.static_ram is not None and report.ram is not None:
+        lines += ['', f'  RAM {report.ram} bytes, static'
+                  f' {report.static_ram} bytes, stack {bound}{report.worst}'
+                  f' bytes, headroom {report.headroom} bytes']
+
+    return '\n'.join(lines)
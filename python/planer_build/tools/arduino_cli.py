@@ -1,55 +1,145 @@
 from dataclasses import asdict
 from operator import itemgetter
+import subprocess
+import sys
+from typing import BinaryIO, Callable, Optional, Sequence
 
-from mk_build import CompletedProcess, Path, PathInput, environ, run
+from mk_build import CompletedProcess, Path, PathInput, environ, log, run
 import mk_build.config as config_
 from mk_build.validate import ensure_type
 import planer_build.configure as planer_config_
 from ..util import win_from_wsl
+from .arduino_daemon import Client, client, daemon_variable, DaemonError
 
-config = config_.get()
-planer_config = planer_config_.get()
+
+# Options passed to every compile. They are part of the build cache key.
+compile_flags = ['--optimize-for-debug', '--warnings', 'all']
 
 
 def compile(
     ino_path: PathInput,
-    build_path: PathInput,
-    libraries: Path
+    output_path: PathInput,
+    libraries: Path,
+    build_path: Optional[PathInput] = None,
+    build_cache_path: Optional[PathInput] = None,
+    verbose: Optional[bool] = None,
+    on_line: Optional[Callable[[str], None]] = None,
+    build_properties: Sequence[str] = ()
 ) -> CompletedProcess[bytes]:
-    common = _build_args(board=True, port=True, verbose=True)
+    """ Compile a sketch into output_path. If build_path is given,
+        arduino-cli keeps its intermediate files, including dependency
+        files, there instead of in a temporary directory. The compiled core
+        is cached in build_cache_path if given. build_properties are
+        name=value overrides of the platform's build properties.
+
+        verbose overrides the configured verbosity. If on_line is given,
+        the output is streamed to it line by line as well as echoed. """
+
+    if verbose is None:
+        verbose = config_.get().verbose > 0
+
+    common = _build_args(board=True, port=True)
+
+    if verbose:
+        common.append('-v')
 
     arduino_cli = _arduino_cli()
 
+    convert: Callable[[PathInput], str]
+
     if arduino_cli.endswith('.exe'):
-        ino_path = win_from_wsl(ino_path)
-        libraries_str = win_from_wsl(libraries)
-        build_path = win_from_wsl(build_path)
+        convert = win_from_wsl
     else:
-        libraries_str = str(libraries)
+        convert = str
+
+    daemon = _daemon()
+
+    if daemon is not None:
+        try:
+            return daemon.compile(
+                convert(ino_path),
+                fqbn(),
+                convert(output_path),
+                convert(libraries),
+                None if build_path is None else convert(build_path),
+                None if build_cache_path is None else convert(
+                    build_cache_path),
+                verbose=verbose,
+                on_line=on_line,
+                build_properties=list(build_properties)
+            )
+        except DaemonError as e:
+            log.warning(f'arduino-cli daemon: {e}; running arduino-cli')
+
+    args = [
+        arduino_cli, 'compile', convert(ino_path),
+        '--output-dir', convert(output_path),
+        '--libraries', convert(libraries)
+    ] + compile_flags
 
-    return run([
-        arduino_cli, 'compile', ino_path,
-        '--optimize-for-debug',
-        '--output-dir', build_path,
-        '--warnings', 'all',
-        '--libraries', libraries_str
-    ] + common)
+    if build_path is not None:
+        args += ['--build-path', convert(build_path)]
+
+    if build_cache_path is not None:
+        args += ['--build-cache-path', convert(build_cache_path)]
+
+    for it in build_properties:
+        args += ['--build-property', it]
+
+    if on_line is not None:
+        return _stream(args + common, on_line)
+
+    return run(args + common)
 
 
 def core_install(core: str) -> CompletedProcess[bytes]:
     return run([_arduino_cli(), 'core', 'install', core])
 
 
-def upload(path: str) -> CompletedProcess[bytes]:
-    common = _build_args(board=True, port=True, verbose=True)
+def upload(
+    path: str,
+    port: Optional[str] = None,
+    board: Optional[str] = None,
+    output: Optional[BinaryIO] = None
+) -> CompletedProcess[bytes]:
+    """ Upload a file to the board at port, by default the configured board
+        and port. board is an FQBN. If output is given, the output is
+        written to it instead of the terminal. """
+
+    if port is None:
+        port = ensure_type(planer_config_.get().arduino.port, str)
+
+    if board is None:
+        board = fqbn()
+
+    verbose = config_.get().verbose > 0
+
+    daemon = _daemon() if output is None else None
+
+    if daemon is not None:
+        try:
+            return daemon.upload(path, board, port, verbose=verbose)
+        except DaemonError as e:
+            log.warning(f'arduino-cli daemon: {e}; running arduino-cli')
 
-    return run([_arduino_cli(), 'upload', '--input-file', path] + common)
+    args = [_arduino_cli(), 'upload', '--input-file', path,
+            '-b', board, '-p', port]
+
+    if verbose:
+        args.append('-v')
+
+    if output is not None:
+        log.debug(f'run {args}')
+
+        return subprocess.run(args, stdout=output, stderr=subprocess.STDOUT)
+
+    return run(args)
 
 
-def monitor() -> CompletedProcess[bytes]:
+def monitor(baud: int = 115200) -> CompletedProcess[bytes]:
     common = _build_args(board=True, port=True)
 
-    return run([_arduino_cli(), 'monitor', '-q', '-c', 'baudrate=115200']
+    return run([_arduino_cli(), 'monitor', '-q', '-c', f'baudrate={baud}']
                + common)
 
 
@@ -61,22 +151,64 @@ def _build_args(
     args = []
 
     if board:
-        args += ['-b', _arduino_fqbn()]
+        args += ['-b', fqbn()]
 
     if port:
-        args += ['-p', ensure_type(planer_config.arduino.port, str)]
+        args += ['-p', ensure_type(planer_config_.get().arduino.port, str)]
 
-    if verbose and config.verbose > 0:
+    if verbose and config_.get().verbose > 0:
         args.append('-v')
 
     return args
 
 
+def _stream(
+    args: list[str],
+    on_line: Callable[[str], None]
+) -> CompletedProcess[bytes]:
+    """ Run a command, echoing its output and passing each line to on_line
+        as it arrives. The output is not kept, so memory use does not grow
+        with its size. """
+
+    log.debug(f'run {args}')
+
+    with subprocess.Popen(args, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT) as process:
+        assert process.stdout is not None
+
+        for raw in process.stdout:
+            sys.stdout.buffer.write(raw)
+            on_line(raw.decode(errors='replace').rstrip('\r\n'))
+
+        returncode = process.wait()
+
+    sys.stdout.flush()
+
+    return CompletedProcess(args, returncode)
+
+
+def _daemon() -> Optional[Client]:
+    """ Return a client for the session's arduino-cli daemon, if any. """
+
+    value = environ(daemon_variable)
+
+    if value is None:
+        return None
+
+    try:
+        return client(str(value))
+    except DaemonError as e:
+        log.warning(f'arduino-cli daemon: {e}; running arduino-cli')
+
+        return None
+
+
 def _arduino_cli() -> str:
     return ensure_type(environ('ARDUINO_CLI', 'arduino-cli'), str)
 
 
-def _arduino_fqbn() -> str:
-    core, board = itemgetter('core', 'board')(asdict(planer_config.arduino))
+def fqbn() -> str:
+    core, board = itemgetter('core', 'board')(
+        asdict(planer_config_.get().arduino))
 
     return f'{core}:{board}'
@@ -0,0 +1,370 @@
+""" Backend driving a long-lived arduino-cli daemon.
+
+    Every arduino-cli process loads the package, platform and library
+    indexes before doing any work. A daemon started once per session keeps
+    them loaded, and compile and upload requests are sent to it over gRPC.
+
+    The wire protocol is hidden behind Transport, so that the client can be
+    driven by a stand-in server in tests. The gRPC transport needs the
+    daemon extra and the Python modules generated from arduino-cli's
+    protocol files (package cc.arduino.cli.commands.v1), see arduino_rpc;
+    without them, and whenever the daemon fails, callers fall back to
+    running arduino-cli directly.
+"""
+
+import importlib
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Iterator, Optional, Protocol, Sequence
+
+from mk_build import CompletedProcess, log
+
+from .arduino_rpc import rpc_dir
+
+# Variable passing the daemon address and instance to build scripts, in the
+# form host:port/instance.
+daemon_variable = 'SCON_ARDUINO_DAEMON'
+
+_start_timeout = 30.0
+
+
+class DaemonError(Exception):
+    """ The daemon could not be reached. Callers fall back to running
+        arduino-cli directly. """
+
+
+class CommandError(Exception):
+    """ The daemon ran a command, which failed. """
+
+
+class Transport(Protocol):
+    """ Carries requests to an arduino-cli daemon. Requests and responses
+        are dicts with the field names of the daemon's protocol messages;
+        bytes fields are bytes. """
+
+    def call(
+        self,
+        method: str,
+        request: dict[str, Any]
+    ) -> Iterator[dict[str, Any]]:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+def _import_rpc(name: str) -> Any:
+    """ Import a generated module of the commands package, from the Python
+        path or else from arduino_rpc.rpc_dir(). """
+
+    module = f'cc.arduino.cli.commands.v1.{name}'
+
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        path = str(rpc_dir())
+
+        if path in sys.path:
+            raise
+
+        sys.path.append(path)
+
+    return importlib.import_module(module)
+
+
+class GrpcTransport:
+    """ Transport to the daemon's gRPC ArduinoCoreService. """
+
+    def __init__(self, address: str) -> None:
+        try:
+            import grpc
+            commands_pb2_grpc = _import_rpc('commands_pb2_grpc')
+        except ImportError as e:
+            raise DaemonError(f'gRPC support is not installed: {e}') from e
+
+        self._grpc = grpc
+        self._channel = grpc.insecure_channel(address)
+        self._stub = commands_pb2_grpc.ArduinoCoreServiceStub(self._channel)
+
+    def call(
+        self,
+        method: str,
+        request: dict[str, Any]
+    ) -> Iterator[dict[str, Any]]:
+        from google.protobuf import json_format, message_factory
+
+        # The request messages are spread over several modules of the
+        # package, so look them up through the service.
+        service = _import_rpc('commands_pb2').DESCRIPTOR.services_by_name[
+            'ArduinoCoreService']
+        message = message_factory.GetMessageClass(
+            service.methods_by_name[method].input_type)()
+        json_format.ParseDict(request, message)
+
+        try:
+            responses = getattr(self._stub, method)(message)
+
+            if not hasattr(responses, '__iter__'):
+                responses = [responses]
+
+            for it in responses:
+                yield _message_dict(it)
+        except self._grpc.RpcError as e:
+            if e.code() == self._grpc.StatusCode.UNAVAILABLE:
+                raise DaemonError(f'{method}: {e.details()}') from e
+
+            raise CommandError(e.details()) from e
+
+    def close(self) -> None:
+        self._channel.close()
+
+
+class Client:
+    """ Runs arduino-cli commands on a daemon instance. """
+
+    def __init__(self, transport: Transport, instance: Optional[int] = None):
+        self.transport = transport
+        self.instance = instance
+
+    def init(self) -> int:
+        """ Create and initialize an instance, which loads the indexes. """
+
+        created = next(iter(self.transport.call('Create', {})))
+        self.instance = int(created['instance']['id'])
+
+        for it in self.transport.call('Init', self._instance()):
+            if 'error' in it:
+                raise DaemonError(f"Init: {it['error']}")
+
+        return self.instance
+
+    def compile(
+        self,
+        sketch_path: str,
+        fqbn: str,
+        output_path: str,
+        libraries: str,
+        build_path: Optional[str] = None,
+        build_cache_path: Optional[str] = None,
+        verbose: bool = False,
+        on_line: Optional[Callable[[str], None]] = None,
+        build_properties: Sequence[str] = ()
+    ) -> CompletedProcess[bytes]:
+        request = self._instance() | {
+            'sketchPath': sketch_path,
+            'fqbn': fqbn,
+            'exportDir': output_path,
+            'libraries': [libraries],
+            'optimizeForDebug': True,
+            'warnings': 'all',
+            'verbose': verbose
+        }
+
+        if build_path is not None:
+            request['buildPath'] = build_path
+
+        if build_cache_path is not None:
+            request['buildCachePath'] = build_cache_path
+
+        if build_properties:
+            request['buildProperties'] = list(build_properties)
+
+        return self._stream('Compile', request, on_line)
+
+    def upload(
+        self,
+        input_file: str,
+        fqbn: str,
+        port: str,
+        verbose: bool = False
+    ) -> CompletedProcess[bytes]:
+        request = self._instance() | {
+            'importFile': input_file,
+            'fqbn': fqbn,
+            'port': {'address': port, 'protocol': 'serial'},
+            'verbose': verbose
+        }
+
+        return self._stream('Upload', request)
+
+    def _instance(self) -> dict[str, Any]:
+        if self.instance is None:
+            raise DaemonError('daemon instance is not initialized')
+
+        return {'instance': {'id': self.instance}}
+
+    def _stream(
+        self,
+        method: str,
+        request: dict[str, Any],
+        on_line: Optional[Callable[[str], None]] = None
+    ) -> CompletedProcess[bytes]:
+        """ Run a streaming command, echoing its output as it arrives the
+            way a subprocess would. If on_line is given, the output is
+            passed to it line by line instead of being kept. """
+
+        stdout = bytearray()
+        stderr = bytearray()
+        returncode = 0
+
+        if on_line is not None:
+            lines = (_Lines(on_line), _Lines(on_line))
+        else:
+            lines = None
+
+        try:
+            for it in self.transport.call(method, request):
+                out = it.get('outStream', b'')
+                err = it.get('errStream', b'')
+
+                sys.stdout.buffer.write(out)
+                sys.stderr.buffer.write(err)
+
+                if lines is not None:
+                    lines[0].feed(out)
+                    lines[1].feed(err)
+                else:
+                    stdout += out
+                    stderr += err
+        except CommandError as e:
+            message = f'Error during {method}: {e}\n'.encode()
+
+            sys.stderr.buffer.write(message)
+            stderr += message
+            returncode = 1
+
+        if lines is not None:
+            for stream in lines:
+                stream.flush()
+
+        sys.stdout.flush()
+
+        return CompletedProcess(
+            [method], returncode, bytes(stdout), bytes(stderr))
+
+
+class _Lines:
+    """ Splits streamed output into lines. """
+
+    def __init__(self, on_line: Callable[[str], None]) -> None:
+        self.on_line = on_line
+        self.pending = b''
+
+    def feed(self, data: bytes) -> None:
+        *lines, self.pending = (self.pending + data).split(b'\n')
+
+        for it in lines:
+            self.on_line(it.decode(errors='replace').rstrip('\r'))
+
+    def flush(self) -> None:
+        if self.pending:
+            self.on_line(self.pending.decode(errors='replace'))
+            self.pending = b''
+
+
+class Daemon:
+    """ An arduino-cli daemon process owned by this session. """
+
+    def __init__(
+        self,
+        arduino_cli: str,
+        transport: Callable[[str], Transport] = GrpcTransport
+    ) -> None:
+        self.arduino_cli = arduino_cli
+        self.transport = transport
+        self.process: Optional[subprocess.Popen[bytes]] = None
+        self.address: Optional[str] = None
+        self.instance: Optional[int] = None
+
+    def start(self) -> str:
+        """ Start the daemon and initialize an instance. Returns the value
+            of daemon_variable that lets build scripts use it. """
+
+        port = _free_port()
+
+        self.process = subprocess.Popen(
+            [self.arduino_cli, 'daemon', '--port', str(port)],
+            stdout=subprocess.DEVNULL
+        )
+
+        self.address = f'localhost:{port}'
+
+        _wait_for_port(port, self.process)
+
+        self.instance = Client(self.transport(self.address)).init()
+
+        log.info(f'arduino-cli daemon {self.address}/{self.instance}')
+
+        return f'{self.address}/{self.instance}'
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def __enter__(self) -> 'Daemon':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+
+def client(
+    value: str,
+    transport: Callable[[str], Transport] = GrpcTransport
+) -> Client:
+    """ Return a client for the daemon named by a daemon_variable value. """
+
+    (address, _, instance) = value.rpartition('/')
+
+    if not address:
+        raise DaemonError(f'invalid daemon address "{value}"')
+
+    return Client(transport(address), int(instance))
+
+
+def _message_dict(message: Any) -> dict[str, Any]:
+    """ Convert a response message to a dict, keeping bytes fields as bytes
+        instead of the base64 strings of the JSON mapping. """
+
+    from google.protobuf import json_format
+
+    result: dict[str, Any] = json_format.MessageToDict(message)
+
+    for it in ('out_stream', 'err_stream'):
+        camel = ''.join(x.capitalize() if i else x
+                        for (i, x) in enumerate(it.split('_')))
+
+        if camel in result:
+            result[camel] = getattr(message, it)
+
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+
+        return int(s.getsockname()[1])
+
+
+def _wait_for_port(port: int, process: subprocess.Popen[bytes]) -> None:
+    deadline = time.monotonic() + _start_timeout
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise DaemonError(
+                f'arduino-cli daemon exited with {process.returncode}')
+
+        try:
+            with socket.create_connection(('localhost', port), 0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+
+    process.terminate()
+
+    raise DaemonError('timed out waiting for arduino-cli daemon')
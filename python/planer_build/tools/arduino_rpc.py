@@ -0,0 +1,115 @@
+""" Python modules for the gRPC protocol of the arduino-cli daemon.
+
+    The daemon backend needs the modules generated from arduino-cli's
+    protocol files, package cc.arduino.cli.commands.v1, which are not
+    published as a Python package. They come with the arduino-cli sources,
+    in the rpc directory of the release matching the installed arduino-cli,
+    and are generated once per user with the daemon extra installed:
+
+        pip install planer_build[daemon]
+        git clone -b v<version> https://github.com/arduino/arduino-cli
+        python -m planer_build.tools.arduino_rpc arduino-cli/rpc
+
+    The modules are written to rpc_dir(), where the daemon backend imports
+    them from. The protocol files import google/rpc/status.proto, which
+    googleapis-common-protos provides.
+"""
+
+import argparse
+from importlib.util import find_spec
+import os
+import sys
+from typing import Optional
+
+from mk_build import Path, PathInput
+
+from ..util import user_cache_dir
+
+_package = Path('cc', 'arduino', 'cli', 'commands', 'v1')
+
+
+class RpcError(Exception):
+    pass
+
+
+def rpc_dir() -> Path:
+    """ Return the directory holding the generated modules. """
+
+    return Path(user_cache_dir(), 'arduino-rpc')
+
+
+def _proto_dirs() -> list[str]:
+    """ Return the include directories of the installed protocol files:
+        protobuf's, shipped with grpcio-tools, and google/rpc's, shipped
+        with googleapis-common-protos. """
+
+    result: list[str] = []
+
+    spec = find_spec('grpc_tools')
+
+    if spec is not None and spec.submodule_search_locations:
+        result.append(str(Path(spec.submodule_search_locations[0], '_proto')))
+
+    try:
+        spec = find_spec('google.rpc')
+    except ImportError:
+        spec = None
+
+    if spec is not None and spec.submodule_search_locations:
+        result.append(
+            str(Path(spec.submodule_search_locations[0]).parent.parent))
+
+    return result
+
+
+def generate(proto_dir: PathInput, output: Optional[PathInput] = None) -> Path:
+    """ Generate the modules of the commands package from the protocol
+        files below proto_dir. Returns the output directory. """
+
+    try:
+        from grpc_tools import protoc
+    except ImportError as e:
+        raise RpcError(f'grpcio-tools is not installed: {e}') from e
+
+    result = Path(output) if output is not None else rpc_dir()
+
+    sources = sorted(str(it) for it in Path(proto_dir, _package).glob(
+        '*.proto'))
+
+    if not sources:
+        raise RpcError(f'no protocol files in {Path(proto_dir, _package)}')
+
+    os.makedirs(result, exist_ok=True)
+
+    args = (['protoc']
+            + [f'-I{it}' for it in [str(proto_dir)] + _proto_dirs()]
+            + [f'--python_out={result}', f'--grpc_python_out={result}']
+            + sources)
+
+    if protoc.main(args) != 0:
+        raise RpcError(f'generating the modules from {proto_dir} failed')
+
+    return result
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog='arduino_rpc')
+    parser.add_argument('proto_dir',
+                        help='the rpc directory of the arduino-cli sources')
+    parser.add_argument('--output', help=f'default: {rpc_dir()}')
+
+    args = parser.parse_args(argv)
+
+    try:
+        output = generate(args.proto_dir, args.output)
+    except RpcError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print(f'wrote {output}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,310 @@
+""" Compiler launcher that caches object files.
+
+    scon init --arduino-ide prefixes the core's compile recipes with this
+    launcher when [compiler_cache] is enabled:
+
+        python -m planer_build.tools.ccache --dir DIR --max-size-mb N --
+            <compiler> <flags> -c <source> -o <object>
+
+    The key of an object is a hash of the compiler's identity, its flags
+    and the preprocessed source. Paths below the arduino-cli build path are
+    replaced by a placeholder first, so a translation unit compiled in one
+    build directory is reused in another. The compiler's diagnostics are
+    stored with the object and repeated on a hit. The cache is bounded and
+    evicts the least recently used objects. It is checked against its
+    bound every prune_interval stores, so it may exceed it by the objects
+    stored since.
+
+    This module runs once per translation unit, so it imports nothing
+    beyond the standard library.
+"""
+
+import argparse
+from dataclasses import dataclass
+import hashlib
+import os
+from os import makedirs
+from os.path import realpath
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+_version = b'scon-ccache-1'
+
+_placeholder = b'<build>'
+
+# arduino-cli writes this file into its build path.
+_build_options = 'build.options.json'
+
+_sources = ('.c', '.cc', '.cpp', '.cxx', '.S', '.s')
+
+# Stores between checks of the size of the cache, which reads the whole
+# cache.
+prune_interval = 64
+
+# Grows by a byte per store; its size counts the stores since the last
+# prune.
+_stores_name = 'stores'
+
+# Options that make the compiler write files besides the object, which a
+# hit would not restore.
+_side_outputs = ('-fstack-usage', '-fcallgraph-info', '-fdump-')
+
+
+@dataclass
+class Compile:
+    command: list[str]
+    source: str
+    object: str
+    preprocess: list[str]
+
+
+def parse(command: list[str]) -> Optional[Compile]:
+    """ Recognize a compile of one source file into an object file and
+        derive the command that preprocesses it to stdout. Returns None
+        for anything else, which is run uncached. """
+
+    if '-c' not in command or '-o' not in command[1:-1]:
+        return None
+
+    if any(it.startswith(_side_outputs) for it in command):
+        return None
+
+    index = command.index('-o')
+    obj = command[index + 1]
+
+    sources = [it for it in command[1:]
+               if it.endswith(_sources) and not it.startswith('-')]
+
+    if len(sources) != 1:
+        return None
+
+    args = command[:index] + command[index + 2:]
+    preprocess = ['-E' if it == '-c' else it for it in args]
+
+    # With -MD or -MMD, preprocessing writes the dependency file that the
+    # compile would have written, so it is current on a hit as well.
+
+    if (('-MD' in args or '-MMD' in args) and '-MF' not in args):
+        preprocess += ['-MF', str(Path(obj).with_suffix('.d')), '-MT', obj]
+
+    return Compile(command, sources[0], obj, preprocess)
+
+
+def build_path(obj: str) -> Optional[str]:
+    """ Return the arduino-cli build path that an object is compiled
+        below. """
+
+    for it in Path(obj).absolute().parents:
+        if Path(it, _build_options).exists():
+            return str(it)
+
+    return None
+
+
+class ObjectCache:
+    def __init__(self, path: str, max_size_mb: int = 1024) -> None:
+        self.path = Path(path)
+        self.max_size = max_size_mb * 1024 * 1024
+
+    def run(self, command: list[str]) -> int:
+        compile_ = parse(command)
+
+        if compile_ is None:
+            return subprocess.call(command)
+
+        preprocessed = subprocess.run(compile_.preprocess,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL)
+
+        if preprocessed.returncode != 0:
+            # The compiler reports the error itself.
+            return subprocess.call(command)
+
+        key = self.key(compile_, preprocessed.stdout)
+        entry = Path(self.path, key[:2], key)
+
+        if self._restore(entry, compile_.object):
+            return 0
+
+        result = subprocess.run(command, stderr=subprocess.PIPE)
+
+        sys.stderr.buffer.write(result.stderr)
+        sys.stderr.flush()
+
+        if result.returncode == 0:
+            self._store(entry, compile_.object, result.stderr)
+
+            if self._count_store() % prune_interval == 0:
+                self.prune()
+
+        return result.returncode
+
+    def key(self, compile_: Compile, preprocessed: bytes) -> str:
+        base = build_path(compile_.object)
+
+        def normalize(data: bytes) -> bytes:
+            if base is None:
+                return data
+
+            return data.replace(base.encode(), _placeholder)
+
+        args = [it for it in compile_.command[1:]
+                if it not in (compile_.object, compile_.source)]
+
+        result = hashlib.sha256(_version)
+        result.update(_compiler_identity(compile_.command[0]).encode())
+        result.update(normalize('\0'.join(args).encode()))
+        result.update(b'\0')
+        result.update(normalize(preprocessed))
+
+        return result.hexdigest()
+
+    def _restore(self, entry: Path, obj: str) -> bool:
+        try:
+            with open(entry.with_suffix('.stderr'), 'rb') as fi:
+                stderr = fi.read()
+
+            _copy(entry.with_suffix('.o'), obj)
+        except FileNotFoundError:
+            return False
+
+        # The modification time orders entries for eviction. A prune may
+        # have evicted the entry since it was copied.
+
+        try:
+            os.utime(entry.with_suffix('.o'))
+        except FileNotFoundError:
+            pass
+
+        sys.stderr.buffer.write(stderr)
+        sys.stderr.flush()
+
+        return True
+
+    def _store(self, entry: Path, obj: str, stderr: bytes) -> None:
+        try:
+            makedirs(entry.parent, exist_ok=True)
+
+            # The object is written last, so that it marks a complete
+            # entry.
+
+            _write(entry.with_suffix('.stderr'), stderr)
+            _copy(obj, entry.with_suffix('.o'))
+        except OSError as e:
+            print(f'ccache: {e}', file=sys.stderr)
+
+    def _count_store(self) -> int:
+        """ Count a store and return the number of stores since the last
+            prune. Concurrent launchers append to the same file, so none of
+            their stores is lost. """
+
+        try:
+            fd = os.open(Path(self.path, _stores_name),
+                         os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+        except OSError:
+            return 0
+
+        try:
+            os.write(fd, b'.')
+
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+    def prune(self) -> None:
+        """ Remove the least recently used objects until the cache is
+            within its size. """
+
+        try:
+            os.truncate(Path(self.path, _stores_name), 0)
+        except OSError:
+            pass
+
+        entries = []
+        total = 0
+
+        for it in self.path.glob('*/*.o'):
+            try:
+                st = it.stat()
+            except FileNotFoundError:
+                continue
+
+            entries.append((st.st_mtime, st.st_size, it))
+            total += st.st_size
+
+        if total <= self.max_size:
+            return
+
+        for (_, size, it) in sorted(entries):
+            for suffix in ('.o', '.stderr'):
+                try:
+                    os.remove(it.with_suffix(suffix))
+                except FileNotFoundError:
+                    pass
+
+            total -= size
+
+            # Leave room, so that the next store does not prune again.
+
+            if total <= self.max_size * 0.9:
+                break
+
+
+def _compiler_identity(compiler: str) -> str:
+    path = shutil.which(compiler) or compiler
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return compiler
+
+    return f'{realpath(path)}\0{st.st_size}\0{st.st_mtime_ns}'
+
+
+def _copy(source: Path | str, dest: Path | str) -> None:
+    with open(source, 'rb') as fi:
+        _write(dest, fi.read())
+
+
+def _file_mode() -> int:
+    # util.file_mode; util imports mk_build.
+    umask = os.umask(0)
+    os.umask(umask)
+
+    return 0o666 & ~umask
+
+
+def _write(path: Path | str, data: bytes) -> None:
+    (fd, tmp) = tempfile.mkstemp(dir=Path(path).parent, prefix='.tmp')
+
+    try:
+        os.fchmod(fd, _file_mode())
+
+        with os.fdopen(fd, 'wb') as fo:
+            fo.write(data)
+
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog='ccache')
+    parser.add_argument('--dir', required=True)
+    parser.add_argument('--max-size-mb', type=int, default=1024)
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+
+    args = parser.parse_args(argv)
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+
+    return ObjectCache(args.dir, args.max_size_mb).run(command)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,9 +1,17 @@
+import json
+import os
+from os import makedirs
 from os.path import realpath
+import re
+import tempfile
+from typing import Any
 
-from mk_build import PathInput
+from mk_build import Path, PathInput
 
 wsl_drive = 'Z'
 
+state_dir_name = '.scon'
+
 
 def win_from_wsl(path: PathInput) -> str:
     """ Convert an absolute path on a WSL system into the corresponding
@@ -25,4 +33,102 @@ def wsl_from_win(path: PathInput) -> str:
 
     slashes = str(path).replace('\\', '/')
 
-    return slashes.replace('C:', '/mnt/c')
+    match = re.match(r'([A-Za-z]):(.*)', slashes)
+
+    if match is None:
+        return slashes
+
+    (drive, rest) = match.groups()
+
+    # The drive that win_from_wsl maps the WSL file system to.
+    if drive.upper() == wsl_drive:
+        return rest or '/'
+
+    return f'/mnt/{drive.lower()}{rest}'
+
+
+def port_file_name(port: str) -> str:
+    """ Return a file name, without suffix, for files about a port. """
+
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', port.strip('/'))
+
+
+def user_cache_dir() -> Path:
+    """ Return the per-user cache directory of scon. """
+
+    base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+
+    return Path(base, 'scon')
+
+
+def state_dir(build: PathInput) -> Path:
+    """ Return the directory holding scon's private state for a build
+        directory, creating it if necessary. """
+
+    result = Path(build, state_dir_name)
+    makedirs(result, exist_ok=True)
+
+    return result
+
+
+def json_load(path: PathInput) -> Any:
+    """ Load a JSON file, returning None if it is missing or unreadable. """
+
+    try:
+        with open(path, 'r') as fi:
+            return json.load(fi)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def json_write(path: PathInput, data: Any) -> None:
+    """ Write a JSON file atomically. """
+
+    _replace(path, json.dumps(data, indent=2, sort_keys=True).encode())
+
+
+def file_mode() -> int:
+    """ Return the mode that open() gives new files under the current
+        umask. """
+
+    umask = os.umask(0)
+    os.umask(umask)
+
+    return 0o666 & ~umask
+
+
+def write_if_changed(path: PathInput, data: str) -> bool:
+    """ Write text to a file only if its contents differ, replacing the file
+        atomically. Returns whether the file was written. """
+
+    encoded = data.encode()
+
+    try:
+        with open(path, 'rb') as fi:
+            if fi.read() == encoded:
+                return False
+    except FileNotFoundError:
+        pass
+
+    _replace(path, encoded)
+
+    return True
+
+
+def _replace(path: PathInput, data: bytes) -> None:
+    """ Replace a file atomically through a uniquely named temporary file,
+        so that concurrent writers do not clobber each other's. """
+
+    (fd, tmp) = tempfile.mkstemp(dir=Path(path).parent, prefix='.tmp')
+
+    try:
+        # mkstemp creates the file readable by its owner only.
+        os.fchmod(fd, file_mode())
+
+        with os.fdopen(fd, 'wb') as fo:
+            fo.write(data)
+
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,171 @@
+""" Hardware variants of the project configuration.
+
+    A variants file names each variant and the keys of config.toml it
+    overrides, for example:
+
+        [ssd1306]
+        display = { controller = "SSD1306", buffer_mode = "Full" }
+
+    scon configure --matrix writes one build directory per variant below
+    the top build directory, each with its own config.toml and config.h and
+    links to the one installed copy of the gup scripts. The directories of
+    variants dropped from the file are removed. scon build --all-variants
+    builds them concurrently, one gup process per variant.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import re
+import shutil
+import time
+from typing import Any
+
+from mk_build import CompletedProcess, gup, Path, PathInput
+from mk_build.validate import ensure_type
+import tomlkit
+
+from .error import FatalError
+from .message import variants_invalid
+from .util import json_load, json_write, state_dir
+
+variants_dir_name = 'variants'
+
+# Sections a variant may override.
+sections = ('keypad', 'motor', 'display')
+
+_manifest_name = 'variants.json'
+
+_name_pattern = re.compile(r'[A-Za-z0-9_.-]+')
+
+
+@dataclass
+class Result:
+    variant: str
+    returncode: int
+    seconds: float
+
+
+def load(path: PathInput) -> dict[str, dict[str, Any]]:
+    """ Parse a variants file, reporting every problem at once. """
+
+    with open(path, 'r') as fi:
+        data = tomlkit.parse(fi.read()).unwrap()
+
+    errors = []
+
+    for (name, overrides) in data.items():
+        if not _name_pattern.fullmatch(name):
+            errors.append(f'  {name}: not a valid directory name')
+
+        if not isinstance(overrides, dict):
+            errors.append(f'  {name}: expected table')
+            continue
+
+        for (section, keys) in overrides.items():
+            if section not in sections:
+                errors.append(f'  {name}.{section}: not one of'
+                              f' {", ".join(sections)}')
+            elif not isinstance(keys, dict):
+                errors.append(f'  {name}.{section}: expected table')
+
+    if errors:
+        raise FatalError(str.format(variants_invalid, path,
+                                    '\n'.join(errors)))
+
+    return data
+
+
+def directory(top_build_dir: PathInput, name: str) -> Path:
+    return Path(top_build_dir, variants_dir_name, name)
+
+
+def record(top_build_dir: PathInput, variants: dict[str, Path]) -> None:
+    """ Remember the configured variants of a top build directory. """
+
+    json_write(Path(state_dir(top_build_dir), _manifest_name),
+               {name: str(it) for (name, it) in variants.items()})
+
+
+def configured(top_build_dir: PathInput) -> dict[str, Path]:
+    """ Return the build directories of the configured variants. """
+
+    data = json_load(Path(state_dir(top_build_dir), _manifest_name))
+
+    if not isinstance(data, dict):
+        return {}
+
+    return {name: Path(it) for (name, it) in data.items()}
+
+
+def remove_stale(
+    top_build_dir: PathInput,
+    variants: dict[str, Path]
+) -> list[str]:
+    """ Remove the build directories of the configured variants that are
+        not among the given ones. Returns the names of those removed. """
+
+    result = []
+
+    for (name, it) in configured(top_build_dir).items():
+        if name in variants:
+            continue
+
+        # Only directories that configure --matrix created.
+        if it.is_relative_to(Path(top_build_dir, variants_dir_name)):
+            shutil.rmtree(it, ignore_errors=True)
+
+        result.append(name)
+
+    return result
+
+
+def _build_variant(
+    name: str,
+    build: Path,
+    targets: list[str],
+    jobs: int,
+    env: dict[str, str]
+) -> Result:
+    start = time.monotonic()
+
+    result = ensure_type(
+        gup([f'{build}/{it}' for it in targets], jobs=jobs,
+            env=env | {'top_build_dir': str(build)}),
+        CompletedProcess
+    )
+
+    return Result(name, result.returncode, time.monotonic() - start)
+
+
+def build(
+    variants: dict[str, Path],
+    targets: list[str],
+    jobs: int,
+    env: dict[str, str]
+) -> list[Result]:
+    """ Build the targets in every variant's build directory, each with a
+        gup process of its own and its share of the jobs. The work is done
+        by gup, so threads suffice to wait for it. """
+
+    if not targets:
+        targets = ['all']
+
+    variant_jobs = max(1, jobs // len(variants))
+
+    with ThreadPoolExecutor(len(variants)) as executor:
+        futures = [executor.submit(_build_variant, name, it, targets,
+                                   variant_jobs, env)
+                   for (name, it) in variants.items()]
+
+        return [it.result() for it in futures]
+
+
+def table(results: list[Result]) -> str:
+    lines = [f'{"variant":<24} {"result":<8} {"seconds":>8}']
+
+    for it in results:
+        status = 'ok' if it.returncode == 0 else 'FAILED'
+
+        lines.append(f'{it.variant:<24} {status:<8} {it.seconds:>8.1f}')
+
+    return '\n'.join(lines)
@@ -0,0 +1,286 @@
+""" Watching the source tree for changes.
+
+    scon build --watch waits for changes with inotify, which the standard
+    library does not wrap, so it is called through ctypes. Where inotify
+    is not available the tree is polled instead. Bursts of events, such as
+    an editor saving several files, are collected until the tree has been
+    quiet for a short time and then reported together.
+"""
+
+import ctypes
+import ctypes.util
+import os
+from os import walk
+import select
+import struct
+import time
+from typing import Iterator, Optional, Protocol, Sequence
+
+from mk_build import log, Path, PathInput
+
+debounce = 0.2
+
+poll_interval = 0.5
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+
+_mask = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE
+         | _IN_DELETE)
+
+_event = struct.Struct('iIII')
+
+
+class Watcher(Protocol):
+    def add(self, directory: PathInput, recursive: bool = True) -> None:
+        ...
+
+    def poll(self, timeout: Optional[float]) -> list[Path]:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+def ignored(name: str) -> bool:
+    """ Whether a file name is one of an editor's temporary files. """
+
+    return (name.startswith(('.', '#')) or name.endswith(('~', '.swp'))
+            or name == '4913')
+
+
+def _directories(
+    directory: Path,
+    recursive: bool,
+    exclude: list[Path]
+) -> Iterator[Path]:
+    yield directory
+
+    if not recursive:
+        return
+
+    for (dir_path, dir_names, _) in walk(directory):
+        dir_names[:] = [it for it in dir_names
+                        if not ignored(it)
+                        and Path(dir_path, it) not in exclude]
+
+        for it in dir_names:
+            yield Path(dir_path, it)
+
+
+class Inotify:
+    """ Watches directories with inotify. """
+
+    def __init__(self, exclude: Sequence[PathInput] = ()) -> None:
+        libc_name = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self._exclude = [Path(it) for it in exclude]
+        self._recursive: dict[int, bool] = {}
+        self._directories: dict[int, Path] = {}
+
+    def add(self, directory: PathInput, recursive: bool = True) -> None:
+        for it in _directories(Path(directory), recursive, self._exclude):
+            wd = self._libc.inotify_add_watch(self._fd, bytes(it), _mask)
+
+            if wd < 0:
+                errno = ctypes.get_errno()
+                log.warning(f'watch {it}: {os.strerror(errno)}')
+                continue
+
+            self._directories[wd] = it
+            self._recursive[wd] = recursive
+
+    def poll(self, timeout: Optional[float]) -> list[Path]:
+        (readable, _, _) = select.select([self._fd], [], [], timeout)
+
+        if not readable:
+            return []
+
+        result = []
+
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            result += self._parse(data)
+
+        return result
+
+    def _parse(self, data: bytes) -> list[Path]:
+        result = []
+        offset = 0
+
+        while offset < len(data):
+            (wd, mask, _, length) = _event.unpack_from(data, offset)
+            offset += _event.size
+
+            name = data[offset:offset + length].rstrip(b'\0').decode(
+                errors='surrogateescape')
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                log.warning('watch: events were lost')
+                result += self._directories.values()
+                continue
+
+            if mask & _IN_IGNORED:
+                self._directories.pop(wd, None)
+                continue
+
+            directory = self._directories.get(wd)
+
+            if directory is None or not name or ignored(name):
+                continue
+
+            path = Path(directory, name)
+
+            if (mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO)
+                    and self._recursive[wd] and path not in self._exclude):
+                # Files written into a new directory before its watch was
+                # added would be missed, so they are reported with it.
+
+                self.add(path)
+
+                result += [Path(dir_path, it)
+                           for (dir_path, _, names) in walk(path)
+                           for it in names]
+
+            result.append(path)
+
+        return result
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class Poller:
+    """ Watches directories by comparing modification times. """
+
+    def __init__(self, exclude: Sequence[PathInput] = ()) -> None:
+        self._exclude = [Path(it) for it in exclude]
+        self._roots: list[tuple[Path, bool]] = []
+        self._files: dict[Path, tuple[int, int]] = {}
+
+    def add(self, directory: PathInput, recursive: bool = True) -> None:
+        self._roots.append((Path(directory), recursive))
+        self._files.update(self._scan())
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        result = {}
+
+        for (root, recursive) in self._roots:
+            for directory in _directories(root, recursive, self._exclude):
+                try:
+                    entries = list(os.scandir(directory))
+                except FileNotFoundError:
+                    continue
+
+                for it in entries:
+                    if ignored(it.name) or not it.is_file():
+                        continue
+
+                    st = it.stat()
+                    result[Path(it.path)] = (st.st_mtime_ns, st.st_size)
+
+        return result
+
+    def poll(self, timeout: Optional[float]) -> list[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            files = self._scan()
+
+            changed = [it for it in set(files) | set(self._files)
+                       if files.get(it) != self._files.get(it)]
+
+            self._files = files
+
+            if changed:
+                return changed
+
+            if deadline is None:
+                time.sleep(poll_interval)
+            elif time.monotonic() >= deadline:
+                return []
+            else:
+                time.sleep(min(poll_interval,
+                               max(0, deadline - time.monotonic())))
+
+    def close(self) -> None:
+        pass
+
+
+def watcher(exclude: Sequence[PathInput] = ()) -> Watcher:
+    """ Return an inotify watcher, or a poller where inotify is not
+        available. """
+
+    try:
+        return Inotify(exclude)
+    except (OSError, AttributeError) as e:
+        log.info(f'inotify not available ({e}), polling instead')
+
+        return Poller(exclude)
+
+
+def changes(
+    watcher: Watcher,
+    delay: float = debounce
+) -> Iterator[set[Path]]:
+    """ Yield the paths that changed, once the tree has been quiet for
+        delay seconds after a change. """
+
+    while True:
+        changed = set(watcher.poll(None))
+
+        while True:
+            more = watcher.poll(delay)
+
+            if not more:
+                break
+
+            changed.update(more)
+
+        if changed:
+            yield changed
+
+
+def affected(
+    changed: set[Path],
+    top_source_dir: PathInput,
+    targets: list[str]
+) -> list[str]:
+    """ Return the targets whose sketch directory contains a changed file.
+        A change anywhere else, such as in a library, affects them all. """
+
+    top = Path(top_source_dir)
+    result = []
+
+    for it in changed:
+        owners = [target for target in targets
+                  if it.is_relative_to(Path(top, target).parent)
+                  and Path(target).parent != Path('.')]
+
+        if not owners:
+            return targets
+
+        result += owners
+
+    return [it for it in targets if it in result]
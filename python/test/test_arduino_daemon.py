@@ -0,0 +1,237 @@
+from concurrent import futures
+import importlib
+import socket
+import sys
+from typing import Any, Iterator
+
+import pytest
+
+from mk_build import Path
+from planer_build.tools import arduino_rpc
+from planer_build.tools.arduino_daemon import (
+    Client, CommandError, DaemonError, GrpcTransport
+)
+
+from . import data_dir
+
+
+class StandIn:
+    """ Stand-in for an arduino-cli daemon. """
+
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.requests: list[tuple[str, dict[str, Any]]] = []
+
+    def call(
+        self,
+        method: str,
+        request: dict[str, Any]
+    ) -> Iterator[dict[str, Any]]:
+        self.requests.append((method, request))
+
+        if method == 'Create':
+            yield {'instance': {'id': 7}}
+        elif method == 'Init':
+            yield {'initProgress': {}}
+        elif method == 'Compile':
+            yield {'outStream': b'Compiling sketch...\n'}
+
+            if self.fail:
+                raise CommandError('Compilation failed.')
+
+            yield {'outStream': b'Sketch uses 100 bytes\n'}
+
+    def close(self) -> None:
+        pass
+
+
+def test_compile() -> None:
+    transport = StandIn()
+    client = Client(transport)
+
+    assert client.init() == 7
+
+    result = client.compile('Planer/Planer.ino', 'arduino:avr:uno',
+                            'build/Planer', 'libraries')
+
+    assert result.returncode == 0
+    assert result.stdout == b'Compiling sketch...\nSketch uses 100 bytes\n'
+
+    (method, request) = transport.requests[-1]
+
+    assert method == 'Compile'
+    assert request['instance'] == {'id': 7}
+    assert request['exportDir'] == 'build/Planer'
+
+
+def test_compile_error() -> None:
+    client = Client(StandIn(fail=True), 7)
+
+    result = client.compile('Planer/Planer.ino', 'arduino:avr:uno',
+                            'build/Planer', 'libraries')
+
+    assert result.returncode == 1
+    assert b'Compilation failed.' in result.stderr
+
+
+def test_uninitialized() -> None:
+    with pytest.raises(DaemonError):
+        Client(StandIn()).compile('Planer/Planer.ino', 'arduino:avr:uno',
+                                  'build/Planer', 'libraries')
+
+
+@pytest.fixture(scope='module')
+def rpc(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Any]:
+    """ Modules generated from the subset of arduino-cli's protocol in
+        data/arduino-rpc. """
+
+    pytest.importorskip('grpc')
+    pytest.importorskip('grpc_tools')
+
+    output = str(arduino_rpc.generate(Path(data_dir, 'arduino-rpc'),
+                                      tmp_path_factory.mktemp('rpc')))
+    sys.path.insert(0, output)
+
+    yield importlib.import_module('cc.arduino.cli.commands.v1')
+
+    sys.path.remove(output)
+
+    for it in [it for it in sys.modules if it.split('.')[0] == 'cc']:
+        del sys.modules[it]
+
+
+@pytest.fixture
+def server(rpc: Any) -> Iterator[tuple[str, list[Any]]]:
+    """ A stand-in daemon serving ArduinoCoreService on a local port.
+        Yields its address and the requests it received. """
+
+    import grpc
+
+    from cc.arduino.cli.commands.v1 import (
+        commands_pb2, commands_pb2_grpc, common_pb2, compile_pb2,
+        upload_pb2
+    )
+
+    requests: list[Any] = []
+
+    from cc.arduino.cli.commands.v1.commands_pb2_grpc import (
+        ArduinoCoreServiceServicer
+    )
+
+    # The generated modules are untyped.
+    class Servicer(ArduinoCoreServiceServicer):  # type: ignore[misc]
+        def Create(self, request: Any, context: Any) -> Any:
+            return commands_pb2.CreateResponse(
+                instance=common_pb2.Instance(id=7))
+
+        def Init(self, request: Any, context: Any) -> Iterator[Any]:
+            requests.append(request)
+
+            yield commands_pb2.InitResponse(
+                init_progress=commands_pb2.InitResponse.Progress())
+
+        def Compile(self, request: Any, context: Any) -> Iterator[Any]:
+            requests.append(request)
+
+            yield compile_pb2.CompileResponse(
+                out_stream=b'Compiling sketch...\n')
+
+            if request.fqbn == 'arduino:avr:none':
+                context.abort(grpc.StatusCode.NOT_FOUND,
+                              'Platform not found')
+
+            yield compile_pb2.CompileResponse(
+                err_stream=b'warning: unused variable\n')
+
+        def Upload(self, request: Any, context: Any) -> Iterator[Any]:
+            requests.append(request)
+
+            yield upload_pb2.UploadResponse(out_stream=b'Uploading...\n')
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    commands_pb2_grpc.add_ArduinoCoreServiceServicer_to_server(
+        Servicer(), server)
+    port = server.add_insecure_port('localhost:0')
+    server.start()
+
+    yield (f'localhost:{port}', requests)
+
+    server.stop(None)
+
+
+def test_grpc_compile(server: tuple[str, list[Any]]) -> None:
+    (address, requests) = server
+    transport = GrpcTransport(address)
+    client = Client(transport)
+
+    try:
+        assert client.init() == 7
+        assert requests[0].instance.id == 7
+
+        result = client.compile('Planer/Planer.ino', 'arduino:avr:uno',
+                                'build/Planer', 'libraries',
+                                build_path='build/Planer/sketch',
+                                build_properties=['compiler.c.extra_flags='])
+    finally:
+        transport.close()
+
+    assert result.returncode == 0
+    assert result.stdout == b'Compiling sketch...\n'
+    assert result.stderr == b'warning: unused variable\n'
+
+    request = requests[-1]
+
+    assert request.instance.id == 7
+    assert request.sketch_path == 'Planer/Planer.ino'
+    assert request.export_dir == 'build/Planer'
+    assert request.build_path == 'build/Planer/sketch'
+    assert list(request.libraries) == ['libraries']
+    assert list(request.build_properties) == ['compiler.c.extra_flags=']
+    assert request.warnings == 'all'
+    assert request.optimize_for_debug
+
+
+def test_grpc_compile_error(server: tuple[str, list[Any]]) -> None:
+    (address, requests) = server
+    transport = GrpcTransport(address)
+
+    try:
+        result = Client(transport, 7).compile(
+            'Planer/Planer.ino', 'arduino:avr:none', 'build/Planer',
+            'libraries')
+    finally:
+        transport.close()
+
+    assert result.returncode == 1
+    assert result.stdout == b'Compiling sketch...\n'
+    assert b'Platform not found' in result.stderr
+
+
+def test_grpc_upload(server: tuple[str, list[Any]]) -> None:
+    (address, requests) = server
+    transport = GrpcTransport(address)
+
+    try:
+        result = Client(transport, 7).upload(
+            'build/Planer/Planer.ino.hex', 'arduino:avr:uno', '/dev/ttyACM0')
+    finally:
+        transport.close()
+
+    assert result.returncode == 0
+    assert result.stdout == b'Uploading...\n'
+    assert requests[-1].import_file == 'build/Planer/Planer.ino.hex'
+    assert requests[-1].port.address == '/dev/ttyACM0'
+    assert requests[-1].port.protocol == 'serial'
+
+
+def test_grpc_unavailable(rpc: Any) -> None:
+    # Bound but not listening, so that connections are refused.
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        transport = GrpcTransport(f'localhost:{s.getsockname()[1]}')
+
+        try:
+            with pytest.raises(DaemonError):
+                Client(transport).init()
+        finally:
+            transport.close()
@@ -0,0 +1,281 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib.util import module_from_spec, spec_from_file_location
+import io
+import os
+import tarfile
+import threading
+from types import ModuleType, SimpleNamespace
+from typing import Iterator
+
+from mk_build import Path
+import pytest
+
+import planer_build
+from planer_build import artifacts, configure
+from planer_build.configure import Config
+
+from . import data_dir
+
+
+def _build(tmp_path: Path) -> list[Path]:
+    output = Path(tmp_path, 'build')
+    output.mkdir()
+
+    result = []
+
+    for (name, data) in (('Planer.ino.elf', b'\x7fELF'),
+                         ('Planer.ino.hex', b':00000001FF\n')):
+        it = Path(output, name)
+        it.write_bytes(data)
+        result.append(it)
+
+    return result
+
+
+def test_key(tmp_path: Path) -> None:
+    source = Path(tmp_path, 'Planer.ino')
+    source.write_text('void setup() {}\n')
+
+    inputs = {'Planer/Planer.ino': source}
+    parameters = {'fqbn': 'arduino:avr:uno'}
+
+    first = artifacts.key(inputs, parameters)
+
+    assert artifacts.key(inputs, parameters) == first
+    assert artifacts.key(inputs, {'fqbn': 'arduino:avr:mega'}) != first
+
+    source.write_text('void setup() { }\n')
+
+    assert artifacts.key(inputs, parameters) != first
+
+
+def test_local(tmp_path: Path) -> None:
+    store = artifacts.open_store(str(Path(tmp_path, 'store')))
+    assert store is not None
+
+    assert store.get('ab' * 32) is None
+
+    store.put('ab' * 32, artifacts.pack(_build(tmp_path)))
+
+    restore = Path(tmp_path, 'restore')
+    restore.mkdir()
+
+    data = store.get('ab' * 32)
+    assert data is not None
+
+    restored = artifacts.unpack(data, restore)
+    assert restored is not None
+
+    assert sorted(it.name for it in restored) == ['Planer.ino.elf',
+                                                  'Planer.ino.hex']
+    assert Path(restore, 'Planer.ino.elf').read_bytes() == b'\x7fELF'
+
+
+def test_local_mode(tmp_path: Path) -> None:
+    umask = os.umask(0o022)
+
+    try:
+        artifacts.LocalStore(tmp_path).put('ab' * 32, b'')
+    finally:
+        os.umask(umask)
+
+    path = Path(tmp_path, 'ab', f'{"ab" * 32}.tar')
+
+    assert path.stat().st_mode & 0o777 == 0o644
+
+
+def _builder() -> ModuleType:
+    path = Path(planer_build.__file__).parent / 'gup/builders/arduino_bin.py'
+
+    spec = spec_from_file_location('arduino_bin', path)
+    assert spec is not None and spec.loader is not None
+
+    result = module_from_spec(spec)
+    spec.loader.exec_module(result)
+
+    return result
+
+
+def test_builder_key(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """ Every configuration header goes into the key, not only config.h,
+        which merely includes them. """
+
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
+    build = Path(tmp_path, 'build')
+    build.mkdir()
+    monkeypatch.setenv('top_build_dir', str(build))
+
+    sketch = Path(tmp_path, 'source', 'Planer', 'Planer.ino')
+    sketch.parent.mkdir(parents=True)
+    sketch.write_text('void setup() {}\nvoid loop() {}\n')
+
+    libraries = Path(tmp_path, 'source', 'libraries')
+    libraries.mkdir()
+
+    module = _builder()
+    builder = module.ArduinoBin(libraries=libraries, sources=[sketch])
+
+    def key(text: str) -> str:
+        path = Path(build, 'config.toml')
+        path.write_text(text)
+
+        config = Config.from_file(str(path))
+        config.write_config_h(f'{build}/config.h')
+
+        monkeypatch.setattr(configure, '_instance', config)
+        module.planer_config = config
+
+        inputs = builder._artifact_inputs(sketch)
+
+        assert Path(build, 'config_motor.h') in inputs
+
+        result: str = builder._artifact_key(inputs)
+
+        return result
+
+    text = Path(data_dir, 'config.toml').read_text()
+
+    store = artifacts.LocalStore(Path(tmp_path, 'store'))
+    store.put(key(text), b'')
+
+    changed = text.replace('pins = [8, 10, 9, 12]', 'pins = [4, 5, 6, 7]')
+    assert changed != text
+
+    assert store.get(key(changed)) is None
+
+
+def test_builder_key_build_dir(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """ platform.local.txt names the build directory and the interpreter
+        running the compiler cache, which differ between machines. """
+
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
+    sketch = Path(tmp_path, 'source', 'Planer', 'Planer.ino')
+    sketch.parent.mkdir(parents=True)
+    sketch.write_text('void setup() {}\nvoid loop() {}\n')
+
+    libraries = Path(tmp_path, 'source', 'libraries')
+    libraries.mkdir()
+
+    module = _builder()
+    module.config = SimpleNamespace(
+        system=SimpleNamespace(build=SimpleNamespace(system='linux')))
+
+    builder = module.ArduinoBin(libraries=libraries, sources=[sketch])
+
+    def key(build: Path, python: str, extra: str = '') -> str:
+        build.mkdir()
+        monkeypatch.setenv('top_build_dir', str(build))
+
+        config = Config.from_file(str(Path(data_dir, 'config.toml')))
+        config.environment = {'arduino': str(Path(tmp_path, 'arduino'))}
+        config.write_config_h(f'{build}/config.h')
+
+        monkeypatch.setattr(configure, '_instance', config)
+        module.planer_config = config
+
+        platform_local = configure.platform_local_path(config)
+        platform_local.parent.mkdir(parents=True, exist_ok=True)
+
+        launcher = (f'"{python}" -m {configure.compiler_cache_launcher}'
+                    f' --dir "{tmp_path}/{python}" --max-size-mb 100 --')
+        flags = configure.build_extra_flags(build, False)
+
+        platform_local.write_text(
+            f'build.extra_flags={flags}{extra}\n'
+            f'recipe.c.o.pattern={launcher} "{{compiler.path}}gcc" -c\n')
+
+        inputs = builder._artifact_inputs(sketch)
+
+        assert platform_local in inputs
+
+        result: str = builder._artifact_key(inputs)
+
+        return result
+
+    first = key(Path(tmp_path, 'build'), '/usr/bin/python3')
+
+    assert key(Path(tmp_path, 'other'), '/opt/venv/bin/python') == first
+    assert key(Path(tmp_path, 'flags'), '/usr/bin/python3', ' -DX') != first
+
+
+def test_unpack_unsafe(tmp_path: Path) -> None:
+    buffer = io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        info = tarfile.TarInfo('../escape')
+        info.size = 1
+        tar.addfile(info, io.BytesIO(b'x'))
+
+    assert artifacts.unpack(buffer.getvalue(), tmp_path) is None
+    assert not Path(tmp_path.parent, 'escape').exists()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    objects: dict[str, bytes] = {}
+
+    def do_GET(self) -> None:
+        data = self.objects.get(self.path)
+
+        if data is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self) -> None:
+        length = int(self.headers['Content-Length'])
+        self.objects[self.path] = self.rfile.read(length)
+
+        self.send_response(201)
+        self.end_headers()
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{httpd.server_port}/artifacts'
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_http(tmp_path: Path, server: str) -> None:
+    store = artifacts.open_store(server)
+    assert isinstance(store, artifacts.HttpStore)
+
+    assert store.get('cd' * 32) is None
+
+    store.put('cd' * 32, artifacts.pack(_build(tmp_path)))
+
+    assert f'/artifacts/{"cd" * 32}.tar' in _Handler.objects
+
+    data = store.get('cd' * 32)
+    assert data is not None
+
+    restored = artifacts.unpack(data, tmp_path)
+    assert restored is not None
+    assert len(restored) == 2
+
+
+def test_http_unreachable() -> None:
+    store = artifacts.HttpStore('http://127.0.0.1:9/artifacts')
+
+    assert store.get('ef' * 32) is None
+    store.put('ef' * 32, b'')
@@ -0,0 +1,77 @@
+from mk_build import CompletedProcess, Path
+from planer_build import boards
+from planer_build.configure import Config
+
+from . import data_dir
+
+_boards = '''
+[[arduino.boards]]
+name = "minima"
+board = "minima"
+
+[[arduino.boards]]
+name = "uno"
+core = "arduino:avr"
+version = "1.8.6"
+board = "uno"
+'''
+
+
+def _config(tmp_path: Path) -> Config:
+    path = Path(tmp_path, 'config.toml')
+    text = Path(data_dir, 'config.toml').read_text()
+
+    # Board tables must follow [arduino] and precede the next table.
+    text = text.replace('\n[keypad]', f'{_boards}\n[keypad]')
+    path.write_text(text)
+
+    return Config.from_file(str(path))
+
+
+def test_config(tmp_path: Path) -> None:
+    config = _config(tmp_path)
+
+    assert list(config.boards) == ['minima', 'uno']
+    assert config.boards['minima'].core == 'arduino:renesas_uno'
+    assert config.boards['uno'].version == '1.8.6'
+
+    config.select_board('uno')
+
+    assert config.arduino.core == 'arduino:avr'
+
+
+def test_split(tmp_path: Path) -> None:
+    config = _config(tmp_path)
+
+    assert boards.split('uno/Planer/Planer.ino.elf', config) == (
+        'uno', Path('Planer/Planer.ino.elf'))
+    assert boards.split('Planer/Planer.ino.elf', config) == (
+        None, Path('Planer/Planer.ino.elf'))
+
+
+def test_build(tmp_path: Path) -> None:
+    config = _config(tmp_path)
+    calls = []
+
+    def run(
+        targets: list[str],
+        jobs: int,
+        board: str
+    ) -> CompletedProcess[bytes]:
+        calls.append((board, targets, jobs))
+
+        return CompletedProcess(targets, 1 if board == 'uno' else 0)
+
+    results = boards.build(config, ['minima', 'uno'], [], 8, run)
+
+    assert sorted(calls) == [
+        ('minima', ['minima/Planer/Planer.ino.elf',
+                    'minima/test/motor/motor.ino.elf'], 4),
+        ('uno', ['uno/Planer/Planer.ino.elf',
+                 'uno/test/motor/motor.ino.elf'], 4)
+    ]
+
+    table = boards.table(results)
+
+    assert 'arduino:avr:uno' in table
+    assert 'FAILED' in table
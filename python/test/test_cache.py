@@ -0,0 +1,60 @@
+import os
+
+from mk_build import Path
+from planer_build import cache as cache_
+from planer_build.cache import BuildCache
+
+
+def test_entry(tmp_path: Path) -> None:
+    cache = BuildCache(tmp_path)
+
+    first = cache.entry('arduino:renesas_uno:minima', '1.2.0', ['-v'])
+    Path(first, 'core.a').write_bytes(b'core')
+
+    assert cache.entry('arduino:renesas_uno:minima', '1.2.0', ['-v']) == first
+    assert cache.entry('arduino:avr:uno', '1.8.6', ['-v']) != first
+
+    stats = cache.stats()
+
+    assert stats['entries'] == 2
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+def test_prune(tmp_path: Path) -> None:
+    cache = BuildCache(tmp_path)
+
+    old = cache.entry('arduino:avr:uno', '1.8.6', [])
+    Path(old, 'core.a').write_bytes(bytes(1000))
+    os.utime(Path(old, '.last_used'), (0, 0))
+
+    new = cache.entry('arduino:renesas_uno:minima', '1.2.0', [])
+    Path(new, 'core.a').write_bytes(bytes(1000))
+
+    removed = cache.prune(1500)
+
+    assert [it.path for it in removed] == [old]
+    assert new.is_dir() and not old.exists()
+
+
+def test_maintain(tmp_path: Path) -> None:
+    cache = BuildCache(tmp_path, max_size_mb=0)
+
+    def entry(version: str) -> None:
+        path = cache.entry('arduino:avr:uno', version, [])
+        Path(path, 'core.a').write_bytes(b'core')
+
+    for it in range(cache_.prune_interval - 1):
+        entry(str(it))
+
+    entry('0')
+
+    # The event log is folded into the counters.
+    assert cache.maintain() == []
+    assert not Path(tmp_path, 'events.log').exists()
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (
+        1, cache_.prune_interval - 1)
+
+    entry('new')
+
+    assert len(cache.maintain()) == cache_.prune_interval
+    assert cache.maintain() == []
@@ -0,0 +1,127 @@
+import sys
+
+from mk_build import Path
+import pytest
+
+from planer_build.tools import ccache
+
+# Preprocesses by echoing the source and "compiles" by copying it, counting
+# the compiles.
+_compiler = '''
+import sys
+
+args = sys.argv[1:]
+source = [it for it in args if it.endswith('.c')][0]
+text = open(source).read()
+
+if '-E' in args:
+    if '-MMD' in args:
+        with open(args[args.index('-MF') + 1], 'w') as fo:
+            fo.write(f'{args[args.index("-MT") + 1]}: {source}\\n')
+
+    sys.stdout.write(f'# 1 "{source}"\\n{text}')
+else:
+    with open(args[args.index('-o') + 1], 'w') as fo:
+        fo.write(f'object of {text}')
+
+    with open(sys.argv[0] + '.count', 'a') as fo:
+        fo.write('.')
+
+    sys.stderr.write('a.c:1:1: warning: unused\\n')
+'''
+
+
+@pytest.fixture
+def compiler(tmp_path: Path) -> list[str]:
+    path = Path(tmp_path, 'cc.py')
+    path.write_text(_compiler)
+
+    return [sys.executable, str(path)]
+
+
+def _compiles(compiler: list[str]) -> int:
+    try:
+        return len(Path(f'{compiler[1]}.count').read_text())
+    except FileNotFoundError:
+        return 0
+
+
+def _build_path(tmp_path: Path, name: str, text: str) -> Path:
+    build = Path(tmp_path, name)
+    Path(build, 'sketch').mkdir(parents=True)
+    Path(build, 'build.options.json').write_text('{}')
+    Path(build, 'sketch', 'a.c').write_text(text)
+
+    return build
+
+
+def _command(compiler: list[str], build: Path) -> list[str]:
+    return compiler + ['-c', '-Os', '-MMD', f'-I{build}/sketch',
+                       f'{build}/sketch/a.c', '-o', f'{build}/sketch/a.c.o']
+
+
+def test_parse() -> None:
+    compile_ = ccache.parse(['gcc', '-c', '-MMD', 'a.c', '-o', 'a.c.o'])
+    assert compile_ is not None
+
+    assert compile_.object == 'a.c.o'
+    assert compile_.preprocess == ['gcc', '-E', '-MMD', 'a.c',
+                                   '-MF', 'a.c.d', '-MT', 'a.c.o']
+
+    assert ccache.parse(['gcc', 'a.o', 'b.o', '-o', 'a.elf']) is None
+    assert ccache.parse(['gcc', '-c', '-fstack-usage', 'a.c', '-o',
+                         'a.c.o']) is None
+
+
+def test_shared_between_build_paths(
+    tmp_path: Path,
+    compiler: list[str],
+    capfd: pytest.CaptureFixture[str]
+) -> None:
+    cache = ccache.ObjectCache(str(Path(tmp_path, 'cache')))
+
+    first = _build_path(tmp_path, 'first', 'int a;\n')
+    second = _build_path(tmp_path, 'second', 'int a;\n')
+
+    assert cache.run(_command(compiler, first)) == 0
+    assert cache.run(_command(compiler, second)) == 0
+
+    assert _compiles(compiler) == 1
+    assert (Path(second, 'sketch', 'a.c.o').read_text()
+            == 'object of int a;\n')
+
+    # The dependency file is written on a hit too, for the second path.
+    assert str(second) in Path(second, 'sketch', 'a.c.d').read_text()
+
+    # The compiler's warning is repeated on the hit.
+    assert capfd.readouterr().err.count('warning: unused') == 2
+
+    Path(second, 'sketch', 'a.c').write_text('int b;\n')
+
+    assert cache.run(_command(compiler, second)) == 0
+    assert _compiles(compiler) == 2
+
+
+def test_prune(
+    tmp_path: Path,
+    compiler: list[str],
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(ccache, 'prune_interval', 2)
+
+    cache = ccache.ObjectCache(str(Path(tmp_path, 'cache')))
+    cache.max_size = 40
+
+    def size() -> int:
+        return sum(it.stat().st_size
+                   for it in Path(tmp_path, 'cache').glob('*/*.o'))
+
+    for it in range(4):
+        build = _build_path(tmp_path, str(it), f'int a{it};\n')
+        cache.run(_command(compiler, build))
+
+        # The size is only checked every other store.
+        if it == 2:
+            assert size() > 40
+
+    assert 0 < size() <= 40
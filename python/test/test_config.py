@@ -1,10 +1,20 @@
+import os
+import shutil
+
+from mk_build import Path
+import pytest
+
 from planer_build.configure import Config
+from planer_build.error import FatalError
 
 from . import data_dir
 
 
 class TestConfig:
-    def setup_method(self) -> None:
+    @pytest.fixture(autouse=True)
+    def config(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
         self.config = Config.from_file(f'{data_dir}/config.toml')
 
     def test_config(self) -> None:
@@ -54,3 +64,99 @@ backlight = 7
         # print(config.toml().as_string())
 
         assert config.toml().as_string() == toml_ref
+
+    def test_write_config_h(self, tmp_path: Path) -> None:
+        path = f'{tmp_path}/config.h'
+
+        written = self.config.write_config_h(path)
+
+        names = sorted(Path(it).name for it in written)
+
+        assert names == ['config.h', 'config_display.h', 'config_keypad.h',
+                         'config_log.h', 'config_motor.h', 'config_pins.h']
+
+        with open(path) as fi:
+            umbrella = fi.read()
+
+        assert '#include "config_display.h"' in umbrella
+
+        with open(f'{tmp_path}/config_motor.h') as fi:
+            motor = fi.read()
+
+        assert '.stepsPerRevolution = 2048' in motor
+        assert '.pins = {8, 10, 9, 12}' in motor
+
+    def test_write_config_h_mode(self, tmp_path: Path) -> None:
+        umask = os.umask(0o022)
+
+        try:
+            written = self.config.write_config_h(f'{tmp_path}/config.h')
+        finally:
+            os.umask(umask)
+
+        for it in written:
+            assert Path(it).stat().st_mode & 0o777 == 0o644
+
+    def test_write_config_h_unchanged(self, tmp_path: Path) -> None:
+        path = f'{tmp_path}/config.h'
+
+        self.config.write_config_h(path)
+
+        mtime = Path(path).stat().st_mtime_ns
+
+        assert self.config.write_config_h(path) == []
+        assert Path(path).stat().st_mtime_ns == mtime
+
+    def test_invalid(self, tmp_path: Path) -> None:
+        path = f'{tmp_path}/config.toml'
+
+        with open(f'{data_dir}/config.toml') as fi:
+            text = fi.read()
+
+        text = text.replace('steps_per_revolution = 2048',
+                            'steps_per_revolution = "2048"')
+        text = text.replace('controller = "PCD8544"', 'controller = "ST7735"')
+        text = text.replace('clock = 13\n', '')
+
+        with open(path, 'w') as fo:
+            fo.write(text)
+
+        with pytest.raises(FatalError) as e:
+            Config.from_file(path)
+
+        message = str(e.value)
+
+        assert 'motor.steps_per_revolution: expected integer' in message
+        assert "display.controller: 'ST7735' is not one of" in message
+        assert 'display.clock: missing' in message
+
+    def test_cached(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        path = f'{tmp_path}/config.toml'
+        shutil.copy(f'{data_dir}/config.toml', path)
+
+        Config.from_file(path)
+
+        def parse(self: Config, path: str) -> None:
+            raise AssertionError('parsed a cached configuration')
+
+        with monkeypatch.context() as m:
+            m.setattr(Config, '_init_from_file', parse)
+
+            config = Config.from_file(path)
+
+            # Touching the file leaves its contents, and the cache, valid.
+
+            os.utime(path, ns=(0, 0))
+            config = Config.from_file(path)
+
+        assert config.arduino.board == 'minima'
+        assert config.toml()['arduino']['board'] == 'minima'
+
+        with open(path, 'a') as fo:
+            fo.write('\n[cache]\nmax_size_mb = 16\n')
+
+        assert Config.from_file(path).cache.max_size_mb == 16
@@ -0,0 +1,55 @@
+from mk_build import Path
+from planer_build import deps
+
+
+def test_parse_depfile() -> None:
+    text = ('/b/sketch/Planer.ino.cpp.o: /b/sketch/Planer.ino.cpp \\\n'
+            ' /s/Planer/motor.h /s/My\\ Libraries/U8g2/U8g2lib.h \\\n'
+            ' C:/build/config.h\n'
+            '/s/Planer/motor.h:\n')
+
+    assert deps.parse_depfile(text) == [
+        '/b/sketch/Planer.ino.cpp',
+        '/s/Planer/motor.h',
+        '/s/My Libraries/U8g2/U8g2lib.h',
+        'C:/build/config.h'
+    ]
+
+
+def test_stamp(tmp_path: Path) -> None:
+    source = Path(tmp_path, 'motor.h')
+    source.write_text('int a;')
+
+    stamp_path = Path(tmp_path, 'Planer.ino.deps.json')
+    key = {'fqbn': 'arduino:renesas_uno:minima'}
+
+    deps.Stamp.load(stamp_path).write(key, [source])
+
+    assert deps.Stamp.load(stamp_path).current(key)
+    assert not deps.Stamp.load(stamp_path).current({'fqbn': 'other'})
+
+    source.write_text('int b;')
+
+    assert not deps.Stamp.load(stamp_path).current(key)
+
+
+def test_stamp_unreadable(tmp_path: Path) -> None:
+    stamp_path = Path(tmp_path, 'Planer.ino.deps.json')
+
+    deps.Stamp.load(stamp_path).write({}, [Path(tmp_path, 'missing.h')])
+
+    assert not deps.Stamp.load(stamp_path).current({})
+
+
+def test_harvest_wsl(tmp_path: Path) -> None:
+    build_path = Path(tmp_path, '.arduino', 'Planer.ino')
+    Path(build_path, 'sketch').mkdir(parents=True)
+
+    Path(build_path, 'sketch', 'Planer.ino.cpp.d').write_text(
+        f'Z:{build_path}/sketch/Planer.ino.cpp.o: \\\n'
+        f' Z:{build_path}/sketch/Planer.ino.cpp \\\n'
+        ' C:\\Users\\me\\Arduino\\libraries\\U8g2\\src\\U8g2lib.h\n')
+
+    assert deps.harvest(build_path, wsl=True) == [
+        Path('/mnt/c/Users/me/Arduino/libraries/U8g2/src/U8g2lib.h')
+    ]
@@ -0,0 +1,71 @@
+from mk_build import Path
+from planer_build import diagnostics
+
+_core_warning = (
+    '/home/u/.arduino15/packages/arduino/hardware/renesas_uno/1.2.0/cores/'
+    'arduino/Serial.cpp:42:10: warning: unused variable \'x\''
+    ' [-Wunused-variable]'
+)
+
+
+def _collect(target: str, lines: list[str]) -> diagnostics.Collector:
+    result = diagnostics.Collector(target)
+
+    for it in lines:
+        result.line(it)
+
+    return result
+
+
+def test_parse() -> None:
+    diagnostic = diagnostics.parse(
+        'C:\\Users\\u\\Planer\\motor.cpp:12:5: fatal error: motor.h:'
+        ' No such file or directory')
+
+    assert diagnostic is not None
+    assert diagnostic.file == 'C:/Users/u/Planer/motor.cpp'
+    assert (diagnostic.line, diagnostic.column) == (12, 5)
+    assert diagnostic.severity == 'error'
+    assert diagnostic.message == 'motor.h: No such file or directory'
+
+    assert diagnostics.parse('Compiling sketch...') is None
+    assert diagnostics.parse('Sketch uses 100 bytes (1%)') is None
+
+
+def test_merge(tmp_path: Path) -> None:
+    planer = _collect('Planer/Planer.ino.elf', [
+        'Compiling core...',
+        _core_warning,
+        _core_warning,
+        '/src/Planer/Planer.ino:3:1: error: \'foo\' was not declared',
+        '/src/Planer/Planer.ino:1:1: note: suggested alternative: \'for\''
+    ])
+
+    motor = _collect('test/motor/motor.ino.elf', [_core_warning])
+
+    assert len(planer.diagnostics) == 2
+
+    paths = [Path(tmp_path, 'planer.json'), Path(tmp_path, 'motor.json')]
+
+    planer.write(paths[0])
+    motor.write(paths[1])
+
+    merged = diagnostics.merge(paths, Path(tmp_path, 'diagnostics.json'))
+
+    assert len(merged) == 2
+
+    error = next(it for it in merged if it.severity == 'error')
+    warning = next(it for it in merged if it.severity == 'warning')
+
+    assert error.notes == [
+        '/src/Planer/Planer.ino:1: suggested alternative: \'for\''
+    ]
+    assert warning.targets == ['Planer/Planer.ino.elf',
+                               'test/motor/motor.ino.elf']
+
+    assert diagnostics.summary(merged) == '1 errors, 1 warnings'
+
+    # Written through uniquely named temporary files, none left behind.
+    assert sorted(it.name for it in tmp_path.iterdir()) == [
+        'diagnostics.json', 'motor.json', 'planer.json'
+    ]
@@ -0,0 +1,107 @@
+import argparse
+from typing import BinaryIO
+
+from mk_build import Path
+import pytest
+
+from planer_build import flash
+from planer_build.cli import CLI
+from planer_build.configure import Config
+from planer_build.tools import arduino_cli
+from planer_build.tools.arduino_daemon import daemon_variable
+
+from . import data_dir
+
+# Stand-in for arduino-cli upload. Fails on the ports listed in the file
+# "fail" next to it, once each.
+_stand_in = '''#!/bin/sh
+port="$7"
+echo "uploading $3 to $port as $5"
+if grep -qx "$port" "$(dirname "$0")/fail"; then
+    sed -i "\\|^$port\\$|d" "$(dirname "$0")/fail"
+    echo "No device found on $port" >&2
+    exit 1
+fi
+exit 0
+'''
+
+
+@pytest.fixture
+def stand_in(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    result = Path(tmp_path, 'arduino-cli')
+    result.write_text(_stand_in)
+    result.chmod(0o755)
+
+    Path(tmp_path, 'fail').write_text('/dev/ttyACM1\n/dev/ttyACM2\n')
+
+    monkeypatch.setenv('ARDUINO_CLI', str(result))
+    monkeypatch.delenv(daemon_variable, raising=False)
+    monkeypatch.setattr(flash, 'retry_delay', 0)
+
+    return result
+
+
+def test_flash(tmp_path: Path, stand_in: Path) -> None:
+    def upload(port: str, output: BinaryIO) -> int:
+        return arduino_cli.upload('Planer.ino.hex', port,
+                                  'arduino:renesas_uno:minima',
+                                  output).returncode
+
+    ports = ['/dev/ttyACM0', '/dev/ttyACM1', '/dev/ttyACM2']
+    log_dir = Path(tmp_path, 'logs')
+
+    results = flash.flash(ports[:2], upload, log_dir, jobs=2, retries=1)
+
+    assert [(it.port, it.returncode, it.attempts) for it in results] == [
+        ('/dev/ttyACM0', 0, 1), ('/dev/ttyACM1', 0, 2)
+    ]
+
+    log = Path(log_dir, 'dev_ttyACM1.log').read_text()
+
+    assert 'as arduino:renesas_uno:minima' in log
+    assert 'No device found on /dev/ttyACM1' in log
+    assert 'attempt 2' in log
+
+    results = flash.flash(ports[2:], upload, log_dir, retries=0)
+
+    assert results[0].returncode == 1
+    assert '0 passed, 1 failed' in flash.summary(results)
+
+
+def test_ports(tmp_path: Path) -> None:
+    for it in ('ttyACM1', 'ttyACM0', 'ttyUSB0'):
+        Path(tmp_path, it).touch()
+
+    assert flash.ports(['/dev/ttyS0'], [f'{tmp_path}/ttyACM*']) == [
+        '/dev/ttyS0', f'{tmp_path}/ttyACM0', f'{tmp_path}/ttyACM1'
+    ]
+
+
+def test_upload_board(
+    tmp_path: Path,
+    stand_in: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capfd: pytest.CaptureFixture[str]
+) -> None:
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
+    path = Path(tmp_path, 'config.toml')
+    path.write_text(Path(data_dir, 'config.toml').read_text().replace(
+        '\n[keypad]',
+        '\n[[arduino.boards]]\nname = "uno"\ncore = "arduino:avr"\n'
+        'board = "uno"\nport = "/dev/ttyUSB0"\n\n[keypad]'))
+
+    config = Config.from_file(str(path))
+    config.environment = {'arduino_cli': str(stand_in)}
+
+    cli = CLI(config=config)
+
+    cli.upload(argparse.Namespace(
+        filename='Planer.ino.hex', board='uno', port=None, port_glob=None,
+        log_dir=None, jobs=None, retries=0))
+
+    assert ('uploading Planer.ino.hex to /dev/ttyUSB0 as arduino:avr:uno'
+            in capfd.readouterr().out)
+
+    # The configured board is left as it was.
+    assert config.arduino.board == 'minima'
@@ -0,0 +1,122 @@
+import asyncio
+import io
+import os
+
+from mk_build import Path
+import pytest
+
+from planer_build import monitor
+from planer_build.error import FatalError
+from planer_build.util import port_file_name
+
+
+def _pty() -> tuple[int, str]:
+    (controller, device) = os.openpty()
+    name = os.ttyname(device)
+
+    os.close(device)
+
+    return (controller, name)
+
+
+async def _monitor(
+    tmp_path: Path,
+    data: dict[int, bytes],
+    names: list[str]
+) -> monitor.Monitor:
+    output = io.BytesIO()
+
+    result = monitor.Monitor(names, 115200, tmp_path, max_bytes=1 << 20,
+                             output=output)
+
+    task = asyncio.create_task(result.run())
+
+    # Let the monitor open the ports before writing.
+    await asyncio.sleep(0.1)
+
+    loop = asyncio.get_running_loop()
+
+    for (controller, it) in data.items():
+        await loop.run_in_executor(None, os.write, controller, it)
+
+    await asyncio.sleep(0.2)
+
+    result.stop()
+    await task
+
+    return result
+
+
+def test_monitor(tmp_path: Path) -> None:
+    (a, name_a) = _pty()
+    (b, name_b) = _pty()
+
+    try:
+        result = asyncio.run(_monitor(
+            tmp_path,
+            {a: b'hello\r\nworld\r\npartial', b: b'motor ok\n'},
+            [name_a, name_b]
+        ))
+    finally:
+        os.close(a)
+        os.close(b)
+
+    log_a = Path(tmp_path,
+                 f'{port_file_name(name_a)}.log').read_text()
+
+    lines = [it.split('] ', 1)[1] for it in log_a.splitlines()]
+
+    assert lines == ['hello', 'world', 'partial']
+    assert result.ports[1].lines == 1
+
+
+def test_open_failed(tmp_path: Path) -> None:
+    (controller, name) = _pty()
+    missing = str(Path(tmp_path, 'ttyACM9'))
+
+    result = monitor.Monitor([name, missing], 115200, tmp_path)
+
+    try:
+        with pytest.raises(FatalError) as e:
+            asyncio.run(result.run())
+    finally:
+        os.close(controller)
+
+    assert missing in str(e.value)
+
+    # The port opened before is closed again.
+    assert result.ports[0].closed.is_set()
+
+
+def test_throughput(tmp_path: Path) -> None:
+    """ A burst larger than the pseudo-terminal's buffer arrives intact. """
+
+    (controller, name) = _pty()
+
+    data = b''.join(b'%08d 0123456789abcdef\n' % it for it in range(20000))
+
+    try:
+        asyncio.run(_monitor(tmp_path, {controller: data}, [name]))
+    finally:
+        os.close(controller)
+
+    log = Path(tmp_path, f'{port_file_name(name)}.log').read_text()
+    lines = log.splitlines()
+
+    assert len(lines) == 20000
+    assert lines[-1].endswith('00019999 0123456789abcdef')
+
+
+def test_rotating_log(tmp_path: Path) -> None:
+    log = monitor.RotatingLog(Path(tmp_path, 'port.log'), max_bytes=10,
+                              backups=2)
+
+    for it in (b'aaaaaaaa\n', b'bbbbbbbb\n', b'cccccccc\n', b'dddddddd\n'):
+        log.write(it)
+
+    log.close()
+
+    assert Path(tmp_path, 'port.log').read_bytes() == b'dddddddd\n'
+    assert Path(tmp_path, 'port.log.1').read_bytes() == b'cccccccc\n'
+    assert Path(tmp_path, 'port.log.2').read_bytes() == b'bbbbbbbb\n'
+    assert not Path(tmp_path, 'port.log.3').exists()
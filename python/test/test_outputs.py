@@ -0,0 +1,46 @@
+from mk_build import Path
+from planer_build import outputs
+
+
+def _build(top: Path, sketch: str) -> None:
+    directory = Path(top, sketch)
+    objects = Path(directory, '.arduino', 'core')
+    objects.mkdir(parents=True)
+
+    for it in range(100):
+        Path(objects, f'{it}.o').write_bytes(b'')
+
+    elf = Path(directory, f'{sketch}.ino.elf')
+    elf.write_bytes(b'')
+
+    outputs.record(top, f'{sketch}/{sketch}.ino.elf', [elf],
+                   [Path(directory, '.arduino')])
+
+
+def test_clean_target(tmp_path: Path) -> None:
+    _build(tmp_path, 'Planer')
+    _build(tmp_path, 'Calibration')
+    Path(tmp_path, 'Planer', 'all.gup').write_text('')
+
+    report = outputs.clean(tmp_path, ['Planer/all'], dry_run=True)
+
+    assert report.files == [Path(tmp_path, 'Planer', 'Planer.ino.elf')]
+    assert Path(tmp_path, 'Planer', 'Planer.ino.elf').exists()
+
+    outputs.clean(tmp_path, ['Planer'])
+
+    assert sorted(it.name for it in Path(tmp_path, 'Planer').iterdir()) == [
+        'all.gup'
+    ]
+    assert Path(tmp_path, 'Calibration', 'Calibration.ino.elf').exists()
+    assert [it.target for it in outputs.load(tmp_path)] == [
+        'Calibration/Calibration.ino.elf'
+    ]
+
+
+def test_clean_prunes(tmp_path: Path) -> None:
+    _build(tmp_path, 'Calibration')
+
+    outputs.clean(tmp_path)
+
+    assert not Path(tmp_path, 'Calibration').exists()
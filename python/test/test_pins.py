@@ -0,0 +1,53 @@
+from mk_build import Path
+import pytest
+
+from planer_build import pins
+from planer_build.configure import Config
+from planer_build.error import FatalError
+
+from . import data_dir
+
+
+def test_resolve() -> None:
+    uno = pins.boards['arduino:avr:uno']
+
+    resolved = pins.resolve(uno, {'motorPins': [8, 2], 'clock': 19})
+
+    assert [(it.name, it.mask) for it in resolved['motorPins']] == [
+        ('PB0', 0x1), ('PD2', 0x4)]
+
+    # PINC, PORTC and DDRC
+    port = resolved['clock'][0].port
+    assert (port.input, port.output, port.direction) == (0x26, 0x28, 0x27)
+
+
+def test_invalid() -> None:
+    uno = pins.boards['arduino:avr:uno']
+
+    with pytest.raises(FatalError) as e:
+        pins.resolve(uno, {'motorPins': [8, 20], 'clock': 42})
+
+    message = str(e.value)
+
+    assert 'arduino:avr:uno' in message
+    assert 'motorPins[1]: pin 20' in message
+    assert 'clock: pin 42' in message
+
+
+def test_config_h(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
+    Config.from_file(f'{data_dir}/config.toml').write_config_h(
+        f'{tmp_path}/config.h')
+
+    header = Path(tmp_path, 'config_pins.h').read_text()
+
+    assert '#if defined(ARDUINO_MINIMA)' in header
+    assert 'typedef uint16_t FastPinRegister;' in header
+
+    # Motor pin 8 is P304 and the display clock, 13, P111.
+
+    assert ('{0x40040064, 0x40040062, 0x40040060, 0x40040068, 0x4004006a,'
+            ' 0x10}, // 8: P304') in header
+    assert 'constexpr FastPin displayClockPin = {' in header
+    assert '0x800}; // 13: P111' in header
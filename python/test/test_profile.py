@@ -0,0 +1,48 @@
+import json
+
+from mk_build import Path
+from planer_build import profile
+
+_output = '''FQBN: arduino:renesas_uno:minima
+Detecting libraries used...
+"arm-none-eabi-g++" -c Planer.ino.cpp -o /dev/null
+Generating function prototypes...
+Compiling sketch...
+Compiling libraries...
+Compiling core...
+Linking everything together...
+"arm-none-eabi-size" -A "/build/Planer.ino.elf"
+Sketch uses 52000 bytes (19%) of program storage space.
+Global variables use 6000 bytes (18%) of dynamic memory.
+'''
+
+
+def test_trace(tmp_path: Path) -> None:
+    recorder = profile.Recorder(tmp_path, 'Planer/Planer.ino.elf')
+    tracker = profile.PhaseTracker(recorder)
+
+    start = profile.now()
+
+    for line in _output.splitlines():
+        tracker.line(line)
+
+    tracker.finish()
+
+    recorder.span('Planer/Planer.ino.elf', 'target', start)
+
+    trace_path = Path(tmp_path, 'profile.json')
+    trace = profile.merge(tmp_path, trace_path)
+
+    names = [it['name'] for it in trace if it.get('cat') == 'phase']
+
+    assert names == ['library detection', 'sketch preprocessing',
+                     'sketch compile', 'library compile', 'core compile',
+                     'link', 'size']
+
+    with open(trace_path) as fi:
+        assert len(json.load(fi)['traceEvents']) == len(trace)
+
+    summary = profile.summary(trace)
+
+    assert 'Planer/Planer.ino.elf' in summary
+    assert 'core compile' in summary
@@ -0,0 +1,68 @@
+import math
+
+from mk_build import Path
+import pytest
+
+from planer_build import ramp
+from planer_build.configure import Config
+from planer_build.error import FatalError
+
+from . import data_dir
+
+pytest.importorskip('numpy')
+
+
+def test_compute() -> None:
+    # 600 rpm with 16 microsteps of a 200 step motor: 32000 steps/s.
+
+    result = ramp.compute(200, {'max_speed': 600, 'acceleration': 5,
+                                'microstepping': 16, 'table_size': 64})
+
+    assert len(result.intervals) <= 64
+    assert result.steps == 32000
+    assert result.stride == math.ceil(32000 / 63)
+    assert result.duration == pytest.approx(2.0)
+
+    # Intervals shrink to that of full speed, rounded up.
+
+    assert result.intervals == sorted(result.intervals, reverse=True)
+    assert result.intervals[-1] == 32
+    assert result.error <= ramp.defaults['tolerance']
+
+
+def test_overflow() -> None:
+    profile = {'max_speed': 0.25, 'acceleration': 0.5}
+
+    with pytest.raises(FatalError) as e:
+        ramp.compute(2048, profile)
+
+    assert 'do not fit 16 bit' in str(e.value)
+
+    assert ramp.compute(2048, profile | {'entry_bits': 32}).intervals
+
+
+def test_inaccurate() -> None:
+    profile = {'max_speed': 600, 'acceleration': 5, 'table_size': 4}
+
+    with pytest.raises(FatalError) as e:
+        ramp.compute(200, profile)
+
+    assert 'table_size' in str(e.value)
+
+
+def test_config_h(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
+    path = Path(tmp_path, 'config.toml')
+    path.write_text(Path(data_dir, 'config.toml').read_text()
+                    + '\n[motor.profile]\nmax_speed = 15\n'
+                    'acceleration = 0.5\n')
+
+    Config.from_file(str(path)).write_config_h(f'{tmp_path}/config.h')
+
+    motor = Path(tmp_path, 'config_motor.h').read_text()
+
+    assert '#define MOTOR_RAMP_STRIDE 2' in motor
+    assert '#define MOTOR_RAMP_STEPS 128' in motor
+    assert 'static const uint16_t motorRampIntervals[] PROGMEM = {' in motor
+    assert '31250, 12945' in motor
@@ -0,0 +1,34 @@
+from mk_build import Path
+from planer_build.schedule import auto_jobs, History
+
+
+def test_order(tmp_path: Path) -> None:
+    history = History(tmp_path)
+
+    history.record('Planer/Planer.ino.elf', 40.0)
+    history.record('test/motor/motor.ino.elf', 10.0)
+    history.record('test/motor/motor.ino.elf', 20.0)
+
+    assert history.estimate('test/motor/motor.ino.elf') == 15.0
+    assert history.estimate('test/all') == 15.0
+
+    assert history.order(['test/all', 'Planer/all', 'Calibration/all']) == [
+        'Calibration/all', 'Planer/all', 'test/all'
+    ]
+
+
+def test_compact(tmp_path: Path) -> None:
+    history = History(tmp_path)
+
+    for it in range(30):
+        history.record('Planer/Planer.ino.elf', float(it))
+
+    history.compact()
+
+    assert history.durations()['Planer/Planer.ino.elf'] == [
+        float(it) for it in range(20, 30)
+    ]
+
+
+def test_auto_jobs() -> None:
+    assert auto_jobs() >= 1
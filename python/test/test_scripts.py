@@ -0,0 +1,48 @@
+from mk_build import Path
+from planer_build import scripts
+
+
+def test_sync(tmp_path: Path) -> None:
+    report = scripts.sync(tmp_path)
+
+    assert 'all.gup' in report.added
+    assert 'builders/arduino_bin.py' in report.added
+    assert Path(tmp_path, 'Planer', 'all.gup').is_file()
+
+    mtime = Path(tmp_path, 'all.gup').stat().st_mtime_ns
+
+    report = scripts.sync(tmp_path)
+
+    assert report.added == report.updated == report.removed == []
+    assert Path(tmp_path, 'all.gup').stat().st_mtime_ns == mtime
+
+
+def test_sync_stale(tmp_path: Path) -> None:
+    scripts.sync(tmp_path)
+
+    manifest = Path(tmp_path, '.scon', 'scripts.json')
+    manifest.write_text(manifest.read_text().replace(
+        '"all.gup"', '"Old/all.gup": "0", "all.gup"'))
+
+    Path(tmp_path, 'Old').mkdir()
+    Path(tmp_path, 'Old', 'all.gup').write_text('')
+
+    report = scripts.sync(tmp_path)
+
+    assert report.removed == ['Old/all.gup']
+    assert not Path(tmp_path, 'Old', 'all.gup').exists()
+
+
+def test_sync_symlink(tmp_path: Path) -> None:
+    scripts.sync(tmp_path)
+
+    manifest = Path(tmp_path, '.scon', 'scripts.json')
+    manifest.write_text(manifest.read_text().replace(
+        '"all.gup"', '"Old/all.gup": "0", "all.gup"'))
+
+    report = scripts.sync(tmp_path, 'symlink')
+
+    assert report.unchanged == report.added == []
+    assert 'all.gup' in report.updated
+    assert report.removed == ['Old/all.gup']
+    assert Path(tmp_path, 'all.gup').is_symlink()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from mk_build import CompletedProcess, Path
+import pytest
+
+from planer_build import cli as cli_, serve
+from planer_build.configure import Config
+from planer_build.tools import arduino_cli
+
+from . import data_dir
+
+
+def _wait(condition: Any) -> None:
+    deadline = time.monotonic() + 5
+
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _request(path: str, args: dict[str, Any]) -> tuple[bytes, bytes, int]:
+    """ Return the standard output, error and exit status of a request. """
+
+    output = {b'1': b'', b'2': b''}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall(json.dumps({'cwd': os.getcwd(), 'args': args})
+                           .encode() + b'\n')
+
+        with connection.makefile('rb') as stream:
+            for (kind, payload) in serve._frames(stream):
+                if kind == b'x':
+                    return (output[b'1'], output[b'2'], int(payload))
+
+                output[kind] += payload
+
+    raise AssertionError('no exit status')
+
+
+def test_serve(tmp_path: Path) -> None:
+    Path(tmp_path, '.scon').mkdir()
+    path = serve.socket_path(str(tmp_path))
+
+    release = threading.Event()
+    runs: list[dict[str, Any]] = []
+
+    def run(args: dict[str, Any]) -> int:
+        runs.append(args)
+
+        if args['func'] == 'upload':
+            release.wait(5)
+
+        # Output of the server and of processes it starts.
+
+        print(f'built {args["targets"]}')
+        subprocess.run(['sh', '-c', 'echo compiled >&2'])
+
+        return 3
+
+    server = serve.Server(path, run)
+    threading.Thread(target=server.serve, daemon=True).start()
+
+    _wait(lambda: os.path.exists(path))
+
+    results: dict[str, tuple[bytes, bytes, int]] = {}
+
+    def client(name: str, args: dict[str, Any]) -> threading.Thread:
+        def request() -> None:
+            results[name] = _request(path, args)
+
+        thread = threading.Thread(target=request)
+        thread.start()
+
+        return thread
+
+    build = {'func': 'build', 'targets': ['Planer/Planer.ino.elf']}
+
+    # While the upload runs, identical builds are queued as one.
+
+    clients = [client('upload', {'func': 'upload', 'targets': []})]
+    _wait(lambda: len(runs) == 1)
+
+    clients += [client('first', build), client('second', build),
+                client('other', build | {'targets': []})]
+    _wait(lambda: len(server._queue) == 3)
+
+    release.set()
+
+    for it in clients:
+        it.join(10)
+
+    assert [it['func'] for it in runs] == ['upload', 'build', 'build']
+
+    assert results['first'] == (b"built ['Planer/Planer.ino.elf']\n",
+                                b'compiled\n', 3)
+    assert results['second'] == results['first']
+    assert results['other'][0] == b'built []\n'
+
+
+def test_cli_requests(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """ Requests use the configuration as last changed, and do not change
+        it for later ones. """
+
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
+    path = Path(tmp_path, 'config.toml')
+    text = Path(data_dir, 'config.toml').read_text().replace(
+        '\n[keypad]',
+        '\n[[arduino.boards]]\nname = "uno"\ncore = "arduino:avr"\n'
+        'board = "uno"\nport = "/dev/ttyUSB0"\n\n[keypad]')
+    path.write_text(text)
+
+    cli = cli_.CLI(config=Config.from_file(str(path)))
+    cli.config.environment = {'arduino_cli': 'arduino-cli'}
+    cli.config_file.top_source_dir = tmp_path
+    cli.config_file.top_build_dir = tmp_path
+
+    runs: list[Callable[[dict[str, Any]], int]] = []
+    uploads = []
+
+    class Server:
+        def __init__(
+            self,
+            path: str,
+            run: Callable[[dict[str, Any]], int]
+        ) -> None:
+            runs.append(run)
+
+        def serve(self) -> None:
+            pass
+
+    def upload(
+        path: str,
+        port: Optional[str] = None,
+        board: Optional[str] = None
+    ) -> CompletedProcess[bytes]:
+        uploads.append((port, board))
+        return CompletedProcess([], 0)
+
+    monkeypatch.setattr(serve, 'Server', Server)
+    monkeypatch.setattr(arduino_cli, 'upload', upload)
+
+    cli.serve(argparse.Namespace())
+
+    def request(board: Optional[str]) -> int:
+        return runs[0]({'func': 'upload', 'filename': 'Planer.ino.hex',
+                        'board': board, 'port': None, 'port_glob': None,
+                        'log_dir': None, 'jobs': None, 'retries': 0})
+
+    assert request('uno') == 0
+    assert request(None) == 0
+
+    path.write_text(text.replace('/dev/ttyACM0', '/dev/ttyACM1'))
+    os.utime(path, ns=(0, 0))
+
+    assert request(None) == 0
+
+    assert uploads == [('/dev/ttyUSB0', 'arduino:avr:uno'),
+                       ('/dev/ttyACM0', 'arduino:renesas_uno:minima'),
+                       ('/dev/ttyACM1', 'arduino:renesas_uno:minima')]
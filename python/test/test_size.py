@@ -0,0 +1,181 @@
+from concurrent.futures import ProcessPoolExecutor
+import struct
+import sys
+
+from mk_build import Path
+import pytest
+
+from planer_build import elf, size
+
+# (name, type, flags, address, size)
+_sections = [
+    ('.text', 1, elf.SHF_ALLOC | elf.SHF_EXECINSTR, 0x0, 1000),
+    ('.data', 1, elf.SHF_ALLOC | elf.SHF_WRITE, 0x800100, 20),
+    ('.bss', elf.SHT_NOBITS, elf.SHF_ALLOC | elf.SHF_WRITE, 0x800114, 504),
+    ('.eeprom', 1, elf.SHF_ALLOC | elf.SHF_WRITE, 0x810000, 8),
+    ('.comment', 1, 0, 0x0, 16)
+]
+
+# (name, value, size, type, section index)
+_symbols = [
+    ('loop', 0x100, 300, elf.STT_FUNC, 1),
+    ('setup', 0x300, 100, elf.STT_FUNC, 1),
+    ('displayBuffer', 0x800114, 504, elf.STT_OBJECT, 3),
+    ('logConfig', 0x800100, 4, elf.STT_OBJECT, 2),
+    ('eepromData', 0x810000, 8, elf.STT_OBJECT, 4)
+]
+
+
+def _strings(names: list[str]) -> tuple[bytes, list[int]]:
+    data = b'\0'
+    offsets = []
+
+    for it in names:
+        offsets.append(len(data))
+        data += it.encode() + b'\0'
+
+    return (data, offsets)
+
+
+def _elf32() -> bytes:
+    """ Write a little-endian ELF32 file shaped like an AVR sketch. """
+
+    (strtab, symbol_names) = _strings([it[0] for it in _symbols])
+
+    symtab = b'\0' * 16 + b''.join(
+        struct.pack('<IIIBBH', offset, value, size_, type_, 0, index)
+        for (offset, (_, value, size_, type_, index))
+        in zip(symbol_names, _symbols))
+
+    names = [it[0] for it in _sections] + ['.symtab', '.strtab', '.shstrtab']
+    (shstrtab, section_names) = _strings(names)
+
+    body = b''
+    headers = [struct.pack('<IIIIIIIIII', *([0] * 10))]
+
+    def add(name: int, type_: int, flags: int, address: int, data: bytes,
+            size_: int, link: int = 0) -> None:
+        nonlocal body
+
+        offset = 52 + len(body)
+        body += data
+        headers.append(struct.pack('<IIIIIIIIII', name, type_, flags,
+                                   address, offset, size_, link, 0, 1,
+                                   16 if type_ == elf.SHT_SYMTAB else 0))
+
+    for (name, (_, type_, flags, address, size_)) in zip(section_names,
+                                                         _sections):
+        data = b'' if type_ == elf.SHT_NOBITS else b'\0' * size_
+        add(name, type_, flags, address, data, size_)
+
+    strtab_index = len(_sections) + 2
+
+    add(section_names[-3], elf.SHT_SYMTAB, 0, 0, symtab, len(symtab),
+        strtab_index)
+    add(section_names[-2], 3, 0, 0, strtab, len(strtab))
+    add(section_names[-1], 3, 0, 0, shstrtab, len(shstrtab))
+
+    shoff = 52 + len(body)
+
+    header = (b'\x7fELF\x01\x01\x01' + b'\0' * 9
+              + struct.pack('<HHIIIIIHHHHHH', 2, 83, 1, 0, 0, shoff, 0, 52,
+                            0, 0, 40, len(headers), len(headers) - 1))
+
+    return header + body + b''.join(headers)
+
+
+def test_parse() -> None:
+    parsed = elf.parse(_elf32())
+
+    assert [it.name for it in parsed.sections][1:4] == ['.text', '.data',
+                                                        '.bss']
+    assert {it.name for it in parsed.symbols} >= {'loop', 'displayBuffer'}
+
+
+def test_parse_host() -> None:
+    # The interpreter itself is a 64 bit ELF on Linux.
+
+    parsed = elf.read(Path(sys.executable).resolve())
+
+    assert any(it.name == '.text' for it in parsed.sections)
+
+
+def test_not_elf() -> None:
+    with pytest.raises(elf.ElfError):
+        elf.parse(b'#!/bin/sh\n')
+
+
+def test_malformed() -> None:
+    data = _elf32()
+
+    # e_shstrndx is the last field of the ELF32 header.
+    bad_names = data[:50] + struct.pack('<H', 200) + data[52:]
+
+    for it in (data[:4], data[:len(data) // 2], bad_names):
+        with pytest.raises(elf.ElfError):
+            elf.parse(it)
+
+
+def test_analyse(tmp_path: Path) -> None:
+    path = Path(tmp_path, 'Planer.ino.elf')
+    path.write_bytes(_elf32())
+
+    report = size.analyse(path, 'Planer/Planer.ino.elf')
+
+    assert report.flash == 1020
+    assert report.ram == 524
+    assert [it.name for it in report.symbols] == [
+        'displayBuffer', 'loop', 'setup', 'logConfig']
+    assert report.symbols[0].ram
+
+    assert size.check(report, 2048, 512) == [
+        'Planer/Planer.ino.elf: RAM usage of 524 bytes exceeds the budget'
+        ' of 512 bytes']
+    assert size.check(report, None, None) == []
+
+
+def test_history(tmp_path: Path) -> None:
+    path = Path(tmp_path, 'Planer.ino.elf')
+    path.write_bytes(_elf32())
+
+    report = size.analyse(path, 'Planer/Planer.ino.elf')
+
+    size.record(tmp_path, report)
+
+    previous = size.history(tmp_path, report.target)[-1]
+    report.ram += 8
+
+    assert size.summary(report, previous) == (
+        'Planer/Planer.ino.elf: flash 1020 bytes, RAM 532 (+8) bytes')
+
+    size.write(report, Path(tmp_path, 'Planer.ino.size.json'))
+
+    assert size.load(Path(tmp_path, 'Planer.ino.size.json')) == report
+
+
+def _record_many(top: str, target: str) -> None:
+    for _ in range(100):
+        size.record(top, size.Report(target))
+
+
+def test_history_concurrent(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """ Builders of several sketches or boards record at once. """
+
+    targets = [f'{it}/Planer/Planer.ino.elf' for it in range(4)]
+
+    with ProcessPoolExecutor(len(targets)) as executor:
+        for it in [executor.submit(_record_many, str(tmp_path), x)
+                   for x in targets]:
+            it.result()
+
+    for it in targets:
+        assert len(size.history(tmp_path, it)) == 100
+
+    monkeypatch.setattr(size, '_history_max', 50)
+
+    size.compact(tmp_path)
+
+    assert sum(len(size.history(tmp_path, it)) for it in targets) == 50
@@ -0,0 +1,93 @@
+from mk_build import Path
+
+from planer_build import stack
+
+# Excerpts of what avr-gcc writes for Planer.ino.cpp and a library.
+
+_sketch_su = '''\
+Planer.ino.cpp:10:6:void setup()\t12\tstatic
+Planer.ino.cpp:20:6:void loop()\t4\tstatic
+Planer.ino.cpp:30:13:void step(int)\t40\tstatic
+Planer.ino.cpp:40:1:void __vector_11()\t18\tstatic
+'''
+
+_sketch_expand = '''\
+;; Function setup (_Z5setupv, funcdef_no=0, decl_uid=1, cgraph_uid=1)
+(call_insn 5 4 0 2 (call (mem:HI (symbol_ref:HI ("_ZN5Motor4initEv")
+;; Function loop (_Z4loopv, funcdef_no=1, decl_uid=2, cgraph_uid=2)
+(call_insn 5 4 0 2 (call (mem:HI (symbol_ref:HI ("_ZL4stepi")
+(call_insn 6 5 0 2 (call (mem:HI (symbol_ref:HI ("_ZN5Motor4initEv")
+;; Function step (_ZL4stepi, funcdef_no=2, decl_uid=3, cgraph_uid=3)
+(call_insn 5 4 0 2 (call (mem:HI (symbol_ref:HI ("_ZL4stepi")
+;; Function __vector_11 (__vector_11, funcdef_no=3, decl_uid=4)
+(call_insn 5 4 0 2 (call (mem:HI (reg/f:HI 24 r24)
+'''
+
+_library_su = '''\
+Motor.cpp:5:6:void Motor::init()\t100\tdynamic,bounded
+'''
+
+_library_expand = '''\
+;; Function Motor::init (_ZN5Motor4initEv, funcdef_no=0, decl_uid=1)
+(call_insn 5 4 0 2 (call (mem:HI (symbol_ref:HI ("delay")
+'''
+
+
+def _build_path(top: Path) -> Path:
+    sketch = Path(top, 'sketch')
+    library = Path(top, 'libraries', 'Motor')
+
+    sketch.mkdir(parents=True)
+    library.mkdir(parents=True)
+
+    # Older GCC names the dump after the source, newer ones after the
+    # object as well.
+
+    Path(sketch, 'Planer.ino.cpp.su').write_text(_sketch_su)
+    Path(sketch, 'Planer.ino.cpp.229r.expand').write_text(_sketch_expand)
+    Path(library, 'Motor.cpp.su').write_text(_library_su)
+    Path(library, 'Motor.cpp.cpp.253r.expand').write_text(_library_expand)
+
+    return top
+
+
+def test_short_name() -> None:
+    assert stack.short_name('void Motor::step(int) const') == 'Motor::step'
+    assert stack.short_name('char* name()') == 'name'
+    assert stack.short_name('T max(T, T) [with T = int]') == 'max'
+    assert stack.short_name('loop') == 'loop'
+
+
+def test_analyse(tmp_path: Path) -> None:
+    functions = stack.collect(_build_path(tmp_path))
+
+    assert {it.name: it.frame for it in functions} == {
+        'setup': 12, 'loop': 4, 'step': 40, '__vector_11': 18,
+        'Motor::init': 100
+    }
+
+    report = stack.analyse(functions, 'Planer/Planer.ino.elf', 83,
+                           static_ram=500, ram=2048)
+
+    entries = {it.name: it for it in report.entries}
+
+    # Calls push a 2 byte return address on AVR.
+
+    assert entries['setup'].depth == 12 + 2 + 100
+    assert entries['setup'].path == ['setup', 'Motor::init']
+    assert entries['setup'].notes == ['unknown callee delay']
+
+    assert entries['loop'].depth == 4 + 2 + 100
+    assert 'recursion through step' in entries['loop'].notes
+
+    assert entries['__vector_11'].depth == 18 + 2
+    assert entries['__vector_11'].notes == [
+        'call through a pointer in __vector_11']
+
+    assert report.worst == 114 + 20
+    assert report.headroom == 2048 - 500 - 134
+    assert not report.bounded
+
+    stack.write(report, Path(tmp_path, 'Planer.ino.stack.json'))
+
+    assert stack.load(Path(tmp_path, 'Planer.ino.stack.json')) == report
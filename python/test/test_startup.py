@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+from mk_build import CompletedProcess, Path
+import pytest
+
+from planer_build import planer_cli, scripts
+
+# Their wall time is checked by the cli cases of the benchmarks.
+
+
+def test_complete(tmp_path: Path) -> None:
+    output = Path(tmp_path, 'completions')
+
+    line = 'scon bu'
+
+    subprocess.run(
+        [sys.executable, '-m', 'planer_build.planer_cli'],
+        env=os.environ | {
+            '_ARGCOMPLETE': '1',
+            '_ARGCOMPLETE_STDOUT_FILENAME': str(output),
+            'COMP_LINE': line,
+            'COMP_POINT': str(len(line))
+        },
+        check=True
+    )
+
+    assert 'build' in output.read_text()
+
+
+def test_help_imports() -> None:
+    """ --help must not load mk_build or parse any configuration. """
+
+    code = ('import sys\n'
+            'from planer_build.planer_cli import Parser\n'
+            'try:\n'
+            '    Parser().parse(["--help"])\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'print(" ".join(sys.modules))\n')
+
+    result = subprocess.run([sys.executable, '-c', code],
+                            capture_output=True, text=True, check=True)
+
+    modules = result.stdout.split()
+
+    assert 'mk_build' not in modules
+    assert 'tomlkit' not in modules
+
+
+def test_install_modes() -> None:
+    assert planer_cli.install_modes == scripts.modes
+
+
+def test_exit_code(monkeypatch: pytest.MonkeyPatch) -> None:
+    """ A command returning a failed process, such as a build exceeding a
+        size budget, exits with its code. """
+
+    monkeypatch.setattr(sys, 'argv', ['scon', 'size'])
+    monkeypatch.setattr(planer_cli, '_serve_request', lambda _: None)
+    monkeypatch.setattr(planer_cli.Parser, 'run',
+                        staticmethod(lambda _: CompletedProcess([], 3)))
+
+    with pytest.raises(SystemExit) as e:
+        planer_cli.main()
+
+    assert e.value.code == 3
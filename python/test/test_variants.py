@@ -0,0 +1,100 @@
+from mk_build import Path
+import pytest
+
+from planer_build import variants
+from planer_build.configure import Config
+from planer_build.error import FatalError
+
+from . import data_dir
+
+_matrix = '''
+[ssd1306]
+display = { controller = "SSD1306", buffer_mode = "Full" }
+
+[full4wire]
+motor = { driver = "full4wire", pins = [4, 5, 6, 7] }
+'''
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
+
+def test_load(tmp_path: Path) -> None:
+    path = Path(tmp_path, 'variants.toml')
+    path.write_text(_matrix)
+
+    matrix = variants.load(path)
+
+    assert list(matrix) == ['ssd1306', 'full4wire']
+    assert matrix['full4wire']['motor']['pins'] == [4, 5, 6, 7]
+
+
+def test_load_invalid(tmp_path: Path) -> None:
+    path = Path(tmp_path, 'variants.toml')
+    path.write_text('["a/b"]\narduino = { board = "uno" }\n')
+
+    with pytest.raises(FatalError) as e:
+        variants.load(path)
+
+    assert 'a/b: not a valid directory name' in str(e.value)
+    assert 'a/b.arduino: not one of' in str(e.value)
+
+
+def test_with_variant(tmp_path: Path) -> None:
+    config = Config.from_file(f'{data_dir}/config.toml')
+
+    variant = config.with_variant(
+        'ssd1306', {'display': {'controller': 'SSD1306'}})
+
+    assert variant.variant == 'ssd1306'
+    assert config.variant is None
+
+    toml = variant.toml().as_string()
+
+    assert 'controller = "SSD1306"  # "PCD8544" | "SSD1306"' in toml
+    assert 'variant = "ssd1306"' in toml
+
+    variant.write_config_h(f'{tmp_path}/config.h')
+
+    display = Path(tmp_path, 'config_display.h').read_text()
+
+    assert 'SSD1306' in display
+
+    with pytest.raises(FatalError):
+        config.with_variant('bad', {'motor': {'driver': 'servo'}})
+
+
+def test_configured(tmp_path: Path) -> None:
+    assert variants.configured(tmp_path) == {}
+
+    build = variants.directory(tmp_path, 'ssd1306')
+    variants.record(tmp_path, {'ssd1306': build})
+
+    assert variants.configured(tmp_path) == {'ssd1306': build}
+
+
+def test_remove_stale(tmp_path: Path) -> None:
+    kept = variants.directory(tmp_path, 'ssd1306')
+    dropped = variants.directory(tmp_path, 'full4wire')
+
+    for it in (kept, dropped):
+        Path(it, 'config.h').parent.mkdir(parents=True)
+        Path(it, 'config.h').touch()
+
+    variants.record(tmp_path, {'ssd1306': kept, 'full4wire': dropped})
+
+    assert variants.remove_stale(tmp_path, {'ssd1306': kept}) == [
+        'full4wire']
+
+    assert kept.is_dir()
+    assert not dropped.exists()
+
+
+def test_table() -> None:
+    table = variants.table([variants.Result('ssd1306', 0, 1.0),
+                            variants.Result('full4wire', 1, 2.0)])
+
+    assert 'ssd1306' in table
+    assert 'FAILED' in table
@@ -0,0 +1,138 @@
+import argparse
+import threading
+import time
+from typing import Optional
+
+from mk_build import CompletedProcess, Path
+import pytest
+
+from planer_build import watch
+from planer_build.cli import CLI
+from planer_build.configure import Config
+from planer_build.error import FatalError
+from planer_build.tools import arduino_cli
+
+from . import data_dir
+
+_targets = ['Planer/Planer.ino.elf', 'test/motor/motor.ino.elf']
+
+
+def test_affected(tmp_path: Path) -> None:
+    planer = Path(tmp_path, 'Planer', 'src', 'ui.cpp')
+    library = Path(tmp_path, 'libraries', 'motor', 'motor.h')
+
+    assert watch.affected({planer}, tmp_path, _targets) == [_targets[0]]
+    assert watch.affected({planer, library}, tmp_path, _targets) == _targets
+
+
+def test_ignored() -> None:
+    assert watch.ignored('.Planer.ino.swp')
+    assert watch.ignored('Planer.ino~')
+    assert not watch.ignored('Planer.ino')
+
+
+@pytest.mark.parametrize('cls', [watch.Inotify, watch.Poller])
+def test_changes(
+    tmp_path: Path,
+    cls: type[watch.Inotify] | type[watch.Poller]
+) -> None:
+    build = Path(tmp_path, 'build')
+    build.mkdir()
+    Path(tmp_path, 'Planer').mkdir()
+
+    watcher = cls([build])
+    watcher.add(tmp_path)
+
+    def edit() -> None:
+        time.sleep(0.1)
+
+        # A burst of saves, a new directory and a build output.
+
+        Path(tmp_path, 'Planer', 'Planer.ino').write_text('void loop() {}')
+        Path(tmp_path, 'Planer', 'src').mkdir()
+        Path(tmp_path, 'Planer', 'src', 'ui.cpp').write_text('')
+        Path(tmp_path, 'Planer', '.Planer.ino.swp').write_text('')
+        Path(build, 'Planer.ino.elf').write_text('')
+
+    thread = threading.Thread(target=edit)
+    thread.start()
+
+    try:
+        changed = next(watch.changes(watcher, delay=0.6))
+    finally:
+        thread.join()
+        watcher.close()
+
+    assert Path(tmp_path, 'Planer', 'Planer.ino') in changed
+    assert Path(tmp_path, 'Planer', 'src', 'ui.cpp') in changed
+    assert not any(it.name.endswith('.swp') for it in changed)
+    assert not any(it.is_relative_to(build) for it in changed)
+
+
+def test_upload_reloaded(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """ Uploads after a rebuild go to the port of the reloaded
+        config.toml. """
+
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+
+    path = Path(tmp_path, 'config.toml')
+    text = Path(data_dir, 'config.toml').read_text()
+    path.write_text(text)
+
+    cli = CLI(config=Config.from_file(str(path)))
+    cli.config.environment = {'arduino_cli': 'arduino-cli'}
+    cli.config_file.top_source_dir = tmp_path
+    cli.config_file.top_build_dir = tmp_path
+
+    uploads = []
+
+    def upload(
+        path: str,
+        port: Optional[str] = None,
+        board: Optional[str] = None
+    ) -> CompletedProcess[bytes]:
+        uploads.append((port, board))
+        return CompletedProcess([], 0)
+
+    monkeypatch.setattr(cli, '_build', lambda _: CompletedProcess([], 0))
+    monkeypatch.setattr(arduino_cli, 'upload', upload)
+
+    path.write_text(text.replace('/dev/ttyACM0', '/dev/ttyUSB1'))
+    cli._reload_config(path)
+
+    cli._watch_build(
+        argparse.Namespace(targets=[], upload='Planer/Planer.ino.elf'),
+        ['Planer/Planer.ino.elf']
+    )
+
+    assert uploads == [('/dev/ttyUSB1', 'arduino:renesas_uno:minima')]
+
+
+def test_build_failed(
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str]
+) -> None:
+    cli = CLI()
+
+    uploads = []
+
+    monkeypatch.setattr(cli, '_build', lambda _: CompletedProcess([], 1))
+    monkeypatch.setattr(arduino_cli, 'upload',
+                        lambda *args: uploads.append(args))
+
+    cli._watch_build(
+        argparse.Namespace(targets=[], upload='Planer/Planer.ino.elf'),
+        ['Planer/Planer.ino.elf']
+    )
+
+    assert uploads == []
+    assert 'Building 1 targets failed.' in capsys.readouterr().err
+
+
+def test_upload_without_watch() -> None:
+    with pytest.raises(FatalError):
+        CLI().build(argparse.Namespace(watch=False,
+                                       upload='Planer/Planer.ino.elf'))